@@ -0,0 +1,280 @@
+"""NumPy analytics over a whole day of `power_data`, one phase at a time.
+
+A day is loaded with one pivoted Flux query into `{phase: {"t": ..., field:
+...}}` float64 arrays (`t` in epoch seconds). The query is read as raw CSV
+and parsed a column at a time, without building a record per row. Every
+metric below is then a handful of vectorized passes over those arrays, so a
+full 86,400-sample day costs milliseconds instead of Python loops over
+records.
+"""
+
+import asyncio
+
+import numpy as np
+
+from config import settings
+from utils.database import run_csv_query
+from utils.timerange import day_bounds, day_range
+
+BUCKET = settings.influxdb_bucket
+
+DAY_FIELDS = (
+    "power_watt",
+    "power_factor",
+    "voltage_thd",
+    "current_thd",
+    "energy_kwh",
+)
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+DEMAND_INTERVAL = 900  # seconds; utilities bill max demand on 15-minute averages
+PF_BINS = (0.0, 0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+VOLTAGE_THD_LIMIT = 8.0  # %, IEEE 519 limit for buses up to 1 kV
+CURRENT_THD_LIMIT = 20.0  # %
+RESET_MIN_DROP_KWH = 0.01
+
+
+def day_query(target_date, device_id: str, fields=DAY_FIELDS) -> str:
+    field_filter = " or ".join(f'r._field == "{name}"' for name in fields)
+    return f"""
+    from(bucket: "{BUCKET}")
+      |> {day_range(target_date)}
+      |> filter(fn: (r) => r._measurement == "power_data")
+      |> filter(fn: (r) => r.device_id == "{device_id}")
+      |> filter(fn: (r) => {field_filter})
+      |> group(columns: ["phase"])
+      |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+      |> sort(columns: ["_time"])
+    """
+
+
+def _sections(rows):
+    """Split raw Flux CSV rows into `(header, body)` per table schema."""
+    header, body = None, []
+    for row in rows:
+        if row[1:3] == ["result", "table"]:
+            if body:
+                yield header, body
+            header, body = row, []
+        else:
+            body.append(row)
+    if body:
+        yield header, body
+
+
+def _floats(strings) -> np.ndarray:
+    try:
+        return np.fromiter(map(float, strings), float, len(strings))
+    except ValueError:  # empty cells, where a row lacks the field
+        return np.array([float(v) if v else np.nan for v in strings])
+
+
+def frame_from_csv(rows, fields=DAY_FIELDS) -> dict:
+    """`{phase: {"t": seconds, field: values}}` arrays from raw CSV rows.
+
+    Only the needed columns are pulled out of the rows. Missing values become
+    NaN; rows are sorted by time.
+    """
+    parts = {}
+    for header, body in _sections(rows):
+        if "phase" not in header:
+            continue
+        column = {name: i for i, name in enumerate(header)}
+        # RFC 3339 in UTC; NumPy wants the trailing "Z" gone.
+        i = column["_time"]
+        stamps = np.array([row[i][:-1] for row in body], dtype="datetime64[ns]")
+        section = {"t": stamps.astype(np.int64) / 1e9}
+        for name in fields:
+            if name in column:
+                i = column[name]
+                section[name] = _floats([row[i] for row in body])
+            else:
+                section[name] = np.full(len(body), np.nan)
+        i = column["phase"]
+        phases = np.array([row[i] for row in body])
+        for phase in np.unique(phases):
+            if phase:
+                rows_of = phases == phase
+                parts.setdefault(str(phase), []).append(
+                    {name: values[rows_of] for name, values in section.items()}
+                )
+    frame = {}
+    for phase, pieces in parts.items():
+        t = np.concatenate([piece["t"] for piece in pieces])
+        order = np.argsort(t, kind="stable")
+        frame[phase] = {
+            name: np.concatenate([piece[name] for piece in pieces])[order]
+            for name in ("t", *fields)
+        }
+    return frame
+
+
+async def load_day(target_date, device_id: str, fields=DAY_FIELDS) -> dict:
+    """Fetch one day as arrays; CSV parsing runs off the event loop."""
+    rows = await run_csv_query(day_query(target_date, device_id, fields))
+    return await asyncio.to_thread(frame_from_csv, rows, fields)
+
+
+def sample_step(t: np.ndarray) -> float:
+    """Typical sampling interval in seconds (1 when it cannot be told)."""
+    if len(t) < 2:
+        return 1.0
+    return float(np.median(np.diff(t))) or 1.0
+
+
+def sample_durations(t: np.ndarray) -> np.ndarray:
+    """Seconds each sample stands for: the gap to the next one.
+
+    Gaps longer than ten typical intervals are outages and count as one
+    interval; the last sample also gets one interval.
+    """
+    if len(t) < 2:
+        return np.ones(len(t))
+    gaps = np.diff(t)
+    step = sample_step(t)
+    gaps = np.where(gaps > 10 * step, step, gaps)
+    return np.append(gaps, step)
+
+
+def _finite(*columns):
+    mask = np.isfinite(columns[0])
+    for column in columns[1:]:
+        mask &= np.isfinite(column)
+    return mask
+
+
+def load_profile(t, watt, day_start: float, interval: int = DEMAND_INTERVAL) -> dict:
+    """Power percentiles, max demand over clock-aligned intervals and load factor.
+
+    Load factor is average power over max demand: 1.0 for a flat load, small
+    for short peaks.
+    """
+    mask = _finite(watt)
+    t, watt = t[mask], watt[mask]
+    if not len(watt):
+        return {}
+    bins = ((t - day_start) // interval).astype(np.int64)
+    first = bins.min()
+    sums = np.bincount(bins - first, weights=watt)
+    counts = np.bincount(bins - first)
+    filled = np.flatnonzero(counts)
+    demand = sums[filled] / counts[filled]
+    peak = int(np.argmax(demand))
+    peak_start = day_start + (filled[peak] + first) * interval
+    average = float(watt.mean())
+    max_demand = float(demand[peak])
+    percentiles = np.percentile(watt, PERCENTILES)
+    return {
+        "samples": int(len(watt)),
+        "avg_power_watt": average,
+        "min_power_watt": float(watt.min()),
+        "max_power_watt": float(watt.max()),
+        "percentiles_watt": {
+            f"p{q}": float(v) for q, v in zip(PERCENTILES, percentiles)
+        },
+        "max_demand_watt": max_demand,
+        "max_demand_start": float(peak_start),
+        "demand_interval_s": interval,
+        "load_factor": average / max_demand if max_demand > 0 else None,
+    }
+
+
+def thd_exceedance(t, thd, limit: float) -> dict:
+    """Time spent above a THD limit, in seconds and as a share of covered time."""
+    mask = _finite(thd)
+    durations = sample_durations(t[mask])
+    above = thd[mask] > limit
+    covered = float(durations.sum())
+    seconds = float(durations[above].sum())
+    return {
+        "limit_pct": limit,
+        "seconds_above": seconds,
+        "share_above": seconds / covered if covered else None,
+        "max_pct": float(thd[mask].max()) if mask.any() else None,
+        "p95_pct": float(np.percentile(thd[mask], 95)) if mask.any() else None,
+    }
+
+
+def power_factor_histogram(t, pf, bins=PF_BINS) -> dict:
+    """Seconds and share of the day spent in each power-factor band."""
+    mask = _finite(pf)
+    values = np.clip(np.abs(pf[mask]), 0.0, 1.0)
+    durations = sample_durations(t[mask])
+    seconds, edges = np.histogram(values, bins=bins, weights=durations)
+    total = float(durations.sum())
+    return {
+        "edges": [float(e) for e in edges],
+        "seconds": [float(s) for s in seconds],
+        "share": [float(s) / total if total else 0.0 for s in seconds],
+        "avg_power_factor": float(values.mean()) if len(values) else None,
+    }
+
+
+def energy_consumption(t, energy_kwh, watt=None) -> dict:
+    """kWh consumed as the `energy_kwh` counter delta, across counter resets.
+
+    A clear drop in the counter is a reset (RPi restart, meter rollover): the
+    reading after it counts from zero, so it is added as is. Every other step
+    is summed with its sign, so jitter up and down cancels out instead of
+    adding up. When `watt` is given, the integral of power is reported
+    alongside as a cross-check.
+    """
+    mask = _finite(energy_kwh)
+    counter = energy_kwh[mask]
+    if len(counter) < 2:
+        return {}
+    steps = np.diff(counter)
+    # Small dips are rounding or sensor jitter, not a restart from zero.
+    resets = steps < -(RESET_MIN_DROP_KWH + 0.005 * counter[:-1])
+    consumed = float(steps[~resets].sum() + counter[1:][resets].sum())
+    result = {
+        "consumed_kwh": consumed,
+        "counter_start_kwh": float(counter[0]),
+        "counter_end_kwh": float(counter[-1]),
+        "resets": int(resets.sum()),
+    }
+    if watt is not None:
+        ok = _finite(watt)
+        result["integrated_kwh"] = float(
+            np.sum(watt[ok] * sample_durations(t[ok])) / 3.6e6
+        )
+    return result
+
+
+def power_quality(
+    t,
+    voltage_thd,
+    current_thd,
+    power_factor,
+    voltage_thd_limit: float = VOLTAGE_THD_LIMIT,
+    current_thd_limit: float = CURRENT_THD_LIMIT,
+) -> dict:
+    return {
+        "voltage_thd": thd_exceedance(t, voltage_thd, voltage_thd_limit),
+        "current_thd": thd_exceedance(t, current_thd, current_thd_limit),
+        "power_factor": power_factor_histogram(t, power_factor),
+    }
+
+
+def day_report(frame: dict, target_date, kind: str, **limits) -> dict:
+    """`{phase: report}` for a loaded day; `kind` is one of `REPORTS`."""
+    day_start = day_bounds(target_date)[0].timestamp()
+    report = {}
+    for phase, c in sorted(frame.items()):
+        if kind == "load-profile":
+            report[phase] = load_profile(c["t"], c["power_watt"], day_start)
+        elif kind == "power-quality":
+            report[phase] = power_quality(
+                c["t"],
+                c["voltage_thd"],
+                c["current_thd"],
+                c["power_factor"],
+                **limits,
+            )
+        else:
+            report[phase] = energy_consumption(
+                c["t"], c["energy_kwh"], c["power_watt"]
+            )
+    return report
+
+
+REPORTS = ("load-profile", "power-quality", "consumption")
@@ -1,47 +1,32 @@
 """Module containing helper functions for analytics."""
 
-from datetime import datetime, date, timedelta
-from zoneinfo import ZoneInfo  # Python 3.9+
+from datetime import datetime, date
 from fastapi import HTTPException
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client import Point, WritePrecision
 from config import settings
+from utils.columnar import columns_of, new_columns
+from utils.database import run_query, run_write
 from utils.sprint import Logger
-
-# Timezone
-INDIA_TZ = ZoneInfo("Asia/Kolkata")
+from utils.timerange import INDIA_TZ, day_range
 
 BUCKET = settings.influxdb_bucket
 ORG = settings.influxdb_org
-TOKEN = settings.influxdb_token
-URL = settings.influxdb_url
-
-client = InfluxDBClient(url=URL, token=TOKEN)
-write_api = client.write_api()
-query_api = client.query_api()
 
 l = Logger.get_instance(debug=True)
 
 
-def get_day_bounds(target_date: date):
-    """Return start and end datetime objects for a given date (in Asia/Kolkata)."""
-    start = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=INDIA_TZ)
-    end = start + timedelta(days=1)
-    return start.astimezone(ZoneInfo("UTC")), end.astimezone(
-        ZoneInfo("UTC")
-    )  # convert for InfluxDB
-
-
-def generate_power_analytics(target_date: date, phase: str, device_id: str):
-    """Generate analytics for power data on the target date."""
-    start, end = get_day_bounds(target_date)
+async def generate_power_analytics(
+    target_date: date, phase: str, device_id: str, store: bool = True
+):
+    """Generate analytics for power data on the target date (stored unless `store` is False)."""
     query = f'''
         from(bucket: "{BUCKET}")
-          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> {day_range(target_date)}
           |> filter(fn: (r) => r["_measurement"] == "power_data")
           |> filter(fn: (r) => r["phase"] == "{phase}" and r["device_id"] == "{device_id}")
           |> filter(fn: (r) => r["_field"] == "power_watt")
     '''
-    result = query_api.query(org=ORG, query=query)
+    result = await run_query(query)
     values = [record.get_value() for table in result for record in table.records]
 
     if not values:
@@ -62,7 +47,8 @@ def generate_power_analytics(target_date: date, phase: str, device_id: str):
         .field("min_power_watt", float(min_power))
         .time(datetime.now(INDIA_TZ), WritePrecision.NS)
     )
-    write_api.write(bucket=BUCKET, org=ORG, record=point)
+    if store:
+        await run_write(point)
     return {
         "avg_power_watt": avg_power,
         "max_power_watt": max_power,
@@ -70,44 +56,44 @@ def generate_power_analytics(target_date: date, phase: str, device_id: str):
     }
 
 
-def fetch_stored_power_analytics(target_date: date, phase: str, device_id: str):
+async def fetch_stored_power_analytics(target_date: date, phase: str, device_id: str):
     """Fetch stored power analytics for a given date from InfluxDB."""
-    start, end = get_day_bounds(target_date)
     query = f'''
         from(bucket: "{BUCKET}")
-          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> {day_range(target_date)}
           |> filter(fn: (r) => r["_measurement"] == "power_analytics")
           |> filter(fn: (r) => r["phase"] == "{phase}" and r["device_id"] == "{device_id}")
     '''
-    result = query_api.query(org=ORG, query=query)
+    result = await run_query(query)
     analytics = {
         record.get_field(): record.get_value()
         for table in result
         for record in table.records
     }
     if not analytics:
-        analytics = generate_power_analytics(target_date, phase, device_id)
+        analytics = await generate_power_analytics(target_date, phase, device_id)
         raise HTTPException(
             status_code=404, detail="No stored power analytics found for this date."
         )
     return analytics
 
 
-def generate_energy_analytics(target_date: date, phase: str, device_id: str):
-    """Generate analytics for energy data on the target date."""
-    start, end = get_day_bounds(target_date)
+async def generate_energy_analytics(
+    target_date: date, phase: str, device_id: str, store: bool = True
+):
+    """Generate analytics for energy data on the target date (stored unless `store` is False)."""
     query = f'''
         from(bucket: "{BUCKET}")
-          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> {day_range(target_date)}
           |> filter(fn: (r) => r["_measurement"] == "power_data")
           |> filter(fn: (r) => r["phase"] == "{phase}" and r["device_id"] == "{device_id}")
           |> filter(fn: (r) => r["_field"] == "energy_kwh")
     '''
-    result = query_api.query(org=ORG, query=query)
+    result = await run_query(query)
     values = [record.get_value() for table in result for record in table.records]
 
     if not values:
-        l.dprint("No energy data found for this date: ", start, end, phase, device_id)
+        l.dprint("No energy data found for", target_date, phase, device_id)
         raise HTTPException(
             status_code=404, detail="No energy data found for this date."
         )
@@ -125,7 +111,8 @@ def generate_energy_analytics(target_date: date, phase: str, device_id: str):
         .field("min_energy_kwh", float(min_energy))
         .time(datetime.now(INDIA_TZ), WritePrecision.NS)
     )
-    write_api.write(bucket=BUCKET, org=ORG, record=point)
+    if store:
+        await run_write(point)
     return {
         "avg_energy_kwh": avg_energy,
         "max_energy_kwh": max_energy,
@@ -133,48 +120,55 @@ def generate_energy_analytics(target_date: date, phase: str, device_id: str):
     }
 
 
-def fetch_stored_energy_analytics(target_date: date, phase: str, device_id: str):
+async def fetch_stored_energy_analytics(target_date: date, phase: str, device_id: str):
     """Fetch stored energy analytics for a given date from InfluxDB."""
-    start, end = get_day_bounds(target_date)
     query = f'''
         from(bucket: "{BUCKET}")
-          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> {day_range(target_date)}
           |> filter(fn: (r) => r["_measurement"] == "energy_analytics")
           |> filter(fn: (r) => r["phase"] == "{phase}" and r["device_id"] == "{device_id}")
     '''
-    result = query_api.query(org=ORG, query=query)
+    result = await run_query(query)
     analytics = {
         record.get_field(): record.get_value()
         for table in result
         for record in table.records
     }
     if not analytics:
-        analytics = generate_energy_analytics(target_date, phase, device_id)
+        analytics = await generate_energy_analytics(target_date, phase, device_id)
         l.dprint("No points found for this date. Generating new analytics...")
 
     return analytics
 
 
-def fetch_power_data(target_date: date, phase: str, device_id: str):
+async def fetch_power_data(
+    target_date: date, phase: str, device_id: str, columnar: bool = False
+):
     """Fetch power data for a given date from InfluxDB."""
-
-    start, end = get_day_bounds(target_date)
-
     query = f"""
     from(bucket: "{BUCKET}")
-      |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+      |> {day_range(target_date)}
       |> filter(fn: (r) => r["_measurement"] == "power_data")
       |> filter(fn: (r) => r.device_id == "{device_id}" and r.phase == "{phase}")
+      |> filter(fn: (r) => r._field == "power_watt")
       |> group(columns: ["phase"])  
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")  
       |> keep(columns: ["_time", "phase", "power_watt"])  // Keep only relevant fields
     """
 
     try:
-        tables = query_api.query(query, org=ORG)
+        tables = await run_query(query)
     except Exception as e:
-        l.dprint(f"Error fetching data: {e}")
+        l.dprint("Error fetching data:", e)
         return {}
+
+    if columnar:
+        columns = columns_of(tables, ("power_watt",))
+        if not columns["t"]:
+            l.dprint("No power data found for this date.")
+            return {}
+        return columns
+
     power_data = []
     for table in tables:
         for record in table.records:
@@ -194,26 +188,34 @@ def fetch_power_data(target_date: date, phase: str, device_id: str):
     return power_data
 
 
-def fetch_energy_data(target_date: date, phase: str, device_id: str):
-    """Fetch power data for a given date from InfluxDB."""
-
-    start, end = get_day_bounds(target_date)
-
+async def fetch_energy_data(
+    target_date: date, phase: str, device_id: str, columnar: bool = False
+):
+    """Fetch energy data for a given date from InfluxDB."""
     query = f"""
     from(bucket: "{BUCKET}")
-      |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+      |> {day_range(target_date)}
       |> filter(fn: (r) => r["_measurement"] == "power_data")
       |> filter(fn: (r) => r.device_id == "{device_id}" and r.phase == "{phase}")
+      |> filter(fn: (r) => r._field == "energy_kwh")
       |> group(columns: ["phase"])  
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")  
       |> keep(columns: ["_time", "phase", "energy_kwh"])  // Keep only relevant fields
     """
 
     try:
-        tables = query_api.query(query, org=ORG)
+        tables = await run_query(query)
     except Exception as e:
-        l.dprint(f"Error fetching data: {e}")
+        l.dprint("Error fetching data:", e)
         return {}
+
+    if columnar:
+        columns = columns_of(tables, ("energy_kwh",))
+        if not columns["t"]:
+            l.dprint("No energy data found for this date.")
+            return {}
+        return columns
+
     energy_data = []
     for table in tables:
         for record in table.records:
@@ -231,3 +233,65 @@ def fetch_energy_data(target_date: date, phase: str, device_id: str):
         l.dprint("No energy data found for this date.")
 
     return energy_data
+
+
+SUMMARY_FIELDS = {"power_watt": "power", "energy_kwh": "energy"}
+SUMMARY_STATS = {"mean": "avg", "min": "min", "max": "max"}
+
+
+async def fetch_day_summary(
+    target_date: date, device_id: str, window: str, columnar: bool = False
+):
+    """Stats and downsampled series of power and energy for every phase, in one query.
+
+    mean/min/max and the `window` aggregation all run inside Flux; each is a
+    separate `yield` of the same filtered stream. Returns
+    `{phase: {"power_analytics": {...}, "power_data": ..., "energy_analytics": ..., ...}}`.
+    """
+    query = f"""
+    data = from(bucket: "{BUCKET}")
+      |> {day_range(target_date)}
+      |> filter(fn: (r) => r["_measurement"] == "power_data")
+      |> filter(fn: (r) => r.device_id == "{device_id}")
+      |> filter(fn: (r) => r._field == "power_watt" or r._field == "energy_kwh")
+
+    data |> mean() |> yield(name: "mean")
+    data |> min() |> yield(name: "min")
+    data |> max() |> yield(name: "max")
+    data {window} |> yield(name: "series")
+    """
+    tables = await run_query(query)
+
+    summary = {}
+    for table in tables:
+        for record in table.records:
+            phase = record.values.get("phase")
+            field = record.get_field()
+            kind = SUMMARY_FIELDS.get(field)
+            if not phase or kind is None:
+                continue
+            entry = summary.get(phase)
+            if entry is None:
+                entry = summary[phase] = {}
+                for name in SUMMARY_FIELDS.values():
+                    entry[f"{name}_analytics"] = {}
+                    entry[f"{name}_data"] = {} if columnar else []
+            result = record.values.get("result")
+            if result in SUMMARY_STATS:
+                stat = f"{SUMMARY_STATS[result]}_{field}"
+                entry[f"{kind}_analytics"][stat] = record.get_value()
+            elif result == "series":
+                series = entry[f"{kind}_data"]
+                if columnar:
+                    if not series:
+                        series.update(new_columns((field,)))
+                    series["t"].append(int(record.get_time().timestamp() * 1000))
+                    series[field].append(record.get_value())
+                else:
+                    series.append(
+                        {
+                            "timestamp": record.get_time().isoformat(),
+                            field: record.get_value(),
+                        }
+                    )
+    return summary
@@ -1,6 +1,8 @@
+import asyncio
 from datetime import datetime
-from zoneinfo import ZoneInfo  # For Python 3.9+
-from fastapi import APIRouter, HTTPException, Query
+from functools import partial
+from fastapi import APIRouter, Depends, HTTPException, Query
+import orjson
 from analytics.helpers import (
     generate_power_analytics,
     fetch_stored_power_analytics,
@@ -8,27 +10,85 @@ from analytics.helpers import (
     fetch_stored_energy_analytics,
     fetch_energy_data,
     fetch_power_data,
+    fetch_day_summary,
 )
+from analytics.engine import (
+    CURRENT_THD_LIMIT,
+    VOLTAGE_THD_LIMIT,
+    day_report,
+    load_day,
+)
+from analytics.running import daily_stats
+from analytics.three_phase import load_history
+from api.dependencies import token_device, token_devices
+from utils.day_cache import day_cache, json_object, json_response
+from utils.downsample import MAX_POINTS, aggregate_window, window_seconds
 from utils.sprint import Logger
+from utils.timerange import INDIA_TZ, day_number
 
 l = Logger.get_instance(True)
 
 analysis_router = APIRouter()
 
-# Default device and phase values
-DEFAULT_DEVICE_ID = "random12"
+# Default phase; the device defaults to the token's (see `api.dependencies`)
 DEFAULT_PHASE = "R"
 
-# Define the target timezone
-INDIA_TZ = ZoneInfo("Asia/Kolkata")
+MAX_SUMMARY_DEVICES = 20
+
+FORMAT_HELP = "json (one object per row) or columnar (epoch-ms `t` plus value arrays)"
+
+
+async def today_analytics(kind: str, generate, target_date, phase: str, device_id: str):
+    """Today's analytics from the running statistics, or computed without storing."""
+    day = day_number(target_date)
+    if daily_stats.is_complete(day):
+        stats = daily_stats.get(device_id, phase, day)
+        analytics = getattr(stats, kind)() if stats else {}
+        if not analytics:
+            raise HTTPException(
+                status_code=404, detail=f"No {kind} data found for this date."
+            )
+        return analytics
+    # Started today without a successful warm-up: the accumulator is partial.
+    return await generate(target_date, phase, device_id, store=False)
+
+
+async def past_analytics(kind: str, fetch, target_date, phase: str, device_id: str):
+    """A past day's stored analytics, cached once the running statistics let go.
+
+    Just after IST midnight yesterday's totals may not be persisted yet (that
+    waits for the next `ANALYTICS_PERSIST_INTERVAL` tick), so while
+    `daily_stats` still holds the day it answers and nothing is cached.
+    """
+    day = day_number(target_date)
+    stats = daily_stats.get(device_id, phase, day)
+    if stats is None:
+        return await day_cache.cached(
+            f"{kind}-analytics",
+            device_id,
+            phase,
+            target_date,
+            (),
+            partial(fetch, target_date, phase, device_id),
+        )
+    if daily_stats.is_complete(day):
+        analytics = getattr(stats, kind)()
+    else:
+        analytics = await fetch(target_date, phase, device_id)
+    return orjson.dumps(analytics) if analytics else None
 
 
 @analysis_router.get("/power")
 async def get_power_analytics(
     date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
     phase: str = Query(DEFAULT_PHASE, description="Phase identifier"),
-    device_id: str = Query(DEFAULT_DEVICE_ID, description="Device ID"),
+    device_id: str = Depends(token_device),
+    format: str = Query("json", description=FORMAT_HELP),
 ):
+    if format not in ("json", "columnar"):
+        raise HTTPException(
+            status_code=400, detail="format must be 'json' or 'columnar'."
+        )
     try:
         target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
@@ -39,34 +99,51 @@ async def get_power_analytics(
     # Get the current date in Asia/Kolkata timezone
     current_date = datetime.now(INDIA_TZ).date()
 
-    l.dprint(f"Current date: {current_date}, target date: {target_date}")
+    l.dprint("Current date:", current_date, "target date:", target_date)
 
     if target_date == current_date:
         l.dprint("Analytics data accessed for today")
-        analytics_data = generate_power_analytics(target_date, phase, device_id)
+        analytics_data = orjson.dumps(
+            await today_analytics(
+                "power", generate_power_analytics, target_date, phase, device_id
+            )
+        )
     else:
-        analytics_data = fetch_stored_power_analytics(target_date, phase, device_id)
-
-    power_data = fetch_power_data(target_date, phase, device_id)
+        analytics_data = await past_analytics(
+            "power", fetch_stored_power_analytics, target_date, phase, device_id
+        )
 
-    data = {
-        "analytics_data": analytics_data,
-        "power_data": power_data,
-    }
+    power_data = await day_cache.cached(
+        "power-data",
+        device_id,
+        phase,
+        target_date,
+        (format,),
+        partial(
+            fetch_power_data, target_date, phase, device_id, format == "columnar"
+        ),
+    )
 
     if not power_data:
         raise HTTPException(
             status_code=404, detail="No power data found for this date."
         )
-    return data
+    return json_response(
+        json_object({"analytics_data": analytics_data, "power_data": power_data})
+    )
 
 
 @analysis_router.get("/energy")
 async def get_energy_analytics(
     date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
     phase: str = Query(DEFAULT_PHASE, description="Phase identifier"),
-    device_id: str = Query(DEFAULT_DEVICE_ID, description="Device ID"),
+    device_id: str = Depends(token_device),
+    format: str = Query("json", description=FORMAT_HELP),
 ):
+    if format not in ("json", "columnar"):
+        raise HTTPException(
+            status_code=400, detail="format must be 'json' or 'columnar'."
+        )
     try:
         target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
@@ -78,14 +155,185 @@ async def get_energy_analytics(
     current_date = datetime.now(INDIA_TZ).date()
 
     if target_date == current_date:
-        analytics_data = generate_energy_analytics(target_date, phase, device_id)
+        analytics_data = orjson.dumps(
+            await today_analytics(
+                "energy", generate_energy_analytics, target_date, phase, device_id
+            )
+        )
     else:
-        analytics_data = fetch_stored_energy_analytics(target_date, phase, device_id)
+        analytics_data = await past_analytics(
+            "energy", fetch_stored_energy_analytics, target_date, phase, device_id
+        )
+
+    energy_data = await day_cache.cached(
+        "energy-data",
+        device_id,
+        phase,
+        target_date,
+        (format,),
+        partial(
+            fetch_energy_data, target_date, phase, device_id, format == "columnar"
+        ),
+    )
+
+    empty = b"{}" if format == "columnar" else b"[]"
+    return json_response(
+        json_object(
+            {"analytics_data": analytics_data, "energy_data": energy_data or empty}
+        )
+    )
+
+
+@analysis_router.get("/summary")
+async def get_summary(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    device_ids: list = Depends(token_devices),
+    points: int = Query(
+        288, ge=3, le=MAX_POINTS, description="Approximate points per series"
+    ),
+    format: str = Query("json", description=FORMAT_HELP),
+):
+    """Power and energy stats plus downsampled series for all phases.
+
+    One Flux query per device; several devices are queried concurrently.
+    Devices without data for the date map to `null`.
+    """
+    if format not in ("json", "columnar"):
+        raise HTTPException(
+            status_code=400, detail="format must be 'json' or 'columnar'."
+        )
+    if len(device_ids) > MAX_SUMMARY_DEVICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_SUMMARY_DEVICES} devices per request.",
+        )
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="Invalid date format. Use YYYY-MM-DD."
+        )
+
+    window = aggregate_window(window_seconds(86400, points))
+    columnar = format == "columnar"
+    summaries = await asyncio.gather(
+        *(
+            day_cache.cached(
+                "summary",
+                device_id,
+                "*",
+                target_date,
+                (points, format),
+                partial(fetch_day_summary, target_date, device_id, window, columnar),
+            )
+            for device_id in device_ids
+        )
+    )
+    devices = json_object(dict(zip(device_ids, summaries)))
+    return json_response(
+        json_object({"date": orjson.dumps(date_str), "devices": devices})
+    )
 
-    energy_data = fetch_energy_data(target_date, phase, device_id)
 
-    data = {
-        "analytics_data": analytics_data,
-        "energy_data": energy_data,
-    }
-    return data
+async def engine_report(kind: str, date_str: str, device_id: str, **limits):
+    """One `analytics.engine` report for all phases of a day, cached once past."""
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="Invalid date format. Use YYYY-MM-DD."
+        )
+
+    async def load():
+        frame = await load_day(target_date, device_id)
+        return day_report(frame, target_date, kind, **limits) if frame else {}
+
+    report = await day_cache.cached(
+        kind, device_id, "*", target_date, tuple(sorted(limits.items())), load
+    )
+    if report is None:
+        raise HTTPException(
+            status_code=404, detail="No power data found for this date."
+        )
+    return json_response(
+        json_object(
+            {
+                "date": orjson.dumps(date_str),
+                "device_id": orjson.dumps(device_id),
+                "phases": report,
+            }
+        )
+    )
+
+
+@analysis_router.get("/load-profile")
+async def get_load_profile(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    device_id: str = Depends(token_device),
+):
+    """Power percentiles, 15-minute max demand and load factor per phase."""
+    return await engine_report("load-profile", date_str, device_id)
+
+
+@analysis_router.get("/power-quality")
+async def get_power_quality(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    device_id: str = Depends(token_device),
+    voltage_thd_limit: float = Query(VOLTAGE_THD_LIMIT, gt=0, description="%"),
+    current_thd_limit: float = Query(CURRENT_THD_LIMIT, gt=0, description="%"),
+):
+    """Time above the THD limits and the power-factor histogram per phase."""
+    return await engine_report(
+        "power-quality",
+        date_str,
+        device_id,
+        voltage_thd_limit=voltage_thd_limit,
+        current_thd_limit=current_thd_limit,
+    )
+
+
+@analysis_router.get("/consumption")
+async def get_consumption(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    device_id: str = Depends(token_device),
+):
+    """kWh consumed per phase from the reset-aware `energy_kwh` counter."""
+    return await engine_report("consumption", date_str, device_id)
+
+
+@analysis_router.get("/three-phase")
+async def get_three_phase(
+    date_str: str = Query(..., description="Date in YYYY-MM-DD format"),
+    device_id: str = Depends(token_device),
+    points: int = Query(
+        288, ge=3, le=MAX_POINTS, description="Approximate points in the series"
+    ),
+):
+    """System totals, unbalance and neutral current from all three phases.
+
+    Day statistics plus a mean series of `points` windows (`t` in epoch ms).
+    """
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="Invalid date format. Use YYYY-MM-DD."
+        )
+    window = window_seconds(86400, points)
+    report = await day_cache.cached(
+        "three-phase",
+        device_id,
+        "*",
+        target_date,
+        (points,),
+        partial(load_history, target_date, device_id, window),
+    )
+    if report is None:
+        raise HTTPException(
+            status_code=404, detail="No three-phase data found for this date."
+        )
+    head = json_object(
+        {"date": orjson.dumps(date_str), "device_id": orjson.dumps(device_id)}
+    )
+    # `report` is a non-empty object: splice its members in after the head's.
+    return json_response(head[:-1] + b"," + report[1:])
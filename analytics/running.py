@@ -0,0 +1,222 @@
+"""Incremental per-day power/energy statistics fed by the ingestion path."""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client import Point, WritePrecision
+
+from config import settings
+from utils.database import run_query, run_write
+from utils.line_protocol import POWER_FIELDS
+from utils.sprint import Logger
+from utils.timerange import day_bounds, day_date, day_range, today_number
+
+l = Logger.get_instance(True)
+
+BUCKET = settings.influxdb_bucket
+
+POWER_INDEX = POWER_FIELDS.index("power_watt")
+ENERGY_INDEX = POWER_FIELDS.index("energy_kwh")
+
+
+class DayStats:
+    """Count/sum/min/max of `power_watt` and `energy_kwh` for one day."""
+
+    __slots__ = (
+        "power_count",
+        "power_sum",
+        "power_min",
+        "power_max",
+        "energy_count",
+        "energy_sum",
+        "energy_min",
+        "energy_max",
+        "dirty",
+    )
+
+    def __init__(self):
+        self.power_count = self.energy_count = 0
+        self.power_sum = self.energy_sum = 0.0
+        self.power_min = self.energy_min = float("inf")
+        self.power_max = self.energy_max = float("-inf")
+        self.dirty = False
+
+    def add(self, power: float, energy: float):
+        self.power_count += 1
+        self.power_sum += power
+        if power < self.power_min:
+            self.power_min = power
+        if power > self.power_max:
+            self.power_max = power
+        self.energy_count += 1
+        self.energy_sum += energy
+        if energy < self.energy_min:
+            self.energy_min = energy
+        if energy > self.energy_max:
+            self.energy_max = energy
+
+    def merge(self, other: "DayStats"):
+        self.power_count += other.power_count
+        self.power_sum += other.power_sum
+        self.power_min = min(self.power_min, other.power_min)
+        self.power_max = max(self.power_max, other.power_max)
+        self.energy_count += other.energy_count
+        self.energy_sum += other.energy_sum
+        self.energy_min = min(self.energy_min, other.energy_min)
+        self.energy_max = max(self.energy_max, other.energy_max)
+        self.dirty = True
+
+    def state(self) -> list:
+        """The statistics as a JSON-able list, for other workers."""
+        return [getattr(self, name) for name in self.__slots__[:-1]]
+
+    @classmethod
+    def from_state(cls, state: list) -> "DayStats":
+        stats = cls()
+        for name, value in zip(cls.__slots__[:-1], state):
+            setattr(stats, name, value)
+        return stats
+
+    def power(self) -> dict:
+        if not self.power_count:
+            return {}
+        return {
+            "avg_power_watt": self.power_sum / self.power_count,
+            "max_power_watt": self.power_max,
+            "min_power_watt": self.power_min,
+        }
+
+    def energy(self) -> dict:
+        if not self.energy_count:
+            return {}
+        return {
+            "avg_energy_kwh": self.energy_sum / self.energy_count,
+            "max_energy_kwh": self.energy_max,
+            "min_energy_kwh": self.energy_min,
+        }
+
+
+class DailyAccumulator:
+    """Today's running statistics per (device, phase), kept in memory.
+
+    Ingestion merges per-batch `DayStats` for the current IST day; samples for
+    older days (backfill) are ignored here, since only the day in progress is
+    served from memory. The statistics for a day are only complete if they
+    cover everything in InfluxDB: that is true from the day after start-up, or
+    from start-up itself once `warm()` has loaded today's totals.
+    """
+
+    def __init__(self):
+        self._stats = {}  # (device_id, phase, day) -> DayStats
+        self._complete_from = today_number() + 1
+
+    def is_complete(self, day: int) -> bool:
+        return day >= self._complete_from
+
+    def merge(self, device_id: str, days: dict):
+        """Merge `{(phase, day): DayStats}` from one ingested batch."""
+        today = today_number()
+        for (phase, day), stats in days.items():
+            if day != today:
+                continue
+            key = (device_id, phase, day)
+            current = self._stats.get(key)
+            if current is None:
+                current = self._stats[key] = DayStats()
+            current.merge(stats)
+
+    def get(self, device_id: str, phase: str, day: int):
+        """Statistics for today, or yesterday until it is pruned after persisting."""
+        return self._stats.get((device_id, phase, day))
+
+    async def warm(self):
+        """Load today's totals from InfluxDB; call before ingestion starts."""
+        today = today_number()
+        base = f"""
+        from(bucket: "{BUCKET}")
+          |> {day_range(day_date(today))}
+          |> filter(fn: (r) => r._measurement == "power_data")
+          |> filter(fn: (r) => r._field == "power_watt" or r._field == "energy_kwh")
+          |> group(columns: ["device_id", "phase", "_field"])
+        """
+        query = "\n".join(
+            f"{base} |> {fn}() |> yield(name: \"{fn}\")"
+            for fn in ("count", "sum", "min", "max")
+        )
+        tables = await run_query(query)
+
+        for table in tables:
+            for record in table.records:
+                key = (record.values.get("device_id"), record.values.get("phase"), today)
+                if None in key:
+                    continue
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = DayStats()
+                prefix = "power" if record.get_field() == "power_watt" else "energy"
+                setattr(stats, f"{prefix}_{record.values['result']}", record.get_value())
+        self._complete_from = today
+        return len(self._stats)
+
+    async def persist(self):
+        """Write changed statistics as `power_analytics`/`energy_analytics` rows."""
+        today = today_number()
+        now = datetime.now(timezone.utc)
+        points = []
+        for key, stats in list(self._stats.items()):
+            device_id, phase, day = key
+            if not stats.dirty:
+                if day < today - 1:
+                    del self._stats[key]  # long since final and persisted
+                continue
+            _, day_end = day_bounds(day_date(day))
+            at = min(now, day_end - timedelta(microseconds=1))
+            for measurement, values in (
+                ("power_analytics", stats.power()),
+                ("energy_analytics", stats.energy()),
+            ):
+                if not values:
+                    continue
+                point = Point(measurement).tag("device_id", device_id).tag("phase", phase)
+                for name, value in values.items():
+                    point = point.field(name, float(value))
+                points.append(point.time(at, WritePrecision.NS))
+            stats.dirty = False
+        if points:
+            await run_write(points)
+        return len(points)
+
+    def prune(self):
+        """Drop days before yesterday, which the leader has long persisted."""
+        today = today_number()
+        for key in [key for key in self._stats if key[2] < today - 1]:
+            del self._stats[key]
+
+    async def run_persister(self, interval: float, leader=None):
+        """Persist every `interval` seconds until cancelled.
+
+        With several workers, every one holds the same totals (batches are
+        broadcast), so only the one for which `leader()` is true writes them;
+        the others just prune.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if leader is not None and not leader():
+                self.prune()
+                continue
+            try:
+                await self.persist()
+            except Exception as e:
+                l.eprint(f"Could not persist running analytics: {e}")
+
+
+daily_stats = DailyAccumulator()
+
+
+async def warm_daily_stats():
+    """Startup warm-up; on failure today's analytics fall back to InfluxDB."""
+    try:
+        keys = await daily_stats.warm()
+        l.iprint(f"Running analytics warmed for {keys} device/phase pair(s)")
+    except Exception as e:
+        l.eprint(f"Could not warm running analytics: {e}")
@@ -0,0 +1,143 @@
+"""Whole-system metrics from the R, Y and B phases of one device.
+
+Phases are stacked into `(3, n)` arrays of time-aligned samples, so totals,
+unbalance and the neutral current are one vectorized pass whether `n` is a
+single live reading or a full day.
+
+The neutral current is estimated from the phasors of the phase currents:
+each current sits at its phase's nominal angle (0, -120, +120 degrees),
+lagging it by the angle whose tangent is `power_var / power_watt`. Waveforms
+are not stored, so harmonic (triplen) neutral current is not included.
+"""
+
+import asyncio
+
+import numpy as np
+
+from analytics.engine import load_day, sample_step
+from utils.timerange import day_bounds
+
+PHASES = ("R", "Y", "B")
+PHASE_ANGLES = np.radians([0.0, -120.0, 120.0])[:, None]
+FIELDS = ("power_watt", "power_var", "power_va", "voltage_rms", "current_rms")
+
+
+def unbalance(values: np.ndarray) -> np.ndarray:
+    """Largest deviation from the three-phase mean, in % of the mean (NEMA)."""
+    mean = values.mean(axis=0)
+    deviation = np.abs(values - mean).max(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mean > 0, deviation / mean * 100, np.nan)
+
+
+def combine(columns: dict) -> dict:
+    """Per-sample system metrics from `{field: (3, n) array}` in R, Y, B order."""
+    watt, var = columns["power_watt"], columns["power_var"]
+    total_watt = watt.sum(axis=0)
+    total_var = var.sum(axis=0)
+    apparent = np.hypot(total_watt, total_var)
+    angle = PHASE_ANGLES - np.arctan2(var, watt)
+    current = columns["current_rms"]
+    neutral = np.hypot(
+        (current * np.cos(angle)).sum(axis=0), (current * np.sin(angle)).sum(axis=0)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        power_factor = np.where(apparent > 0, total_watt / apparent, np.nan)
+    return {
+        "power_watt": total_watt,
+        "power_var": total_var,
+        "power_va": columns["power_va"].sum(axis=0),
+        "power_factor": power_factor,
+        "voltage_unbalance_pct": unbalance(columns["voltage_rms"]),
+        "current_unbalance_pct": unbalance(current),
+        "neutral_current": neutral,
+    }
+
+
+def _number(value):
+    """JSON-safe float: NaN (a missing field on some phase) becomes None."""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def live_metrics(phases: dict) -> dict:
+    """System metrics from the newest `{phase: {field: value}}` readings.
+
+    Empty unless all three phases are present.
+    """
+    if not all(phase in phases for phase in PHASES):
+        return {}
+    columns = {
+        name: np.array([[phases[p].get(name)] for p in PHASES], dtype=float)
+        for name in FIELDS
+    }
+    return {name: _number(v[0]) for name, v in combine(columns).items()}
+
+
+def align(frame: dict) -> tuple:
+    """Samples present on all three phases, as `(t, {field: (3, n) array})`.
+
+    Timestamps are matched on the grid of the sampling interval, so readings
+    of one instant that were stamped a few milliseconds apart still pair up.
+    """
+    step = min(sample_step(frame[phase]["t"]) for phase in PHASES)
+    keys, firsts = {}, {}
+    for phase in PHASES:
+        grid = np.rint(frame[phase]["t"] / step).astype(np.int64)
+        # `t` is sorted, so the first sample of each grid slot starts a run.
+        starts = np.flatnonzero(np.r_[True, grid[1:] != grid[:-1]])
+        keys[phase], firsts[phase] = grid[starts], starts
+    common = np.intersect1d(
+        np.intersect1d(keys["R"], keys["Y"], assume_unique=True),
+        keys["B"],
+        assume_unique=True,
+    )
+    rows = {p: firsts[p][np.searchsorted(keys[p], common)] for p in PHASES}
+    columns = {
+        name: np.stack([frame[p][name][rows[p]] for p in PHASES]) for name in FIELDS
+    }
+    return frame["R"]["t"][rows["R"]], columns
+
+
+def history_metrics(frame: dict, target_date, window: int) -> dict:
+    """Day statistics and a `window`-second mean series of the system metrics.
+
+    The series is columnar (`t` in epoch ms at each window start), as the
+    `format=columnar` responses; windows without aligned samples are left out.
+    """
+    if not all(phase in frame for phase in PHASES):
+        return {}
+    t, columns = align(frame)
+    if not len(t):
+        return {}
+    metrics = combine(columns)
+    day_start = day_bounds(target_date)[0].timestamp()
+    bins = ((t - day_start) // window).astype(np.int64)
+    first = bins.min()
+    counts = np.bincount(bins - first)
+    filled = np.flatnonzero(counts)
+    series = {"t": [int((day_start + (b + first) * window) * 1000) for b in filled]}
+    stats = {}
+    for name, values in metrics.items():
+        ok = np.isfinite(values)
+        size = len(counts)
+        sums = np.bincount(bins[ok] - first, weights=values[ok], minlength=size)
+        seen = np.bincount(bins[ok] - first, minlength=size)[filled]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            series[name] = [_number(v) for v in sums[filled] / seen]
+        stats[name] = {
+            "avg": _number(values[ok].mean()) if ok.any() else None,
+            "min": _number(values[ok].min()) if ok.any() else None,
+            "max": _number(values[ok].max()) if ok.any() else None,
+        }
+    return {
+        "samples": int(len(t)),
+        "window_s": window,
+        "stats": stats,
+        "series": series,
+    }
+
+
+async def load_history(target_date, device_id: str, window: int) -> dict:
+    frame = await load_day(target_date, device_id, FIELDS)
+    return await asyncio.to_thread(history_metrics, frame, target_date, window)
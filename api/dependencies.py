@@ -0,0 +1,50 @@
+"""Request dependencies that tie a credential to the devices it may use."""
+
+from fastapi import Depends, Header, HTTPException, Query
+
+from utils.credentials import credential_directory
+from utils.security import FLEET_SCOPE, verify_token
+
+DEVICE_HELP = "Device ID; defaults to the token's device"
+
+
+def _check(device_id: str, payload: dict) -> str:
+    """A token grants its own device, or every device with the `fleet` scope."""
+    if device_id != payload.get("device_id") and payload.get("scope") != FLEET_SCOPE:
+        raise HTTPException(
+            status_code=403, detail=f"Token is not valid for device '{device_id}'."
+        )
+    return device_id
+
+
+async def token_device(
+    device_id: str = Query(None, description=DEVICE_HELP),
+    payload: dict = Depends(verify_token),
+) -> str:
+    """The device a request reads or writes, which must be the token's own."""
+    return _check(device_id or payload.get("device_id"), payload)
+
+
+async def key_device(
+    x_device_key: str = Header(None, description="The RPi's `device_keys` code"),
+) -> str:
+    """The device an RPi request comes from, identified by its device key.
+
+    App tokens are not accepted here: they belong to phone users, not devices.
+    """
+    device_id = await credential_directory.device_for_key(x_device_key)
+    if device_id is None:
+        raise HTTPException(status_code=401, detail="Missing or unknown device key.")
+    return device_id
+
+
+async def token_devices(
+    device_ids: list[str] = Query(
+        None, description="Device IDs, repeat the parameter; defaults to the token's"
+    ),
+    payload: dict = Depends(verify_token),
+) -> list:
+    """`token_device` for routes taking several devices."""
+    if not device_ids:
+        return [payload.get("device_id")]
+    return [_check(device_id, payload) for device_id in device_ids]
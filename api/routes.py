@@ -1,82 +1,233 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
-from influxdb_client import Point, WritePrecision
-from datetime import datetime, timedelta, timezone
-from zoneinfo import ZoneInfo
-from utils.database import write_api, query_api
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from datetime import datetime
+from functools import partial
+import json
+from utils.columnar import columns_by_phase, decimate_columns
+from utils.database import run_query, stream_query
+from utils.ingest import pipeline
+from utils.last_values import last_values
+from analytics.three_phase import live_metrics
+from utils.day_cache import day_cache, json_response
+from utils.timerange import history_range
+from utils.downsample import (
+    AGGREGATES,
+    MAX_POINTS,
+    MODES,
+    aggregate_window,
+    lttb,
+    lttb_input_window,
+    window_seconds,
+)
+from utils.binary_ingest import CONTENT_TYPE as BINARY_CONTENT_TYPE
+from api.services import (
+    JSON_CONTENT_TYPE,
+    BatchSummary,
+    decompress_body,
+    encode_body,
+    ingest_lines,
+)
 from utils.security import verify_token
+from api.dependencies import key_device, token_device, token_devices
 from config import settings
 from utils.sprint import Logger
 
 
 l = Logger.get_instance(True)
 router = APIRouter()
+# Read endpoints for the app; every request needs a valid bearer token.
+data_router = APIRouter(dependencies=[Depends(verify_token)])
 BUCKET = settings.influxdb_bucket
 ORG = settings.influxdb_org
 
-INDIA_TZ = ZoneInfo("Asia/Kolkata")
+MAX_FLEET_DEVICES = 500
+
+QUERY_DATA_FIELDS = ("power_watt", "voltage_rms", "current_rms", "energy_kwh")
+THD_FIELDS = ("power_factor", "voltage_thd", "current_thd", "voltage_freq")
+
+POINTS_HELP = "Downsample to about this many points per phase"
+EVERY_HELP = "Downsample to fixed windows, e.g. 30s, 5m, 1h"
+AGG_HELP = "Window aggregate: mean, min or max"
+MODE_HELP = "aggregate (window aggregates) or lttb (shape-preserving, needs points)"
+FORMAT_HELP = "json, ndjson (stream one object per line) or columnar (arrays per phase)"
+HISTORY_FORMATS = ("json", "ndjson", "columnar")
+
+
+@router.post(
+    "/write-data",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                JSON_CONTENT_TYPE: {
+                    "schema": {"type": "array", "items": {"type": "object"}}
+                },
+                BINARY_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def write_data(request: Request, device_id: str = Depends(key_device)):
+    """Batch write power and energy data to InfluxDB.
+
+    Accepts a JSON list of samples, whose `time` may be an ISO-8601 string or
+    epoch nanoseconds, or the columnar format from `utils.binary_ingest`.
+    Either body may be sent with `Content-Encoding: gzip`. The RPi sends its
+    device code as `X-Device-Key`, and samples are filed under that device.
+    """
 
+    body = decompress_body(
+        await request.body(), request.headers.get("content-encoding")
+    )
+    summary = BatchSummary()
+    points = encode_body(
+        body, request.headers.get("content-type"), device_id, summary
+    )
 
-@router.post("/write-data")
-async def write_data(power_data: list[dict] = None):
-    """Batch write power and energy data to InfluxDB."""
-    device_id = "random12"
-    points = []
-    time_now = datetime.now(timezone.utc)
+    l.dprint("Queueing data for InfluxDB", device_id=device_id, lines=len(points))
+    ingest_lines(points, device_id, summary)
 
-    if not power_data:
-        raise HTTPException(status_code=400, detail="No data provided.")
+    return JSONResponse(
+        content={"message": "Data accepted for writing.", "points": len(points)},
+        status_code=201,
+    )
 
-    for p in power_data:
-        try:
-            timestamp = datetime.strptime(p["time"], "%Y-%m-%dT%H:%M:%S.%fZ")
-        except (KeyError, ValueError, TypeError):
-            timestamp = time_now  # Fallback if missing or invalid format
 
-        try:
-            point = (
-                Point("power_data")
-                .tag("device_id", device_id)
-                .tag("phase", p["phase"])
-                .field("power_watt", float(p["power_watt"]))
-                .field("power_var", float(p["power_var"]))
-                .field("power_va", float(p["power_va"]))
-                .field("voltage_rms", float(p["voltage_rms"]))
-                .field("current_rms", float(p["current_rms"]))
-                .field("power_factor", float(p["power_factor"]))
-                .field("voltage_thd", float(p["voltage_thd"]))
-                .field("current_thd", float(p["current_thd"]))
-                .field("energy_kwh", float(p["energy_kwh"]))
-                .field("voltage_freq", float(p["voltage_freq"]))
-                .time(timestamp, WritePrecision.NS)
-            )
-            points.append(point)
-        except KeyError as e:
-            raise HTTPException(
-                status_code=400, detail=f"Missing required field: {str(e)}"
-            )
+@router.get("/ingest-stats")
+async def ingest_stats():
+    """Report ingest queue depth, counters and write throughput."""
+    return JSONResponse(content=pipeline.stats(), status_code=200)
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Report size and hit/miss counters of the past-day result cache."""
+    return JSONResponse(content=day_cache.stats(), status_code=200)
+
+
+def field_filter(fields: tuple) -> str:
+    """Flux predicate keeping only `fields`."""
+    return " or ".join(f'r._field == "{name}"' for name in fields)
+
 
-    if not points:
-        raise HTTPException(status_code=400, detail="No valid data to write.")
+def downsample_stage(range_seconds: int, points, every, agg: str, mode: str):
+    """Validate downsampling parameters.
+
+    Returns the Flux `aggregateWindow` stage (possibly empty) and, for
+    `mode=lttb`, the number of points to keep per phase after the query.
+    """
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"agg must be one of {AGGREGATES}")
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {MODES}")
+    if points is not None and every is not None:
+        raise HTTPException(status_code=400, detail="Use either points or every.")
+
+    if mode == "lttb":
+        if points is None:
+            raise HTTPException(status_code=400, detail="mode=lttb needs points.")
+        # Pre-average very long ranges so LTTB input (and latency) stays bounded.
+        window = lttb_input_window(range_seconds)
+        return aggregate_window(window, "mean"), min(points, MAX_POINTS)
 
     try:
-        l.dprint("Writing data to InfluxDB..., points: ", points)
-        write_api.write(bucket=BUCKET, org=ORG, record=points)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to write data: {str(e)}")
+        window = window_seconds(range_seconds, points=points, every=every)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return aggregate_window(window, agg), None
 
-    return JSONResponse(
-        content={"message": "Data written successfully."}, status_code=201
-    )
+
+def decimate(results: dict, times: dict, field: str, points: int):
+    """Reduce each phase's rows in place to `points` LTTB-selected rows."""
+    for phase, rows in results.items():
+        keep = lttb(times[phase], [row[field] for row in rows], points)
+        results[phase] = [rows[i] for i in keep]
+
+
+def check_format(format: str, allowed: tuple, mode: str = None):
+    """Reject unknown formats, and LTTB (which needs every row) when streaming."""
+    if format not in allowed:
+        raise HTTPException(status_code=400, detail=f"format must be one of {allowed}")
+    if format == "ndjson" and mode == "lttb":
+        raise HTTPException(
+            status_code=400, detail="mode=lttb cannot be streamed as ndjson."
+        )
+
+
+def columnar_results(tables, fields: tuple, lttb_field: str, lttb_points) -> dict:
+    """Per-phase parallel arrays, LTTB-decimated if asked."""
+    results = columns_by_phase(tables, fields)
+    if lttb_points:
+        decimate_columns(results, lttb_field, lttb_points)
+    return results
+
+
+def history_row(record, fields: tuple) -> dict:
+    """One streamed history row: phase, timestamp and the requested fields."""
+    row = {
+        "phase": record.values.get("phase"),
+        "timestamp": record.get_time(),
+    }
+    for name in fields:
+        row[name] = record.values.get(name)
+    return row
 
 
-@router.get("/query-data/")
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def stream_ndjson(query: str, row) -> StreamingResponse:
+    """Stream query results as NDJSON, one `row(record)` object per line."""
+
+    async def body():
+        async for chunk in stream_query(query):
+            yield "".join(
+                json.dumps(row(record), default=_json_default) + "\n"
+                for record in chunk
+            )
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def stream_json_array(query: str, row, key: str) -> StreamingResponse:
+    """Stream query results as `{key: [row, ...]}` without buffering the list."""
+
+    async def body():
+        yield f'{{"{key}": ['
+        separator = ""
+        async for chunk in stream_query(query):
+            parts = []
+            for record in chunk:
+                parts.append(separator)
+                parts.append(json.dumps(row(record), default=_json_default))
+                separator = ","
+            yield "".join(parts)
+        yield "]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+@data_router.get("/query-data/")
 async def query_data(
     range_hours: int = 240,
-    device_id: str = "random12",
+    device_id: str = Depends(token_device),
     date_str: str = Query(description="Date in YYYY-MM-DD format"),
+    points: int = Query(None, ge=3, description=POINTS_HELP),
+    every: str = Query(None, description=EVERY_HELP),
+    agg: str = Query("mean", description=AGG_HELP),
+    mode: str = Query("aggregate", description=MODE_HELP),
+    format: str = Query("json", description=FORMAT_HELP),
 ):
-    """Query power and energy data for a specific device, grouped by phase."""
+    """Query power and energy data for a specific device, grouped by phase.
+
+    Returns raw rows unless `points` or `every` asks for downsampling.
+    `format=ndjson` streams one row per line instead of grouping by phase;
+    `format=columnar` returns parallel arrays per phase (`t` in epoch ms).
+    """
+    check_format(format, HISTORY_FORMATS, mode)
 
     if date_str:
         try:
@@ -85,56 +236,74 @@ async def query_data(
             return JSONResponse(
                 content={"message": f"Invalid date format: {e}"}, status_code=400
             )
-
-        # Use consistent timezone conversion
-        start_dt = datetime.combine(target_date, datetime.min.time()).replace(
-            tzinfo=INDIA_TZ
-        )
-        end_dt = start_dt + timedelta(days=1)
-
-        start_iso = start_dt.astimezone(ZoneInfo("UTC")).isoformat()
-        end_iso = end_dt.astimezone(ZoneInfo("UTC")).isoformat()
-
-        range_clause = f"range(start: {start_iso}, stop: {end_iso})"
-    elif range_hours is not None:
-        range_clause = f"range(start: -{range_hours}h)"
     else:
-        range_clause = "range(start: -24h)"
+        target_date = None
+    range_clause, range_seconds = history_range(target_date, range_hours)
+    window, lttb_points = downsample_stage(range_seconds, points, every, agg, mode)
 
     # Flux Query
     query = f"""
     from(bucket: "{BUCKET}")
       |> {range_clause}
       |> filter(fn: (r) => r.device_id == "{device_id}")
+      |> filter(fn: (r) => r._measurement == "power_data")
+      |> filter(fn: (r) => {field_filter(QUERY_DATA_FIELDS)})
+      {window}
       |> group(columns: ["phase"])  // Group by phase
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")  // Pivot for structured output
       |> keep(columns: ["_time", "phase", "power_watt", "voltage_rms", "current_rms", "energy_kwh"])  // Keep only relevant fields
     """
 
-    tables = query_api.query(query, org=ORG)
-    formatted_results = {}
-
-    for table in tables:
-        for record in table.records:
-            phase = record.values.get("phase", "Unknown")
-            if phase not in formatted_results:
-                formatted_results[phase] = []
+    if format == "ndjson":
+        return stream_ndjson(query, partial(history_row, fields=QUERY_DATA_FIELDS))
 
-            formatted_results[phase].append(
-                {
-                    "timestamp": record.values.get("_time").isoformat(),
-                    "power_watt": record.values.get("power_watt", None),
-                    "voltage_rms": record.values.get("voltage_rms", None),
-                    "current_rms": record.values.get("current_rms", None),
-                    "energy_kwh": record.values.get("energy_kwh", None),
-                }
+    async def load():
+        tables = await run_query(query)
+        if format == "columnar":
+            return columnar_results(
+                tables, QUERY_DATA_FIELDS, "power_watt", lttb_points
             )
 
-    return JSONResponse(content=formatted_results, status_code=200)
+        formatted_results = {}
+        times = {}
+
+        for table in tables:
+            for record in table.records:
+                phase = record.values.get("phase", "Unknown")
+                if phase not in formatted_results:
+                    formatted_results[phase] = []
+                    times[phase] = []
+
+                times[phase].append(record.get_time().timestamp())
+                formatted_results[phase].append(
+                    {
+                        "timestamp": record.values.get("_time").isoformat(),
+                        "power_watt": record.values.get("power_watt", None),
+                        "voltage_rms": record.values.get("voltage_rms", None),
+                        "current_rms": record.values.get("current_rms", None),
+                        "energy_kwh": record.values.get("energy_kwh", None),
+                    }
+                )
+
+        if lttb_points:
+            decimate(formatted_results, times, "power_watt", lttb_points)
+        return formatted_results
 
+    if date_str:
+        params = (points, every, agg, mode, format)
+        body = await day_cache.cached(
+            "query-data", device_id, "*", target_date, params, load
+        )
+        return json_response(body or b"{}")
 
-@router.get("/fetch-analytics/")
-async def fetch_analytics(device_id: str):
+    results = await load()
+    if format == "columnar":
+        return ORJSONResponse(content=results, status_code=200)
+    return JSONResponse(content=results, status_code=200)
+
+
+@data_router.get("/fetch-analytics/")
+async def fetch_analytics(device_id: str = Depends(token_device)):
     """Fetch analytics data for a given device."""
     query = f"""
     from(bucket: "{BUCKET}")
@@ -142,7 +311,7 @@ async def fetch_analytics(device_id: str):
       |> filter(fn: (r) => r._measurement == "analytics_data")
       |> filter(fn: (r) => r.device_id == "{device_id}")
     """
-    tables = query_api.query(query, org=ORG)
+    tables = await run_query(query)
     analytics_results = {}
 
     for table in tables:
@@ -154,67 +323,44 @@ async def fetch_analytics(device_id: str):
     return JSONResponse(content=analytics_results, status_code=200)
 
 
-@router.get("/fetch-all")
-async def fetch_all_data():
-    """Fetch all data in the InfluxDB bucket without authentication for testing"""
+@data_router.get("/fetch-all")
+async def fetch_all_data(
+    format: str = Query("json", description=FORMAT_HELP),
+    device_id: str = Depends(token_device),
+):
+    """Export the last 30 days of the token's device, every measurement but logins.
+
+    Streams the response, so memory stays flat however much data there is.
+    `format=json` keeps the `{"data": [...]}` shape.
+    """
+    check_format(format, ("json", "ndjson"))
 
     query = f"""
     from(bucket: "{BUCKET}")
       |> range(start: -30d)  // Fetch last 30 days of data
+      |> filter(fn: (r) => r.device_id == "{device_id}")
+      |> filter(fn: (r) => r._measurement != "user_auth")
     """
 
-    tables = query_api.query(query, org=ORG)
-
-    results = []
-
-    for table in tables:
-        for record in table.records:
-            results.append(
-                {
-                    "measurement": record.get_measurement(),
-                    "device_id": record.values.get("device_id"),
-                    "field": record.values.get("_field"),
-                    "value": record.get_value(),
-                    "time": record.get_time(),
-                }
-            )
+    def row(record):
+        return {
+            "measurement": record.get_measurement(),
+            "device_id": record.values.get("device_id"),
+            "field": record.values.get("_field"),
+            "value": record.get_value(),
+            "time": record.get_time(),
+        }
 
-    return {"data": results}
+    if format == "ndjson":
+        return stream_ndjson(query, row)
+    return stream_json_array(query, row, key="data")
 
 
-@router.get("/latest-values")
-async def get_latest_values():
+@data_router.get("/latest-values")
+async def get_latest_values(device_id: str = Depends(token_device)):
     """Get the latest values of voltage, current, and power for each phase (A, B, C) of the device."""
-    device_id = "random12"
-    query = f'''
-    
-    from(bucket: "{BUCKET}")
-    |> range(start: -1y)  // Consider last 1 hour
-    |> filter(fn: (r) => r.device_id == "{device_id}")
-    |> filter(fn: (r) => r._measurement == "power_data")
-    |> filter(fn: (r) => r._field == "voltage_rms" or r._field == "current_rms" or r._field == "power_watt")
-    |> sort(columns: ["_time"], desc: true)  // Sort by time descending to get the latest values first
-    |> first()  // Take the latest value per field
-    |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")  // Pivot for structured output
-    |> keep(columns: ["_time", "phase", "voltage_rms", "current_rms", "power_watt", "voltage_freq"])  // Keep only relevant columns
-    '''
-
-    tables = query_api.query(query, org=ORG)
-    latest_values = {}
-
-    for table in tables:
-        for record in table.records:
-            l.dprint("Record: ", record.values)
-            phase = record.values.get("phase")
-            if not phase:
-                continue  # Skip if phase is missing
-            latest_values[phase] = {
-                "timestamp": record.values.get("_time").isoformat(),
-                "voltage": record.values.get("voltage_rms"),
-                "current": record.values.get("current_rms"),
-                "power": record.values.get("power_watt"),
-                "viltage_freq": record.values.get("voltage_freq"),
-            }
+    await last_values.ensure([device_id])
+    latest_values = format_latest_values(last_values.get(device_id))
 
     if not latest_values:
         return JSONResponse(
@@ -224,10 +370,80 @@ async def get_latest_values():
     return JSONResponse(content=latest_values, status_code=200)
 
 
-@router.get("/thd-values")
-async def get_thd_data(range_hours: int = None, date_str: str = None):
-    """Get the THD values of all three phases."""
-    device_id = "random12"
+@data_router.get("/latest-values/fleet")
+async def get_fleet_latest_values(
+    device_ids: list = Depends(token_devices),
+):
+    """Latest per-phase values for several devices in one request.
+
+    Devices without any data map to `null`.
+    """
+    if len(device_ids) > MAX_FLEET_DEVICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_FLEET_DEVICES} devices per request.",
+        )
+    await last_values.ensure(device_ids)
+    fleet = {
+        device_id: format_latest_values(last_values.get(device_id)) or None
+        for device_id in device_ids
+    }
+    return JSONResponse(content=fleet, status_code=200)
+
+
+@data_router.get("/latest-values/three-phase")
+async def get_three_phase_values(device_id: str = Depends(token_device)):
+    """Total power, unbalance and neutral current from the newest R, Y and B samples.
+
+    `timestamp` is that of the oldest of the three, and `skew_s` how far the
+    newest is ahead of it.
+    """
+    await last_values.ensure([device_id])
+    phases = last_values.get(device_id)
+    metrics = live_metrics(phases)
+    if not metrics:
+        return JSONResponse(
+            content={"message": "No three-phase data found for the device."},
+            status_code=404,
+        )
+    times = [values["time"] for values in phases.values()]
+    metrics["timestamp"] = min(times).isoformat()
+    metrics["skew_s"] = (max(times) - min(times)).total_seconds()
+    return JSONResponse(content=metrics, status_code=200)
+
+
+def format_latest_values(phases: dict) -> dict:
+    """Shape last-value store entries like the `/latest-values` response."""
+    return {
+        phase: {
+            "timestamp": values["time"].isoformat(),
+            "voltage": values["voltage_rms"],
+            "current": values["current_rms"],
+            "power": values["power_watt"],
+            "viltage_freq": values["voltage_freq"],
+        }
+        for phase, values in phases.items()
+    }
+
+
+@data_router.get("/thd-values")
+async def get_thd_data(
+    range_hours: int = None,
+    date_str: str = None,
+    points: int = Query(None, ge=3, description=POINTS_HELP),
+    every: str = Query(None, description=EVERY_HELP),
+    agg: str = Query("mean", description=AGG_HELP),
+    mode: str = Query("aggregate", description=MODE_HELP),
+    format: str = Query("json", description=FORMAT_HELP),
+    device_id: str = Depends(token_device),
+):
+    """Get the THD values of all three phases.
+
+    Returns raw rows unless `points` or `every` asks for downsampling.
+    `format=ndjson` streams one row per line instead of grouping by phase;
+    `format=columnar` returns parallel arrays per phase (`t` in epoch ms).
+    """
+    check_format(format, HISTORY_FORMATS, mode)
 
     if date_str:
         try:
@@ -236,60 +452,77 @@ async def get_thd_data(range_hours: int = None, date_str: str = None):
             return JSONResponse(
                 content={"message": f"Invalid date format: {e}"}, status_code=400
             )
-
-        # Use consistent timezone conversion
-        start_dt = datetime.combine(target_date, datetime.min.time()).replace(
-            tzinfo=INDIA_TZ
-        )
-        end_dt = start_dt + timedelta(days=1)
-
-        start_iso = start_dt.astimezone(ZoneInfo("UTC")).isoformat()
-        end_iso = end_dt.astimezone(ZoneInfo("UTC")).isoformat()
-
-        range_clause = f"range(start: {start_iso}, stop: {end_iso})"
-    elif range_hours is not None:
-        range_clause = f"range(start: -{range_hours}h)"
     else:
-        range_clause = "range(start: -24h)"
+        target_date = None
+    range_clause, range_seconds = history_range(target_date, range_hours)
+    window, lttb_points = downsample_stage(range_seconds, points, every, agg, mode)
 
     query = f'''
     from(bucket: "{BUCKET}")
       |> {range_clause}
       |> filter(fn: (r) => r.device_id == "{device_id}")
       |> filter(fn: (r) => r._measurement == "power_data")
+      |> filter(fn: (r) => {field_filter(THD_FIELDS)})
+      {window}
       |> group(columns: ["phase"])  // Group by phase
       |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")  // Pivot for structured output
       |> keep(columns: ["_time", "phase", "power_factor", "voltage_thd", "current_thd", "voltage_freq"])  // Keep only relevant fields
     '''
 
-    tables = query_api.query(query, org=ORG)
-    latest_values = {}
+    if format == "ndjson":
+        return stream_ndjson(query, partial(history_row, fields=THD_FIELDS))
 
-    for table in tables:
-        for record in table.records:
-            l.dprint("Record: ", record.values)
-            phase = record.values.get("phase")
-            if not phase:
-                continue  # Skip if phase is missing
-
-            data_point = {
-                "timestamp": record.values.get("_time").isoformat(),
-                "voltage_thd": record.values.get("voltage_thd"),
-                "current_thd": record.values.get("current_thd"),
-                "power_factor": record.values.get("power_factor"),
-                "voltage_freq": record.values.get("voltage_freq"),
-            }
-            if phase not in latest_values:
-                latest_values[phase] = [data_point]
-            else:
-                latest_values[phase].append(data_point)
+    async def load():
+        tables = await run_query(query)
+        if format == "columnar":
+            return columnar_results(tables, THD_FIELDS, "voltage_thd", lttb_points)
 
-    if not latest_values:
+        latest_values = {}
+        times = {}
+
+        for table in tables:
+            for record in table.records:
+                l.dprint("Record:", record.values, sampled=True)
+                phase = record.values.get("phase")
+                if not phase:
+                    continue  # Skip if phase is missing
+
+                data_point = {
+                    "timestamp": record.values.get("_time").isoformat(),
+                    "voltage_thd": record.values.get("voltage_thd"),
+                    "current_thd": record.values.get("current_thd"),
+                    "power_factor": record.values.get("power_factor"),
+                    "voltage_freq": record.values.get("voltage_freq"),
+                }
+                if phase not in latest_values:
+                    latest_values[phase] = [data_point]
+                    times[phase] = []
+                else:
+                    latest_values[phase].append(data_point)
+                times[phase].append(record.get_time().timestamp())
+
+        if lttb_points:
+            decimate(latest_values, times, "voltage_thd", lttb_points)
+        return latest_values
+
+    if date_str:
+        params = (points, every, agg, mode, format)
+        body = await day_cache.cached(
+            "thd-values", device_id, "*", target_date, params, load
+        )
+        if body is not None:
+            return json_response(body)
+        results = None
+    else:
+        results = await load()
+
+    if not results:
         return JSONResponse(
             content={"message": "No data found for the device."}, status_code=404
         )
-
-    return JSONResponse(content=latest_values, status_code=200)
+    if format == "columnar":
+        return ORJSONResponse(content=results, status_code=200)
+    return JSONResponse(content=results, status_code=200)
 
 
 @router.get("/health")
@@ -301,7 +534,7 @@ async def health_check():
       |> range(start: -1m)
     """
     try:
-        tables = query_api.query(query=test_query, org=ORG)
+        tables = await run_query(test_query)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to connect to InfluxDB: {str(e)}"
@@ -310,37 +543,18 @@ async def health_check():
     return JSONResponse(content={"message": "connection OK."}, status_code=200)
 
 
-@router.get("/last-energy-data")
-async def get_last_energy_val():
+@data_router.get("/last-energy-data")
+async def get_last_energy_val(device_id: str = Depends(token_device)):
     """Fetches and sends last `energy_kwh` value"""
 
-    device_id = "random12"  # FIXME: Change all of this later.
-    query = f'''
-        from(bucket: "{BUCKET}")
-        |> range(start: -1y)  // Consider last 1 hour
-        |> filter(fn: (r) => r.device_id == "{device_id}")
-        |> filter(fn: (r) => r._measurement == "power_data")
-        |> filter(fn: (r) => r._field == "energy_kwh")
-        |> sort(columns: ["_time"], desc: true)  // Sort by time descending to get the latest values first
-        |> first()  // Take the latest value per field
-        |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")  // Pivot for structured output
-        |> keep(columns: ["_time", "phase", "energy_kwh"])  // Keep only relevant columns
-        '''
-
-    tables = query_api.query(query, org=ORG)
-
-    energy_values = {}
-
-    for table in tables:
-        for record in table.records:
-            l.dprint("Record: ", record.values)
-            phase = record.values.get("phase")
-            if not phase:
-                continue  # Skip if phase is missing
-            energy_values[phase] = {
-                "timestamp": record.values.get("_time").isoformat(),
-                "energy_kwh": record.values.get("energy_kwh"),
-            }
+    await last_values.ensure([device_id])
+    energy_values = {
+        phase: {
+            "timestamp": values["time"].isoformat(),
+            "energy_kwh": values["energy_kwh"],
+        }
+        for phase, values in last_values.get(device_id).items()
+    }
 
     if not energy_values:
         return JSONResponse(
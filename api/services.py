@@ -0,0 +1,164 @@
+"""Request decoding and submission shared by the ingestion entry points."""
+
+import json
+import zlib
+
+from fastapi import HTTPException
+
+from config import settings
+from analytics.running import DayStats, ENERGY_INDEX, POWER_INDEX, daily_stats
+from utils.day_cache import day_cache
+from utils.device_router import device_router
+from utils.ingest import pipeline, IngestQueueFull
+from utils.last_values import last_values
+from utils.live import live_hub
+from utils.binary_ingest import CONTENT_TYPE as BINARY_CONTENT_TYPE
+from utils.binary_ingest import unpack_power_columns
+from utils.line_protocol import SchemaError, encode_power_columns, encode_power_lines
+from utils.timerange import ist_day, today_number
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+def decompress_body(body: bytes, content_encoding: str) -> bytes:
+    """Undo `Content-Encoding: gzip`, refusing bodies that inflate past the limit."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding != "gzip":
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported content encoding: {encoding}"
+        )
+
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = inflater.decompress(body, settings.ingest_max_body_bytes)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    if inflater.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Decompressed body too large.")
+    return data
+
+
+class BatchSummary:
+    """Per-batch side results of encoding, passed to the encoders as `observe`.
+
+    Collects the newest sample per phase for the last-value store and running
+    `DayStats` per (phase, IST day) for today's analytics.
+    """
+
+    __slots__ = ("latest", "days")
+
+    def __init__(self):
+        self.latest = {}  # phase -> (epoch_ns, values)
+        self.days = {}  # (phase, ist_day) -> DayStats
+
+    def __call__(self, phase: str, ts: int, values: tuple):
+        newest = self.latest.get(phase)
+        if newest is None or ts >= newest[0]:
+            self.latest[phase] = (ts, values)
+        key = (phase, ist_day(ts))
+        stats = self.days.get(key)
+        if stats is None:
+            stats = self.days[key] = DayStats()
+        stats.add(values[POWER_INDEX], values[ENERGY_INDEX])
+
+
+def encode_samples(samples, device_id: str, summary: BatchSummary = None) -> list:
+    """Validate JSON samples and encode them as line protocol.
+
+    `summary` is filled in for `ingest_lines`.
+    """
+    if not samples:
+        raise HTTPException(status_code=400, detail="No data provided.")
+    if not isinstance(samples, list) or not all(isinstance(s, dict) for s in samples):
+        raise HTTPException(status_code=400, detail="Expected a list of samples.")
+    try:
+        return encode_power_lines(samples, device_id, observe=summary)
+    except SchemaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def encode_body(
+    body: bytes, content_type: str, device_id: str, summary: BatchSummary = None
+) -> list:
+    """Encode a `/write-data` body of either supported content type."""
+    media_type = (content_type or JSON_CONTENT_TYPE).split(";")[0].strip().lower()
+
+    if media_type == BINARY_CONTENT_TYPE:
+        try:
+            phases, times, columns, float32 = unpack_power_columns(body)
+        except SchemaError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not phases:
+            raise HTTPException(status_code=400, detail="No data provided.")
+        try:
+            return encode_power_columns(
+                phases, times, columns, device_id, float32=float32, observe=summary
+            )
+        except SchemaError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if media_type == JSON_CONTENT_TYPE:
+        try:
+            samples = json.loads(body) if body else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        return encode_samples(samples, device_id, summary)
+
+    raise HTTPException(
+        status_code=415,
+        detail=f"Unsupported content type, use {JSON_CONTENT_TYPE} or {BINARY_CONTENT_TYPE}.",
+    )
+
+
+def ingest_lines(
+    lines: list, device_id: str, summary: BatchSummary = None, track: bool = False
+):
+    """Hand encoded samples to the ingest queue, answering 429 when it is full.
+
+    Once queued, the batch `summary` filled in by the encoders is applied to
+    the last-value store, live subscribers and today's running analytics, and
+    cached results for any past day the batch backfills are dropped. With
+    several workers the summary is broadcast so every worker applies it.
+    With `track`, the queue's `Receipt` for the lines is returned.
+    """
+    if not lines:
+        raise HTTPException(status_code=400, detail="No valid data to write.")
+    try:
+        receipt = pipeline.submit(lines, track)
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Ingest queue is full, retry later.",
+            headers={"Retry-After": "1"},
+        )
+    if summary is not None:
+        apply_summary(device_id, summary.latest, summary.days)
+        live_hub.publish_values(device_id, summary.latest)
+        if device_router.fans_out:
+            days = [[phase, day, s.state()] for (phase, day), s in summary.days.items()]
+            data = {"device_id": device_id, "latest": summary.latest, "days": days}
+            device_router.broadcast("batch", data)
+    return receipt
+
+
+def apply_summary(device_id: str, latest: dict, days: dict):
+    last_values.update(device_id, latest)
+    daily_stats.merge(device_id, days)
+    today = today_number()
+    past = {day for _, day in days if day < today}
+    if past:
+        day_cache.invalidate(device_id, past)
+
+
+def _apply_broadcast(data: dict):
+    """A batch ingested by another worker."""
+    apply_summary(
+        data["device_id"],
+        {phase: (ts, tuple(values)) for phase, (ts, values) in data["latest"].items()},
+        {(phase, day): DayStats.from_state(s) for phase, day, s in data["days"]},
+    )
+
+
+device_router.listen("batch", _apply_broadcast)
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Response, status
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+    Query,
+    Response,
+    status,
+)
 from pydantic import BaseModel
+import asyncio
 import json
+from analytics.three_phase import live_metrics
+from api.services import BatchSummary, encode_samples, ingest_lines
+from utils.connections import device_connections
+from utils.credentials import credential_directory
+from utils.device_router import device_router
+from utils.last_values import last_values
+from utils.live import live_hub
+from utils.security import verify_token
 from utils.sprint import Logger
 
 l = Logger.get_instance(True)
 
 ws_router = APIRouter()
 
-connections = {}
-device_statuses = {}
-
 
 class Command(BaseModel):
     device_id: str
@@ -17,102 +31,307 @@ class Command(BaseModel):
     command: str
 
 
+async def ingest_telemetry(device_id: str, message: dict) -> dict:
+    """Ingest the samples of a telemetry message and build its ack.
+
+    Messages look like `{"type": "telemetry", "seq": 42, "samples": [...]}` with
+    the same samples `/api/write-data` accepts. The ack echoes `seq` once the
+    samples are written to InfluxDB, with a `status` of `ok` (stored; the RPi
+    may drop them from its SQLite buffer), `retry` (ingest queue full or the
+    write failed, resend later) or `error` (rejected as invalid).
+    """
+    ack = {"type": "ack", "seq": message.get("seq")}
+    try:
+        summary = BatchSummary()
+        lines = encode_samples(message.get("samples"), device_id, summary)
+        receipt = ingest_lines(lines, device_id, summary, track=True)
+    except HTTPException as e:
+        ack["status"] = "retry" if e.status_code == 429 else "error"
+        ack["detail"] = e.detail
+        return ack
+    outcome = await receipt.done
+    if outcome["dropped"]:
+        ack["status"] = "retry"
+    elif outcome["invalid"]:
+        ack["status"] = "error"
+    else:
+        ack["status"] = "ok"
+    ack["points"] = outcome["written"]
+    if ack["status"] != "ok":
+        ack["detail"] = outcome
+    return ack
+
+
+async def send_telemetry_ack(conn, message: dict):
+    ack = await ingest_telemetry(conn.device_id, message)
+    try:
+        await conn.send(json.dumps(ack))
+    except ConnectionError:
+        pass  # counted as dropped; the RPi resends unacked rows
+
+
+_acks = set()  # telemetry waiting for its write, so the socket keeps reading
+
+
 @ws_router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     l.iprint("Accepting WebSocket connection...")
     await websocket.accept()
     device_id = None
+    conn = None
     try:
         data = await websocket.receive_text()
         message = json.loads(data)
-        if message.get("type") == "connect" and "device_id" in message:
-            device_id = message["device_id"]
-            connections[device_id] = websocket
-
-            if device_id not in device_statuses:
-                device_statuses[device_id] = {
-                    "R": None,
-                    "Y": None,
-                    "B": None,
-                }
-            l.iprint(f"RPi {device_id} connected")
-        else:
+        if not (
+            isinstance(message, dict)
+            and message.get("type") == "connect"
+            and "device_id" in message
+        ):
+            await websocket.close(code=1008)
+            return
+        # Only the holder of the device's key may command or ingest as it.
+        key = message.get("device_key")
+        key_device = await credential_directory.device_for_key(key)
+        if key_device is None or key_device != message["device_id"]:
+            l.eprint(f"Refusing RPi socket for {message['device_id']!r}: bad device key")
             await websocket.close(code=1008)
+            return
+        device_id = key_device
+        conn = device_connections.open(device_id, websocket)
+        device_router.register(device_id, conn.send)
+        l.iprint(f"RPi {device_id} connected")
 
         while True:
             data = await websocket.receive_text()
-            l.iprint(f"Received from {device_id}: {data}")
-            message = json.loads(data)
+            conn.touch()
+            l.dprint("Received from", device_id, data, sampled=True)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                l.eprint(f"Ignoring malformed message from {device_id}")
+                continue
+            if not isinstance(message, dict):
+                continue
+
+            if message.get("type") == "pong":
+                conn.pong()
+                continue
+
+            if message.get("type") == "telemetry":
+                task = asyncio.create_task(send_telemetry_ack(conn, message))
+                _acks.add(task)
+                task.add_done_callback(_acks.discard)
+                continue
+
+            if message.get("type") == "ack":
+                device_router.on_reply(message)
+                continue
 
             if "status" in message:
-                device_statuses[device_id] = {
+                status = {
                     "R": message["status"].get("R"),
                     "Y": message["status"].get("Y"),
                     "B": message["status"].get("B"),
                 }
-                l.iprint(
-                    f"Updated status for {device_id}: {device_statuses[device_id]}"
-                )
+                device_router.set_status(device_id, status)
+                live_hub.publish(device_id, {"status": status})
+                l.dprint("Updated status for", device_id, status)
+                if "id" in message:
+                    device_router.on_reply(message)
     except WebSocketDisconnect:
-        if device_id in connections:
-            del connections[device_id]
+        pass
+    except Exception as e:
+        l.eprint(f"Closing socket of RPi {device_id}: {e!r}")
+    finally:
+        if conn is not None:
+            device_connections.close(conn)
             l.iprint(f"RPi {device_id} disconnected")
 
 
+def _forget_connection(conn):
+    device_router.unregister(conn.device_id, conn.send)
+
+
+device_connections.on_close(_forget_connection)
+
+
+@ws_router.get("/ws/stats")
+async def connection_stats(
+    detail: bool = Query(False, description="Include per-device figures"),
+):
+    """Connected RPis on this worker, message rates and send-queue depth."""
+    return Response(json.dumps(device_connections.stats(detail)), status_code=200)
+
+
+COMMAND_TIMEOUT = 5.0  # seconds a command waits for its ack by default
+MAX_COMMAND_TIMEOUT = 30.0
+
+WAIT_HELP = "Wait for the RPi's reply instead of returning once the command is sent"
+TIMEOUT_HELP = "Seconds to wait for the reply (and to track an unawaited one)"
+
+
+def not_connected(message: str = "RPi not connected") -> Response:
+    return Response(content=json.dumps({"status": message}), status_code=404)
+
+
+async def await_reply(future, timeout: float):
+    """The device's reply to a command, or None if it did not answer in time."""
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+@ws_router.websocket("/ws/live")
+async def live_endpoint(
+    websocket: WebSocket,
+    device_id: str = Query(..., description="Device to follow"),
+    token: str = Query(..., description="Access token from /auth/login"),
+):
+    """Push new readings and relay status of one device to an app client.
+
+    The first message is a snapshot of the latest values and status; after
+    that `{"type": "update", "values": {phase: {...}}, "status": {...}}`
+    messages carry whatever changed, merged and at most one per
+    `LIVE_MIN_INTERVAL` seconds.
+    """
+    try:
+        payload = await verify_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    if payload.get("device_id") != device_id:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    async def send(update: dict):
+        await websocket.send_text(json.dumps(update))
+
+    subscriber = live_hub.subscribe(device_id, send)
+    sender = None
+    try:
+        await last_values.ensure([device_id])
+        snapshot = {
+            phase: {"timestamp": values.pop("time").isoformat(), **values}
+            for phase, values in last_values.get(device_id).items()
+        }
+        status = await device_router.get_status(device_id)
+        update = {"values": snapshot, "status": status}
+        three_phase = live_metrics(snapshot)
+        if three_phase:
+            update["three_phase"] = three_phase
+        subscriber.offer(update)
+        sender = asyncio.create_task(subscriber.run(device_id))
+        while True:
+            await websocket.receive_text()  # only to notice the disconnect
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        live_hub.unsubscribe(device_id, subscriber)
+
+
+@ws_router.get("/ws/live/stats")
+async def live_stats():
+    """Live subscribers on this worker."""
+    return Response(json.dumps(live_hub.stats()), status_code=200)
+
+
 # HTTP endpoint to receive commands from the phone
 @ws_router.post("/remote-control")
-async def send_command(cmd: dict):
+async def send_command(
+    cmd: dict,
+    wait: bool = Query(False, description=WAIT_HELP),
+    timeout: float = Query(
+        COMMAND_TIMEOUT, gt=0, le=MAX_COMMAND_TIMEOUT, description=TIMEOUT_HELP
+    ),
+):
+    """Forward a relay command to the RPi.
+
+    Every command carries an `id` the RPi echoes in its
+    `{"type": "ack", "id": ...}`. With `wait=true` the response includes that
+    ack, or is a 504 if it does not arrive within `timeout` seconds.
+    """
     l.iprint("COMMAND: ", cmd)
-    if cmd["device_id"] in connections:
-        websocket = connections[cmd["device_id"]]
-        # Send command as JSON
-        message = {"type": "command", "phase": cmd["phase"], "command": cmd["command"]}
-        await websocket.send_text(json.dumps(message))
+    # Send command as JSON, via whichever worker holds the RPi's socket
+    message = {"type": "command", "phase": cmd["phase"], "command": cmd["command"]}
+    future = await device_router.request(cmd["device_id"], message, timeout)
+    if future is None:
+        return not_connected()
+    if not wait:
         msg = json.dumps({"status": "command sent"})
         return Response(content=msg, status_code=200)
-    else:
-        return Response(
-            content=json.dumps({"status": "RPi not connected"}), status_code=404
-        )
+
+    ack = await await_reply(future, timeout)
+    if ack is None:
+        msg = json.dumps({"status": "no ack from RPi"})
+        return Response(content=msg, status_code=504)
+    msg = json.dumps({"status": "command acknowledged", "ack": ack})
+    return Response(content=msg, status_code=200)
 
 
 @ws_router.get("/remote-control/status")
-async def get_status(device_id: str = Query(..., description="Device ID of the RPi")):
-    """Returns the status of the RPi"""
+async def get_status(
+    device_id: str = Query(..., description="Device ID of the RPi"),
+    wait: bool = Query(False, description=WAIT_HELP),
+    timeout: float = Query(
+        COMMAND_TIMEOUT, gt=0, le=MAX_COMMAND_TIMEOUT, description=TIMEOUT_HELP
+    ),
+):
+    """Returns the status of the RPi
+
+    Without `wait` this is the last reported status, and a fresh one is
+    requested in the background. With `wait=true` the response is the RPi's
+    answer to that request (504 if it does not answer within `timeout`, 502
+    if its answer has no status).
+    """
 
     l.iprint(f"device_id: {device_id}")
 
-    if device_id not in connections:
-        return Response(
-            content=json.dumps({"status": "RPi not connected"}), status_code=404
-        )
+    if not await device_router.is_connected(device_id):
+        return not_connected()
+
+    status = None
+    if not wait:
+        status = await device_router.get_status(device_id)
 
-    if device_id in device_statuses:
-        l.iprint("Status already available")
-        websocket = connections[device_id]
+    # Send command as JSON
+    message = {"type": "command", "command": "status"}
+    future = await device_router.request(device_id, message, timeout)
+    if future is None:
+        return not_connected("Rpi not connected")
+    l.iprint("Sent status request to RPi")
 
-        status = device_statuses[device_id]
+    if wait:
+        reply = await await_reply(future, timeout)
+        if reply is None:
+            msg = json.dumps({"status": "no status from RPi"})
+            return Response(content=msg, status_code=504)
+        status = reply.get("status")
+        if not isinstance(status, dict):
+            # Correlated by id, but an ack or other answer without a status.
+            msg = json.dumps({"status": "RPi reply carried no status", "reply": reply})
+            return Response(content=msg, status_code=502)
 
+    data = {
+        "R": None,
+        "Y": None,
+        "B": None,
+    }
+
+    if status:
         data = {
-            "R": None,
-            "Y": None,
-            "B": None,
+            "R": status.get("R"),
+            "Y": status.get("Y"),
+            "B": status.get("B"),
         }
 
-        if status:
-            data = {
-                "R": status.get("R"),
-                "Y": status.get("Y"),
-                "B": status.get("B"),
-            }
-
-        # Send command as JSON
-        message = {"type": "command", "command": "status"}
-        await websocket.send_text(json.dumps(message))
-        l.iprint("Sent status request to RPi")
-        # return Response(content=json.dumps(data), status_code=200)
-        return Response(json.dumps(data), status_code=200)
-
-    return Response(
-        content=json.dumps({"status": "Rpi not connected"}), status_code=404
-    )
+    return Response(json.dumps(data), status_code=200)
+
+
+@ws_router.get("/remote-control/stats")
+async def command_stats():
+    """Pending commands and per-device round-trip times seen by this worker."""
+    return Response(json.dumps(device_router.commands.stats()), status_code=200)
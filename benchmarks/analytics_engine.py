@@ -0,0 +1,99 @@
+"""Pure-Python avg/min/max vs the `analytics.engine` reports for one full day.
+
+    python -m benchmarks.analytics_engine [--rows 86400] [--repeat 3]
+
+A simulated device (`utils.generator.DeviceSimulator`, 1 Hz, three phases)
+supplies the day. Times the per-phase loop of `generate_power_analytics`,
+each engine report and the three-phase metrics over the loaded arrays, and
+`frame_from_csv` (the CSV-to-array step of `load_day`) on raw CSV rows of the
+same data.
+"""
+
+import argparse
+import time
+from datetime import date, datetime, timezone
+
+from benchmarks import fake_influx  # fills in placeholder settings on import
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from analytics import three_phase
+from analytics.engine import DAY_FIELDS, REPORTS, day_report, frame_from_csv
+from utils.generator import DeviceSimulator
+from utils.line_protocol import POWER_FIELDS
+from utils.timerange import day_bounds
+
+DAY = date(2026, 1, 1)
+FIELDS = tuple(dict.fromkeys(DAY_FIELDS + three_phase.FIELDS))
+
+
+def simulated_tables(rows: int):
+    """One pivoted table per phase, as the engine's day query returns them."""
+    start_ns = int(day_bounds(DAY)[0].timestamp()) * 10**9
+    phases, times, columns = DeviceSimulator("bench", seed=1).chunk(start_ns, rows)
+    index = [POWER_FIELDS.index(name) for name in FIELDS]
+    tables = {}
+    for i, phase in enumerate(phases.decode()):
+        values = {
+            "_time": datetime.fromtimestamp(times[i] / 1e9, timezone.utc),
+            "phase": phase,
+        }
+        for name, j in zip(FIELDS, index):
+            values[name] = float(columns[j][i])
+        tables.setdefault(phase, FluxTable()).records.append(
+            FluxRecord(table=0, values=values)
+        )
+    return list(tables.values())
+
+
+def python_stats(tables):
+    """The avg/min/max loop `generate_power_analytics` runs for each phase."""
+    stats = {}
+    for table in tables:
+        values = [record.values["power_watt"] for record in table.records]
+        stats[table.records[0].values["phase"]] = (
+            sum(values) / len(values),
+            max(values),
+            min(values),
+        )
+    return stats
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(args):
+    tables = simulated_tables(args.rows)
+    rows = fake_influx.csv_rows(tables)
+    frame = frame_from_csv(rows, FIELDS)
+    timings = {
+        "python avg/min/max": best_of(lambda: python_stats(tables), args.repeat),
+        "frame_from_csv": best_of(lambda: frame_from_csv(rows), args.repeat),
+    }
+    for kind in REPORTS:
+        timings[kind] = best_of(lambda: day_report(frame, DAY, kind), args.repeat)
+    timings["three-phase"] = best_of(
+        lambda: three_phase.history_metrics(frame, DAY, 300), args.repeat
+    )
+
+    print(f"{args.rows} samples per phase, best of {args.repeat}")
+    for name, ms in timings.items():
+        print(f"{name:>20}: {ms:8.1f} ms")
+    consumption = day_report(frame, DAY, "consumption")
+    for phase, result in consumption.items():
+        print(
+            f"{phase}: {result['consumed_kwh']:.3f} kWh counter, "
+            f"{result['integrated_kwh']:.3f} kWh integrated"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=86_400, help="rows per phase")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
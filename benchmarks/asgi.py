@@ -0,0 +1,103 @@
+"""Minimal in-process ASGI client so benchmarks need no HTTP server or httpx."""
+
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+
+class ASGIClient:
+    """Drives an ASGI app directly, including its lifespan events."""
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.headers = headers or {}
+        self._lifespan_task = None
+        self._lifespan_queue = None
+
+    async def __aenter__(self):
+        self._lifespan_queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            if message["type"] == "lifespan.startup.complete":
+                started.set_result(None)
+            elif message["type"] == "lifespan.startup.failed":
+                started.set_exception(RuntimeError(message.get("message")))
+
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.create_task(
+            self.app(scope, self._lifespan_queue.get, send)
+        )
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        await started
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        await self._lifespan_task
+
+    async def request(
+        self, method: str, url: str, body=b"", headers=None, discard_body=False
+    ):
+        """Send one HTTP request and return `(status, headers, body)`.
+
+        With `discard_body` the body is not kept and its length is returned
+        instead, so streamed responses can be measured without buffering them.
+        """
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode()
+            headers = {"content-type": "application/json", **(headers or {})}
+        headers = {**self.headers, **(headers or {})}
+        parts = urlsplit(url)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": parts.path,
+            "raw_path": parts.path.encode(),
+            "query_string": parts.query.encode(),
+            "root_path": "",
+            "headers": [
+                (k.lower().encode(), v.encode()) for k, v in headers.items()
+            ]
+            + [(b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "state": {},
+        }
+        request_sent = False
+        status, response_headers, chunks, received = None, [], [], 0
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": bytes(body), "more_body": False}
+            await asyncio.Event().wait()  # client never disconnects
+
+        async def send(message):
+            nonlocal status, response_headers, received
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                received += len(message.get("body", b""))
+                if not discard_body:
+                    chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, response_headers, received if discard_body else b"".join(chunks)
+
+
+def auth_headers(device_id: str = "random12", username: str = "bench") -> dict:
+    """Bearer header accepted by the protected routes (needs the app settings).
+
+    Also carries the device key `fake_influx.credential_tables` registers, so
+    the same client can post to `/api/write-data`.
+    """
+    from utils.security import create_access_token
+
+    token = create_access_token(device_id=device_id, username=username)
+    return {"authorization": f"Bearer {token}", "x-device-key": f"{device_id}-code"}
@@ -0,0 +1,55 @@
+"""Per-request cost of the bearer-token dependency, with and without the token cache.
+
+    python -m benchmarks.auth_overhead [--requests 5000]
+
+Measures `verify_token` on its own and a full `/api/latest-values` request
+(served from the last-value store, so InfluxDB is out of the picture). The
+cache is disabled by setting its size to 0.
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import fake_influx
+
+
+async def per_call_us(fn, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        await fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def main(args):
+    fake_influx.install(fake_influx.FakeQueryApi(default_latency=0))
+    from main import app
+    from benchmarks.asgi import ASGIClient, auth_headers
+    from utils.security import token_cache, verify_token
+
+    headers = auth_headers()
+    token = headers["authorization"].split(" ", 1)[1]
+    size = token_cache.max_size
+
+    async with ASGIClient(app, headers) as client:
+
+        async def request():
+            status, _, _ = await client.request("GET", "/api/latest-values")
+            assert status == 200, status
+
+        async def dependency():
+            await verify_token(token)
+
+        for label, max_size in (("no cache", 0), ("cache", size)):
+            token_cache.max_size = max_size
+            token_cache.clear()
+            await request()  # warm-up, fills the cache when enabled
+            dep = await per_call_us(dependency, args.requests * 10)
+            req = await per_call_us(request, args.requests)
+            print(f"{label:>9}: verify_token {dep:7.2f} us   request {req:7.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
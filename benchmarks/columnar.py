@@ -0,0 +1,83 @@
+"""Row-dict JSON vs `format=columnar` + orjson for a full day of /query-data/.
+
+    python -m benchmarks.columnar [--rows 86400] [--repeat 3]
+
+Times response construction plus serialisation for both shapes from the same
+pivoted tables (1 Hz, three phases) and prints the payload sizes.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import fake_influx  # noqa: F401  (fills in placeholder settings)
+from fastapi.responses import JSONResponse, ORJSONResponse
+from influxdb_client.client.flux_table import FluxRecord, FluxTable
+
+from api.routes import QUERY_DATA_FIELDS
+from utils.columnar import columns_by_phase
+
+
+def day_tables(rows: int):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    tables = []
+    for phase in fake_influx.PHASES:
+        table = FluxTable()
+        for i in range(rows):
+            values = {"_time": start + timedelta(seconds=i), "phase": phase}
+            for name in QUERY_DATA_FIELDS:
+                values[name] = fake_influx.POWER_FIELDS[name] + (i % 101) * 0.01
+            table.records.append(FluxRecord(table=0, values=values))
+        tables.append(table)
+    return tables
+
+
+def rows_response(tables):
+    """The default `/query-data/` loop and response."""
+    formatted_results = {}
+    for table in tables:
+        for record in table.records:
+            phase = record.values.get("phase", "Unknown")
+            if phase not in formatted_results:
+                formatted_results[phase] = []
+            formatted_results[phase].append(
+                {
+                    "timestamp": record.values.get("_time").isoformat(),
+                    "power_watt": record.values.get("power_watt", None),
+                    "voltage_rms": record.values.get("voltage_rms", None),
+                    "current_rms": record.values.get("current_rms", None),
+                    "energy_kwh": record.values.get("energy_kwh", None),
+                }
+            )
+    return JSONResponse(content=formatted_results, status_code=200)
+
+
+def columnar_response(tables):
+    return ORJSONResponse(
+        content=columns_by_phase(tables, QUERY_DATA_FIELDS), status_code=200
+    )
+
+
+def best_of(fn, tables, repeat):
+    best, response = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = fn(tables)
+        best = min(best, time.perf_counter() - started)
+    return best, len(response.body)
+
+
+def main(args):
+    tables = day_tables(args.rows)
+    rows_time, rows_size = best_of(rows_response, tables, args.repeat)
+    cols_time, cols_size = best_of(columnar_response, tables, args.repeat)
+    print(f"{'rows + json':>18}: {rows_time * 1000:8.1f} ms  {rows_size / 2**20:6.2f} MiB")
+    print(f"{'columnar + orjson':>18}: {cols_time * 1000:8.1f} ms  {cols_size / 2**20:6.2f} MiB")
+    print(f"{'speed-up':>18}: {rows_time / cols_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=86_400, help="rows per phase")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,366 @@
+"""In-process stand-ins for the InfluxDB query and write APIs.
+
+Importing this module fills in placeholder InfluxDB settings so the app can be
+imported without a `.env`; call `install()` before sending any requests.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+for _name in ("INFLUXDB_URL", "INFLUXDB_TOKEN", "INFLUXDB_ORG", "INFLUXDB_BUCKET"):
+    os.environ.setdefault(_name, "http://localhost:8086" if _name.endswith("URL") else "bench")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("SIGNUP_SEC_KEY", "")
+
+from influxdb_client.client.flux_table import FluxRecord, FluxTable  # noqa: E402
+
+PHASES = ("R", "Y", "B")
+POWER_FIELDS = {
+    "power_watt": 230.0,
+    "power_var": 40.0,
+    "power_va": 240.0,
+    "voltage_rms": 230.0,
+    "current_rms": 1.04,
+    "power_factor": 0.96,
+    "voltage_thd": 2.1,
+    "current_thd": 7.5,
+    "energy_kwh": 12.5,
+    "voltage_freq": 50.0,
+}
+
+
+def pivoted_tables(rows_per_phase: int, device_id: str = "random12"):
+    """Build one pivoted `power_data` table per phase, one row per second."""
+    start = datetime.now(timezone.utc) - timedelta(seconds=rows_per_phase)
+    tables = []
+    for phase in PHASES:
+        table = FluxTable()
+        for i in range(rows_per_phase):
+            values = {
+                "result": "_result",
+                "table": 0,
+                "_time": start + timedelta(seconds=i),
+                "_measurement": "power_data",
+                "device_id": device_id,
+                "phase": phase,
+            }
+            values.update(POWER_FIELDS)
+            table.records.append(FluxRecord(table=0, values=values))
+        tables.append(table)
+    return tables
+
+
+def raw_tables(rows_per_phase: int, device_id: str = "random12"):
+    """Build un-pivoted `power_data` tables (one `_field`/`_value` per record)."""
+    tables = []
+    for pivoted in pivoted_tables(rows_per_phase, device_id):
+        for field in POWER_FIELDS:
+            table = FluxTable()
+            for row in pivoted.records:
+                values = {
+                    k: v for k, v in row.values.items() if k not in POWER_FIELDS
+                }
+                values["_field"] = field
+                values["_value"] = row.values[field]
+                table.records.append(FluxRecord(table=0, values=values))
+            tables.append(table)
+    return tables
+
+
+def raw_records(count: int, device_id: str = "random12"):
+    """Lazily yield `count` un-pivoted records without holding them in memory."""
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    fields = list(POWER_FIELDS.items())
+    for i in range(count):
+        field, value = fields[i % len(fields)]
+        yield FluxRecord(
+            table=0,
+            values={
+                "result": "_result",
+                "table": 0,
+                "_time": start + timedelta(seconds=i // len(fields)),
+                "_measurement": "power_data",
+                "device_id": device_id,
+                "phase": PHASES[i % 3],
+                "_field": field,
+                "_value": value,
+            },
+        )
+
+
+def pivoted_records(count: int, device_id: str = "random12"):
+    """Lazily yield `count` pivoted records (every field, phases in turn)."""
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    for i in range(count):
+        yield FluxRecord(
+            table=0,
+            values={
+                "result": "_result",
+                "table": 0,
+                "_time": start + timedelta(seconds=i // len(PHASES)),
+                "_measurement": "power_data",
+                "device_id": device_id,
+                "phase": PHASES[i % len(PHASES)],
+                **POWER_FIELDS,
+            },
+        )
+
+
+def stored_analytics_tables(measurement: str, device_id: str = "random12"):
+    """One `power_analytics`/`energy_analytics` table as written by the persister."""
+    unit = "power_watt" if measurement == "power_analytics" else "energy_kwh"
+    base = POWER_FIELDS[unit]
+    table = FluxTable()
+    for stat, value in (("avg", base), ("min", base * 0.5), ("max", base * 1.5)):
+        table.records.append(
+            FluxRecord(
+                table=0,
+                values={
+                    "result": "_result",
+                    "table": 0,
+                    "_time": datetime.now(timezone.utc),
+                    "_measurement": measurement,
+                    "device_id": device_id,
+                    "_field": f"{stat}_{unit}",
+                    "_value": value,
+                },
+            )
+        )
+    return [table]
+
+
+def summary_tables(points_per_phase: int, device_id: str = "random12"):
+    """Tables of the multi-`yield` `/analytics/summary` query."""
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    step = timedelta(seconds=86400 // max(points_per_phase, 1))
+    tables = []
+    for phase in PHASES:
+        for field in ("power_watt", "energy_kwh"):
+            base = {
+                "table": 0,
+                "_measurement": "power_data",
+                "device_id": device_id,
+                "phase": phase,
+                "_field": field,
+            }
+            for result in ("mean", "min", "max"):
+                table = FluxTable()
+                table.records.append(
+                    FluxRecord(
+                        table=0,
+                        values={
+                            **base,
+                            "result": result,
+                            "_time": start,
+                            "_value": POWER_FIELDS[field],
+                        },
+                    )
+                )
+                tables.append(table)
+            table = FluxTable()
+            for i in range(points_per_phase):
+                table.records.append(
+                    FluxRecord(
+                        table=0,
+                        values={
+                            **base,
+                            "result": "series",
+                            "_time": start + step * i,
+                            "_value": POWER_FIELDS[field],
+                        },
+                    )
+                )
+            tables.append(table)
+    return tables
+
+
+def csv_rows(tables):
+    """Raw CSV rows of `tables`, as `query_csv` returns them without annotations."""
+    rows, header = [], None
+    for table in tables:
+        for record in table.records:
+            names = [k for k in record.values if k not in ("result", "table")]
+            if names != header:
+                header = names
+                rows.append(["", "result", "table", *names])
+            rows.append(
+                [
+                    "",
+                    str(record.values.get("result", "_result")),
+                    str(record.values.get("table", 0)),
+                    *(_csv_value(record.values[name]) for name in names),
+                ]
+            )
+    return rows
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return str(value)
+
+
+def credential_tables(device_id: str = "random12", username: str = "bench"):
+    """`user_auth` and `device_keys` records for the credential-directory load."""
+    now = datetime.now(timezone.utc)
+    rows = (
+        ("user_auth", "uname", username),
+        ("user_auth", "password", username),
+        ("device_keys", "device_code", f"{device_id}-code"),
+    )
+    table = FluxTable()
+    for measurement, field, value in rows:
+        table.records.append(
+            FluxRecord(
+                table=0,
+                values={
+                    "result": "_result",
+                    "table": 0,
+                    "_time": now,
+                    "_measurement": measurement,
+                    "device_id": device_id,
+                    "_field": field,
+                    "_value": value,
+                },
+            )
+        )
+    return [table]
+
+
+def running_tables(rows_per_phase: int, device_id: str = "random12"):
+    """Today's count/sum/min/max per phase, as the running-analytics warm-up reads them."""
+    tables = []
+    for phase in PHASES:
+        for field in ("power_watt", "energy_kwh"):
+            value = POWER_FIELDS[field]
+            for result, stat in (
+                ("count", rows_per_phase),
+                ("sum", value * rows_per_phase),
+                ("min", value),
+                ("max", value),
+            ):
+                table = FluxTable()
+                table.records.append(
+                    FluxRecord(
+                        table=0,
+                        values={
+                            "result": result,
+                            "table": 0,
+                            "_measurement": "power_data",
+                            "device_id": device_id,
+                            "phase": phase,
+                            "_field": field,
+                            "_value": stat,
+                        },
+                    )
+                )
+                tables.append(table)
+    return tables
+
+
+def startup_responses(rows_per_phase: int = 60, device_id: str = "random12") -> dict:
+    """`FakeQueryApi.responses` for the queries the app runs at startup."""
+    return {
+        'r._measurement == "device_keys"': credential_tables(device_id),
+        'yield(name: "count")': running_tables(rows_per_phase, device_id),
+    }
+
+
+def route_responses(rows_per_phase: int, device_id: str = "random12") -> dict:
+    """`FakeQueryApi.responses` that give every read route a well-formed answer.
+
+    Pivoted history queries fall through to the default `pivoted_tables`.
+    """
+    return {
+        **startup_responses(rows_per_phase, device_id),
+        "range(start: -30d)": raw_tables(rows_per_phase, device_id),
+        '"power_analytics"': stored_analytics_tables("power_analytics", device_id),
+        '"energy_analytics"': stored_analytics_tables("energy_analytics", device_id),
+        'yield(name: "series")': summary_tables(rows_per_phase, device_id),
+    }
+
+
+class FakeQueryApi:
+    """Blocking `query_api` replacement with configurable per-query latency.
+
+    `responses` and `latency` map a substring of the Flux text to the tables
+    returned and the delay in seconds; the first matching entry wins, otherwise
+    `tables` / `default_latency` are used. `responses` defaults to
+    `startup_responses()`. A response may also be a callable returning an
+    iterable of records, which `query_stream` consumes lazily. The delay is a
+    `time.sleep`, mirroring the blocking HTTP call of the real client.
+    """
+
+    def __init__(
+        self, tables=None, responses=None, latency=None, default_latency=0.005
+    ):
+        self.tables = tables if tables is not None else pivoted_tables(60)
+        self.responses = startup_responses() if responses is None else responses
+        self.latency = latency or {}
+        self.default_latency = default_latency
+        self.calls = 0
+        self.last_query = None
+
+    @staticmethod
+    def _match(mapping: dict, query: str, default):
+        for needle, value in mapping.items():
+            if needle in query:
+                return value
+        return default
+
+    def _respond(self, query: str):
+        self.calls += 1
+        self.last_query = query
+        time.sleep(self._match(self.latency, query, self.default_latency))
+        return self._match(self.responses, query, self.tables)
+
+    def query(self, query: str, org: str = None, params: dict = None):
+        response = self._respond(query)
+        if callable(response):
+            table = FluxTable()
+            table.records.extend(response())
+            return [table]
+        return response
+
+    def query_csv(self, query: str, org: str = None, dialect=None, params=None):
+        response = self._respond(query)
+        if callable(response):
+            table = FluxTable()
+            table.records.extend(response())
+            response = [table]
+        return iter(csv_rows(response))
+
+    def query_stream(self, query: str, org: str = None, params: dict = None):
+        response = self._respond(query)
+        if callable(response):
+            return iter(response())
+        return (record for table in response for record in table.records)
+
+
+class FakeWriteApi:
+    """Blocking `write_api` replacement that only counts what it receives."""
+
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self.writes = 0
+        self.records = 0
+
+    def write(self, bucket: str, org: str = None, record=None, **kwargs):
+        time.sleep(self.latency)
+        self.writes += 1
+        if isinstance(record, bytes):
+            self.records += record.count(b"\n") + 1
+        else:
+            self.records += len(record) if isinstance(record, list) else 1
+
+
+def install(query_api=None, write_api=None):
+    """Swap the fakes into `utils.database` and return them."""
+    from utils import database
+
+    database.query_api = query_api or FakeQueryApi()
+    database.write_api = write_api or FakeWriteApi()
+    return database.query_api, database.write_api
@@ -0,0 +1,92 @@
+"""Micro-benchmark: `Point` objects vs the `power_data` line-protocol encoder.
+
+    python -m benchmarks.line_protocol [--sizes 1000 10000 100000] [--repeat 3]
+
+Both paths end with the bytes sent to InfluxDB: the `Point` path includes
+`to_line_protocol()`, which `write_api` would otherwise do on every write.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client import Point, WritePrecision
+
+from utils.line_protocol import POWER_FIELDS, encode_power_lines, join_lines
+
+
+def make_samples(n: int, epoch_ns: bool = False):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    samples = []
+    for i in range(n):
+        ts = start + timedelta(seconds=i // 3)
+        sample = {name: 100.0 + (i % 97) * 0.37 for name in POWER_FIELDS}
+        sample["phase"] = "RYB"[i % 3]
+        sample["time"] = (
+            int(ts.timestamp()) * 10**9
+            if epoch_ns
+            else ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        )
+        samples.append(sample)
+    return samples
+
+
+def point_path(samples, device_id="random12") -> bytes:
+    """The pre-encoder `write_data` loop, followed by serialisation."""
+    time_now = datetime.now(timezone.utc)
+    points = []
+    for p in samples:
+        try:
+            timestamp = datetime.strptime(p["time"], "%Y-%m-%dT%H:%M:%S.%fZ")
+        except (KeyError, ValueError, TypeError):
+            timestamp = time_now
+        point = Point("power_data").tag("device_id", device_id).tag("phase", p["phase"])
+        for name in POWER_FIELDS:
+            point = point.field(name, float(p[name]))
+        points.append(point.time(timestamp, WritePrecision.NS))
+    return "\n".join(point.to_line_protocol() for point in points).encode()
+
+
+def encoder_path(samples, device_id="random12") -> bytes:
+    return join_lines(encode_power_lines(samples, device_id))
+
+
+def parse(payload: bytes):
+    """Reduce line protocol to comparable tuples (field order and `100` vs `100.0` differ)."""
+    rows = []
+    for line in payload.decode().split("\n"):
+        series, fields, ts = line.split(" ")
+        values = dict(pair.split("=") for pair in fields.split(","))
+        rows.append((series, {k: float(v) for k, v in values.items()}, int(ts)))
+    return rows
+
+
+def best_of(fn, samples, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(samples)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(args):
+    print(f"{'points':>8} {'Point (ms)':>11} {'encoder ISO':>12} {'encoder ns':>11} {'speed-up':>9}")
+    for n in args.sizes:
+        iso = make_samples(n)
+        ns = make_samples(n, epoch_ns=True)
+        assert parse(point_path(iso)) == parse(encoder_path(iso))
+        legacy = best_of(point_path, iso, args.repeat)
+        fast_iso = best_of(encoder_path, iso, args.repeat)
+        fast_ns = best_of(encoder_path, ns, args.repeat)
+        print(
+            f"{n:>8} {legacy * 1000:>11.1f} {fast_iso * 1000:>12.1f} "
+            f"{fast_ns * 1000:>11.1f} {legacy / fast_iso:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
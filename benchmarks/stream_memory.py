@@ -0,0 +1,85 @@
+"""Check that streamed responses keep peak memory flat as data grows.
+
+    python -m benchmarks.stream_memory [--sizes 20000 100000 200000]
+
+Covers `/api/fetch-all` (json and ndjson) and the `format=ndjson` history
+routes. A fake InfluxDB yields the given number of records lazily; the
+response body is counted and discarded. Peak Python heap (tracemalloc)
+should stay roughly constant across sizes; the script exits non-zero if the
+largest run of a route peaks at more than twice the smallest.
+"""
+
+import argparse
+import asyncio
+import sys
+import tracemalloc
+from functools import partial
+
+from benchmarks import fake_influx
+
+ROUTES = {
+    "fetch-all json": "/api/fetch-all?format=json",
+    "fetch-all ndjson": "/api/fetch-all?format=ndjson",
+    "query-data ndjson": "/api/query-data/?date_str=2026-01-01&format=ndjson",
+    "thd-values ndjson": "/api/thd-values?range_hours=24&format=ndjson",
+}
+FLOOR = 1 << 20  # peaks below 1 MiB are noise, not growth
+
+
+async def measure(client, fake, url: str, records: int):
+    fake.responses = {
+        "range(start: -30d)": partial(fake_influx.raw_records, records),
+        "pivot(": partial(fake_influx.pivoted_records, records),
+    }
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    status, _, size = await client.request("GET", url, discard_body=True)
+    _, peak = tracemalloc.get_traced_memory()
+    assert status == 200, status
+    return size, peak - base
+
+
+async def peaks(sizes, report=None) -> dict:
+    """`{route: [peak heap bytes per size]}` for every streamed route."""
+    fake, _ = fake_influx.install(fake_influx.FakeQueryApi(default_latency=0))
+    from main import app
+    from benchmarks.asgi import ASGIClient, auth_headers
+
+    results = {}
+    tracemalloc.start()
+    try:
+        async with ASGIClient(app, auth_headers()) as client:
+            for name, url in ROUTES.items():
+                results[name] = []
+                for records in sizes:
+                    size, peak = await measure(client, fake, url, records)
+                    results[name].append(peak)
+                    if report:
+                        report(name, records, size, peak)
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def is_flat(route_peaks: list) -> bool:
+    return route_peaks[-1] <= 2 * max(route_peaks[0], FLOOR)
+
+
+def print_run(name, records, size, peak):
+    print(
+        f"{name:>18} {records:>9} records: body {size / 2**20:8.1f} MiB, "
+        f"peak heap {peak / 2**20:6.2f} MiB"
+    )
+
+
+async def main(args):
+    results = await peaks(args.sizes, print_run)
+    grown = [name for name, route_peaks in results.items() if not is_flat(route_peaks)]
+    print(f"memory grows with result size: {', '.join(grown)}" if grown else "memory flat")
+    return 1 if grown else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20_000, 100_000, 200_000])
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,269 @@
+"""Throughput and latency of the main routes against a fake InfluxDB.
+
+    python -m benchmarks.suite [--requests 500] [--concurrency 16]
+        [--only query-data latest-values] [--no-day-cache]
+        [--fetch-all 2] [--fetch-all-latency 0.5]
+        [--output benchmarks/results/<commit>.json] [--compare OLD.json]
+
+Every scenario is first run on its own with `--concurrency` requests in
+flight, then all of them together ("mixed"), through the ASGI app and its
+lifespan. Last, latest-values runs again while `--fetch-all` loops export
+`/api/fetch-all`, whose scan takes `--fetch-all-latency` seconds
+("with-fetch-all"), to show its tail latency under a bulk export. InfluxDB is
+replaced by `benchmarks.fake_influx`, which sleeps `--influx-latency` seconds
+per query like a blocking HTTP call.
+
+Results (req/s, p50/p95/p99 in ms, error count per scenario) are written as
+JSON named after the current commit; `--compare` prints the change against an
+earlier file, so a regression shows up as a negative req/s or positive p99 delta.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import fake_influx
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def write_batch(samples: int):
+    """A `/api/write-data` JSON body of `samples` readings per phase."""
+    now = time.time_ns()
+    return [
+        {
+            "phase": phase,
+            "time": now - (samples - i) * 10**9,
+            **fake_influx.POWER_FIELDS,
+        }
+        for i in range(samples)
+        for phase in fake_influx.PHASES
+    ]
+
+
+def scenarios(date_str: str, batch_size: int) -> dict:
+    """name -> (method, url, body)."""
+    body = write_batch(batch_size)
+    day = f"date_str={date_str}"
+    return {
+        "write-data": ("POST", "/api/write-data", body),
+        "query-data": ("GET", f"/api/query-data/?{day}&points=500", b""),
+        "latest-values": ("GET", "/api/latest-values", b""),
+        "analytics-power": ("GET", f"/analytics/power?{day}&phase=R", b""),
+        "analytics-energy": ("GET", f"/analytics/energy?{day}&phase=R", b""),
+        "analytics-summary": ("GET", f"/analytics/summary?{day}", b""),
+    }
+
+
+class Recorder:
+    """Latencies and failures of one scenario."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def add(self, status: int, ms: float):
+        self.latencies.append(ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.errors += 1
+
+    def result(self, elapsed: float) -> dict:
+        samples = self.latencies or [0.0]
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "req_per_s": len(self.latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+            "max_ms": max(samples),
+        }
+
+
+async def drive(client, plan: dict, requests: int, concurrency: int) -> dict:
+    """Send `requests` per scenario in `plan`, `concurrency` at a time overall."""
+    queue = [name for _ in range(requests) for name in plan]
+    queue.reverse()
+    recorders = {name: Recorder() for name in plan}
+
+    async def worker():
+        while queue:
+            name = queue.pop()
+            method, url, body = plan[name]
+            started = time.perf_counter()
+            status, _, _ = await client.request(method, url, body, discard_body=True)
+            recorders[name].add(status, (time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    # In the mixed run every scenario shares the wall time; "all" is the sum.
+    results = {name: rec.result(elapsed) for name, rec in recorders.items()}
+    if len(plan) > 1:
+        total = Recorder()
+        for rec in recorders.values():
+            for status, count in rec.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+            total.latencies.extend(rec.latencies)
+            total.errors += rec.errors
+        results["all"] = total.result(elapsed)
+    return results
+
+
+async def with_fetch_all(client, request, requests: int, concurrency: int, loops: int):
+    """Drive `request` while `loops` clients export `/api/fetch-all` back to back."""
+    stop = asyncio.Event()
+
+    async def export():
+        while not stop.is_set():
+            await client.request("GET", "/api/fetch-all", discard_body=True)
+
+    background = [asyncio.create_task(export()) for _ in range(loops)]
+    await asyncio.sleep(0.05)
+    try:
+        return await drive(client, {"latest-values": request}, requests, concurrency)
+    finally:
+        stop.set()
+        await asyncio.gather(*background)
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def print_results(results: dict):
+    for mode, rows in results.items():
+        print(f"\n[{mode}]")
+        for name, r in rows.items():
+            print(
+                f"{name:>18}: {r['req_per_s']:8.1f} req/s  "
+                f"p50={r['p50_ms']:7.1f} ms  p95={r['p95_ms']:7.1f} ms  "
+                f"p99={r['p99_ms']:7.1f} ms  errors={r['errors']}"
+            )
+
+
+def change(before: float, after: float) -> float:
+    return (after / before - 1) * 100 if before else 0.0
+
+
+def print_comparison(old: dict, new: dict):
+    print(f"\nchange vs {old['meta']['commit']}:")
+    for mode, rows in new["results"].items():
+        for name, r in rows.items():
+            before = old["results"].get(mode, {}).get(name)
+            if before is None:
+                continue
+            rps = change(before["req_per_s"], r["req_per_s"])
+            p99 = change(before["p99_ms"], r["p99_ms"])
+            print(f"{mode:>8} {name:>18}: req/s {rps:+6.1f}%  p99 {p99:+6.1f}%")
+
+
+async def main(args):
+    fake_influx.install(
+        fake_influx.FakeQueryApi(
+            tables=fake_influx.pivoted_tables(args.rows),
+            responses=fake_influx.route_responses(args.rows),
+            latency={"range(start: -30d)": args.fetch_all_latency},
+            default_latency=args.influx_latency,
+        ),
+        fake_influx.FakeWriteApi(latency=args.influx_latency),
+    )
+    from main import app
+    from benchmarks.asgi import ASGIClient, auth_headers
+    from utils.day_cache import day_cache
+
+    if not args.day_cache:
+        day_cache.max_entries = 0
+
+    ist = timezone(timedelta(hours=5, minutes=30))
+    date_str = args.date or (datetime.now(ist).date() - timedelta(days=1)).isoformat()
+    plan = scenarios(date_str, args.batch)
+    if args.only:
+        plan = {name: plan[name] for name in args.only}
+
+    results = {"isolated": {}}
+    async with ASGIClient(app, auth_headers()) as client:
+        for name, request in plan.items():
+            await drive(client, {name: request}, args.warmup, args.concurrency)
+            results["isolated"].update(
+                await drive(client, {name: request}, args.requests, args.concurrency)
+            )
+        if len(plan) > 1:
+            results["mixed"] = await drive(
+                client, plan, args.requests // len(plan) or 1, args.concurrency
+            )
+        if "latest-values" in plan and args.fetch_all:
+            results["with-fetch-all"] = await with_fetch_all(
+                client,
+                plan["latest-values"],
+                args.requests,
+                args.concurrency,
+                args.fetch_all,
+            )
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "date_str": date_str,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    print_results(results)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['meta']['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", nargs="+", choices=sorted(scenarios("", 1)))
+    parser.add_argument("--date", help="day for history routes (default: yesterday)")
+    parser.add_argument("--rows", type=int, default=1440, help="fake rows per phase")
+    parser.add_argument("--batch", type=int, default=10, help="readings per phase")
+    parser.add_argument("--influx-latency", type=float, default=0.005)
+    parser.add_argument("--fetch-all", type=int, default=2, help="concurrent export loops")
+    parser.add_argument("--fetch-all-latency", type=float, default=0.5)
+    parser.add_argument("--no-day-cache", dest="day_cache", action="store_false")
+    parser.add_argument("--output")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    asyncio.run(main(parser.parse_args()))
@@ -13,5 +13,64 @@ class Settings(BaseSettings):
     secret_key: str = os.getenv("SECRET_KEY")
     signup_sec_key: str = os.getenv("SIGNUP_SEC_KEY")
 
+    # InfluxDB calls run on a bounded thread pool so they never block the event loop
+    influxdb_max_queries: int = int(os.getenv("INFLUXDB_MAX_QUERIES", 8))
+    influxdb_max_writes: int = int(os.getenv("INFLUXDB_MAX_WRITES", 4))
+
+    # Ingestion queue behind /api/write-data
+    ingest_batch_size: int = int(os.getenv("INGEST_BATCH_SIZE", 5000))
+    ingest_flush_interval: float = float(os.getenv("INGEST_FLUSH_INTERVAL", 1.0))
+    ingest_max_pending: int = int(os.getenv("INGEST_MAX_PENDING", 100_000))
+    ingest_max_retries: int = int(os.getenv("INGEST_MAX_RETRIES", 3))
+    ingest_max_body_bytes: int = int(os.getenv("INGEST_MAX_BODY_BYTES", 32 << 20))
+
+    # Result cache for past days; DAY_CACHE_PATH adds an SQLite tier on disk
+    day_cache_max_entries: int = int(os.getenv("DAY_CACHE_MAX_ENTRIES", 1024))
+    day_cache_max_bytes: int = int(os.getenv("DAY_CACHE_MAX_BYTES", 64 << 20))
+    day_cache_path: str = os.getenv("DAY_CACHE_PATH", "")
+
+    # Seconds a device with no stored samples is not looked up again
+    last_values_miss_ttl: float = float(os.getenv("LAST_VALUES_MISS_TTL", 30))
+
+    # Seconds between credential-directory refreshes (also the minimum gap
+    # between refreshes triggered by a login miss)
+    auth_refresh_interval: float = float(os.getenv("AUTH_REFRESH_INTERVAL", 5))
+
+    # Comma-separated usernames whose tokens may read every device (fleet views)
+    fleet_users: str = os.getenv("FLEET_USERS", "")
+
+    # Verified JWTs kept so polling clients skip repeated signature checks
+    token_cache_size: int = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+
+    # Where RPi sockets are looked up: "local" (one worker) or "unix" (a broker
+    # on DEVICE_ROUTER_SOCKET shared by all workers of this host)
+    device_router: str = os.getenv("DEVICE_ROUTER", "local")
+    device_router_socket: str = os.getenv(
+        "DEVICE_ROUTER_SOCKET", "/tmp/edl-device-router.sock"
+    )
+
+    # RPi sockets are pinged every WS_PING_INTERVAL seconds and closed after
+    # WS_PING_TIMEOUT seconds without any message; WS_SEND_QUEUE bounds the
+    # frames waiting to be sent to one device
+    ws_ping_interval: float = float(os.getenv("WS_PING_INTERVAL", 20))
+    ws_ping_timeout: float = float(os.getenv("WS_PING_TIMEOUT", 60))
+    ws_send_queue: int = int(os.getenv("WS_SEND_QUEUE", 256))
+
+    # Minimum seconds between pushes to one /ws/live subscriber
+    live_min_interval: float = float(os.getenv("LIVE_MIN_INTERVAL", 0.5))
+
+    # Logging: LOG_LEVEL is DEBUG, INFO or ERROR, LOG_FORMAT text or json;
+    # sampled per-message logs keep one call in LOG_SAMPLE_EVERY, and records
+    # beyond LOG_QUEUE_SIZE waiting for the writer thread are dropped
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_format: str = os.getenv("LOG_FORMAT", "text")
+    log_sample_every: int = int(os.getenv("LOG_SAMPLE_EVERY", 100))
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+
+    # Today's running analytics are written back to InfluxDB this often (seconds)
+    analytics_persist_interval: float = float(
+        os.getenv("ANALYTICS_PERSIST_INTERVAL", 300)
+    )
+
 
 settings = Settings()
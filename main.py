@@ -1,12 +1,53 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from api.routes import router as api_router
+from api.routes import data_router, router as api_router
 from api.auth import router as auth_router
 from api.websockets import ws_router
 from analytics.routes import analysis_router
+from analytics.running import daily_stats, warm_daily_stats
+from config import settings
+from utils.connections import device_connections
+from utils.credentials import credential_directory, warm_credentials
+from utils.day_cache import day_cache
+from utils.device_router import device_router
+from utils.ingest import pipeline
+from utils.last_values import warm_last_values
+from utils.metrics import HTTPMetricsMiddleware, registry
+from utils.security import verify_token
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_last_values()
+    await warm_credentials()
+    await warm_daily_stats()  # before ingestion, so today's totals are not double counted
+    pipeline.start()
+    await device_router.start()
+    device_connections.start()
+    persister = asyncio.create_task(
+        daily_stats.run_persister(
+            settings.analytics_persist_interval, lambda: device_router.is_leader
+        )
+    )
+    refresher = asyncio.create_task(credential_directory.run_refresher())
+    yield
+    refresher.cancel()
+    persister.cancel()
+    leader = device_router.is_leader
+    await device_connections.stop()
+    await device_router.stop()
+    await pipeline.stop()  # flush whatever is still queued
+    await day_cache.close()
+    if leader:
+        await daily_stats.persist()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.allow_origins = ["*"]
 
@@ -18,8 +59,20 @@ app.add_middleware(
     allow_methods=["*"],  # Allows POST, GET, OPTIONS, etc.
     allow_headers=["*"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
 
 app.include_router(api_router, prefix="/api")
+app.include_router(data_router, prefix="/api")
 app.include_router(auth_router, prefix="/auth")
 app.include_router(ws_router, prefix="")
-app.include_router(analysis_router, prefix="/analytics")
+app.include_router(
+    analysis_router, prefix="/analytics", dependencies=[Depends(verify_token)]
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of request, InfluxDB, ingest and socket metrics."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4"
+    )
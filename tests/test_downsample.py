@@ -0,0 +1,40 @@
+"""LTTB keeps the shape of a series: its endpoints and its peaks."""
+
+import math
+import unittest
+
+from utils.downsample import lttb
+
+
+class LttbTest(unittest.TestCase):
+    def setUp(self):
+        self.xs = list(range(1000))
+        self.ys = [math.sin(x / 50) for x in self.xs]
+        self.ys[137] = 40.0  # spike
+        self.ys[612] = -40.0  # dip
+
+    def test_keeps_endpoints_and_count(self):
+        indices = lttb(self.xs, self.ys, 100)
+        self.assertEqual(len(indices), 100)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(self.xs) - 1)
+        self.assertEqual(indices, sorted(set(indices)))
+
+    def test_keeps_peaks(self):
+        indices = lttb(self.xs, self.ys, 50)
+        self.assertIn(137, indices)
+        self.assertIn(612, indices)
+
+    def test_short_series_unchanged(self):
+        self.assertEqual(lttb(self.xs[:10], self.ys[:10], 20), list(range(10)))
+        self.assertEqual(lttb(self.xs, self.ys, 2), list(range(1000)))
+
+    def test_none_values_treated_as_zero(self):
+        ys = [None if i % 7 == 0 else y for i, y in enumerate(self.ys)]
+        indices = lttb(self.xs, ys, 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(137, indices)
+
+
+if __name__ == "__main__":
+    unittest.main()
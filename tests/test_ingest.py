@@ -0,0 +1,61 @@
+"""A point InfluxDB rejects is isolated by bisection; its neighbours are written."""
+
+import unittest
+from unittest import mock
+
+from influxdb_client.rest import ApiException
+
+from benchmarks import fake_influx  # noqa: F401  (placeholder settings)
+from utils.ingest import IngestPipeline
+
+BAD = "power_data,device_id=dev,phase=R power_watt=oops 1"
+
+
+def lines(count: int, bad_at: int = None) -> list:
+    return [
+        BAD if i == bad_at else f"power_data,device_id=dev,phase=R power_watt={i} {i}"
+        for i in range(count)
+    ]
+
+
+class IngestBisectionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.written = []
+
+        async def run_write(payload: bytes):
+            batch = payload.decode().split("\n")
+            if BAD in batch:
+                raise ApiException(status=400, reason="partial write")
+            self.written.extend(batch)
+
+        patcher = mock.patch("utils.ingest.run_write", run_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_rejected_point_is_isolated(self):
+        records = lines(16, bad_at=5)
+        pipeline = IngestPipeline(batch_size=len(records), flush_interval=0.01)
+        pipeline.start()
+        receipt = pipeline.submit(records, track=True)
+        outcome = await receipt.done
+        await pipeline.stop()
+
+        self.assertEqual(outcome, {"written": 15, "dropped": 0, "invalid": 1})
+        self.assertEqual(sorted(self.written), sorted(set(records) - {BAD}))
+        self.assertEqual(pipeline.counters["points_invalid"], 1)
+        self.assertEqual(pipeline.counters["points_written"], 15)
+
+    async def test_receipts_settle_per_request(self):
+        first, second = lines(6), lines(6, bad_at=2)
+        pipeline = IngestPipeline(batch_size=12, flush_interval=0.01)
+        pipeline.start()
+        receipts = [pipeline.submit(r, track=True) for r in (first, second)]
+        outcomes = [await receipt.done for receipt in receipts]
+        await pipeline.stop()
+
+        self.assertEqual(outcomes[0], {"written": 6, "dropped": 0, "invalid": 0})
+        self.assertEqual(outcomes[1], {"written": 5, "dropped": 0, "invalid": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Phase tags line protocol cannot carry are refused before the write."""
+
+import unittest
+
+from utils.line_protocol import (
+    POWER_FIELDS,
+    SchemaError,
+    encode_power_lines,
+    phase_tag,
+)
+
+
+def sample(phase) -> dict:
+    return {"phase": phase, **{name: 1.0 for name in POWER_FIELDS}}
+
+
+class PhaseTagTest(unittest.TestCase):
+    def test_plain_and_escaped_phases(self):
+        self.assertEqual(phase_tag("R"), "R")
+        self.assertEqual(phase_tag("R 1"), "R\\ 1")
+
+    def test_empty_and_control_characters_rejected(self):
+        for phase in ("", None, "R\n", "R\rY", "\tB", "Y\x00", "B\x7f"):
+            with self.subTest(phase=phase):
+                with self.assertRaises(SchemaError):
+                    phase_tag(phase)
+
+    def test_encoder_rejects_bad_phase_in_later_sample(self):
+        for phase in ("", "R\npower_data,device_id=other phase=Y"):
+            with self.subTest(phase=phase):
+                with self.assertRaises(SchemaError):
+                    encode_power_lines([sample("R"), sample(phase)], "dev", 1)
+
+    def test_encoder_accepts_valid_samples(self):
+        lines = encode_power_lines([sample("R"), sample("Y")], "dev", 1)
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all("\n" not in line for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+"""Streamed responses must not buffer the whole result.
+
+Runs `benchmarks.stream_memory` against the fake InfluxDB at two sizes ten
+times apart and fails if any route's peak heap grows with the result.
+"""
+
+import unittest
+
+from benchmarks import stream_memory
+
+SIZES = (2_000, 20_000)
+
+
+class StreamMemoryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_peak_heap_stays_bounded(self):
+        results = await stream_memory.peaks(SIZES)
+        self.assertEqual(set(results), set(stream_memory.ROUTES))
+        for name, route_peaks in results.items():
+            with self.subTest(route=name):
+                self.assertTrue(
+                    stream_memory.is_flat(route_peaks),
+                    f"peak heap {route_peaks} bytes for {SIZES} records",
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Compact columnar wire format for `power_data` uploads.
+
+Sent to `/api/write-data` with `Content-Type: application/vnd.edl.power-columns`
+(optionally `Content-Encoding: gzip`). All integers are little-endian::
+
+    magic      4 bytes   b"EDLP"
+    version    u8        1
+    flags      u8        bit 0 set: field columns are float32, else float64
+    reserved   u16
+    count      u32       number of samples (n)
+    phases     n bytes   ASCII phase code per sample (b"R", b"Y", b"B")
+    times      n * i64   epoch nanoseconds, 0 = use server receive time
+    fields     10 columns of n floats each, in `POWER_FIELDS` order
+
+Compared to the JSON body this drops the ten repeated field names per sample;
+the server decodes it with zero-copy views straight into the line-protocol
+encoder.
+"""
+
+import struct
+import sys
+from array import array
+
+from utils.line_protocol import POWER_FIELDS, SchemaError
+
+CONTENT_TYPE = "application/vnd.edl.power-columns"
+MAGIC = b"EDLP"
+VERSION = 1
+FLAG_FLOAT32 = 0x01
+
+_HEADER = struct.Struct("<4sBBHI")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _column(buf: memoryview, offset: int, count: int, typecode: str):
+    """View `count` little-endian items starting at `offset`."""
+    size = array(typecode).itemsize * count
+    view = buf[offset : offset + size]
+    if _LITTLE_ENDIAN:
+        return view.cast(typecode), offset + size
+    col = array(typecode, view.tobytes())
+    col.byteswap()
+    return col, offset + size
+
+
+def unpack_power_columns(payload: bytes):
+    """Split a payload into `(phases, times, columns, float32)`.
+
+    Raises `SchemaError` for a wrong magic/version or a truncated body.
+    """
+    if len(payload) < _HEADER.size:
+        raise SchemaError("Payload shorter than header")
+    magic, version, flags, _, count = _HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise SchemaError("Unsupported payload format")
+
+    float32 = bool(flags & FLAG_FLOAT32)
+    value_type = "f" if float32 else "d"
+    item = array(value_type).itemsize
+    expected = _HEADER.size + count * (1 + 8 + item * len(POWER_FIELDS))
+    if len(payload) != expected:
+        raise SchemaError(
+            f"Payload is {len(payload)} bytes, expected {expected} for {count} samples"
+        )
+
+    buf = memoryview(payload)
+    offset = _HEADER.size
+    phases = bytes(buf[offset : offset + count])
+    offset += count
+    times, offset = _column(buf, offset, count, "q")
+    columns = []
+    for _ in POWER_FIELDS:
+        col, offset = _column(buf, offset, count, value_type)
+        columns.append(col)
+    return phases, times, columns, float32
+
+
+def pack_power_columns(samples: list, float32: bool = False) -> bytes:
+    """Build a payload from sample dicts (`phase`, `time` in epoch ns, fields).
+
+    Reference encoder for devices and load generators.
+    """
+    value_type = "f" if float32 else "d"
+    phases = bytes(ord(s["phase"]) for s in samples)
+    times = array("q", (int(s.get("time") or 0) for s in samples))
+    columns = [array(value_type, (float(s[name]) for s in samples)) for name in POWER_FIELDS]
+    if not _LITTLE_ENDIAN:
+        for col in [times, *columns]:
+            col.byteswap()
+    return pack_power_buffers(phases, times, columns, float32)
+
+
+def pack_power_buffers(phases: bytes, times, columns: list, float32: bool = False):
+    """Build a payload from ready little-endian columns (arrays, NumPy, bytes).
+
+    `times` must hold int64 items and `columns` float32 or float64 ones as
+    chosen by `float32`; nothing is converted.
+    """
+    header = _HEADER.pack(
+        MAGIC, VERSION, FLAG_FLOAT32 if float32 else 0, 0, len(phases)
+    )
+    return b"".join([header, phases, bytes(times), *(bytes(c) for c in columns)])
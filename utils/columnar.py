@@ -0,0 +1,52 @@
+"""Column-oriented (parallel array) shaping of Flux results.
+
+Used by `format=columnar` responses: one `t` array of epoch milliseconds plus
+one array per field, instead of a dict with repeated keys per row.
+"""
+
+from utils.downsample import lttb
+
+
+def new_columns(fields: tuple) -> dict:
+    return {"t": [], **{name: [] for name in fields}}
+
+
+def append_record(columns: dict, record, fields: tuple):
+    """Append one pivoted record to `columns`."""
+    values = record.values
+    columns["t"].append(int(values["_time"].timestamp() * 1000))
+    for name in fields:
+        columns[name].append(values.get(name))
+
+
+def columns_by_phase(tables, fields: tuple) -> dict:
+    """`{phase: {"t": [...], <field>: [...]}}` from pivoted tables."""
+    results = {}
+    for table in tables:
+        for record in table.records:
+            phase = record.values.get("phase")
+            if not phase:
+                continue
+            columns = results.get(phase)
+            if columns is None:
+                columns = results[phase] = new_columns(fields)
+            append_record(columns, record, fields)
+    return results
+
+
+def columns_of(tables, fields: tuple) -> dict:
+    """A single `{"t": [...], <field>: [...]}` block from pivoted tables."""
+    columns = new_columns(fields)
+    for table in tables:
+        for record in table.records:
+            append_record(columns, record, fields)
+    return columns
+
+
+def decimate_columns(results: dict, field: str, points: int):
+    """Reduce each phase's columns in place to `points` LTTB-selected rows."""
+    for phase, columns in results.items():
+        keep = lttb(columns["t"], columns[field], points)
+        results[phase] = {
+            name: [values[i] for i in keep] for name, values in columns.items()
+        }
@@ -0,0 +1,94 @@
+"""Correlation of relay commands with the RPi's replies, and round-trip stats."""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+class CommandTracker:
+    """Pending-command table keyed by correlation id, with deadlines.
+
+    Ids look like `<worker>-<n>` so a reply received by another worker can be
+    sent back to the one that issued the command. An entry lives until the
+    device replies or its deadline passes, whether or not anyone awaits it.
+    """
+
+    RTT_SAMPLES = 256  # most recent round trips kept per device
+
+    def __init__(self, worker: str):
+        self.worker = worker
+        self._ids = itertools.count(1)
+        self._pending = {}  # id -> (device_id, sent_at, future)
+        self._deadlines = []  # heap of (deadline, id)
+        self._rtt = {}  # device_id -> deque of round trips in ms
+        self._timeouts = {}  # device_id -> count
+
+    def owns(self, command_id) -> bool:
+        return isinstance(command_id, str) and command_id.startswith(self.worker + "-")
+
+    def new(self, device_id: str, timeout: float):
+        """Register a command; returns its id and a future for the reply."""
+        self.expire()
+        command_id = f"{self.worker}-{next(self._ids)}"
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        # Nobody awaits fire-and-forget commands; mark their timeout as seen.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[command_id] = (device_id, now, future)
+        heapq.heappush(self._deadlines, (now + timeout, command_id))
+        return command_id, future
+
+    def resolve(self, command_id, reply: dict) -> bool:
+        """Complete a pending command with the device's reply."""
+        entry = self._pending.pop(command_id, None)
+        if entry is None:
+            return False  # unknown, or already past its deadline
+        device_id, sent_at, future = entry
+        samples = self._rtt.get(device_id)
+        if samples is None:
+            samples = self._rtt[device_id] = deque(maxlen=self.RTT_SAMPLES)
+        samples.append((time.monotonic() - sent_at) * 1000)
+        if not future.done():
+            future.set_result(reply)
+        return True
+
+    def fail(self, command_id):
+        """Drop a command that could not be sent."""
+        entry = self._pending.pop(command_id, None)
+        if entry is not None and not entry[2].done():
+            entry[2].cancel()
+
+    def expire(self):
+        """Time out every command whose deadline has passed."""
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, command_id = heapq.heappop(self._deadlines)
+            entry = self._pending.pop(command_id, None)
+            if entry is None:
+                continue
+            device_id, _, future = entry
+            self._timeouts[device_id] = self._timeouts.get(device_id, 0) + 1
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """Round-trip figures per device, in milliseconds."""
+        self.expire()
+        devices = {}
+        for device_id in self._rtt.keys() | self._timeouts.keys():
+            ordered = sorted(self._rtt.get(device_id, ()))
+            entry = {"replies": len(ordered), "timeouts": self._timeouts.get(device_id, 0)}
+            if ordered:
+                entry.update(
+                    last_ms=self._rtt[device_id][-1],
+                    p50_ms=ordered[len(ordered) // 2],
+                    p95_ms=ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    max_ms=ordered[-1],
+                )
+            devices[device_id] = entry
+        return {"pending": len(self._pending), "devices": devices}
@@ -0,0 +1,230 @@
+"""Health and bookkeeping of RPi WebSocket connections."""
+
+import asyncio
+import json
+import time
+
+from config import settings
+from utils.metrics import Gauge, registry
+from utils.sprint import Logger
+
+l = Logger.get_instance(True)
+
+
+class DeviceConnection:
+    """One RPi socket with a bounded send queue drained by its own task.
+
+    Everything sent to the device goes through `send()`, which only enqueues,
+    so a stalled socket can never block a request handler; it fills its
+    queue and further sends fail instead.
+    """
+
+    def __init__(self, device_id: str, websocket, max_queue: int, on_dead):
+        self.device_id = device_id
+        self.websocket = websocket
+        self.queue = asyncio.Queue(max_queue)
+        self.on_dead = on_dead
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+        self.answers_pings = False
+        self.closed = False
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def touch(self):
+        """Record a message from the device; any message proves it is alive."""
+        self.last_seen = time.monotonic()
+        self.received += 1
+
+    def pong(self):
+        """The device answered a ping, so its silence can be trusted as death."""
+        self.answers_pings = True
+
+    async def send(self, text: str):
+        if self.closed:
+            raise ConnectionError(f"Connection to {self.device_id} is closed")
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            raise ConnectionError(f"Send queue to {self.device_id} is full")
+
+    async def _send_loop(self):
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_text(text), settings.ws_ping_timeout
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                l.eprint(f"Send to {self.device_id} failed: {e}")
+                self.on_dead(self)
+                return
+            self.sent += 1
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self._sender.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), 1.0)
+        except Exception:
+            pass  # already gone, or a half-open socket that cannot be told
+
+    def stats(self, now: float) -> dict:
+        age = max(now - self.connected_at, 1e-9)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "received": self.received,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "rx_per_s": self.received / age,
+            "tx_per_s": self.sent / age,
+            "idle_s": now - self.last_seen,
+            "answers_pings": self.answers_pings,
+            "connected_s": age,
+        }
+
+
+class ConnectionRegistry:
+    """Open RPi connections, pinged and reaped by one background task.
+
+    Every `ping_interval` seconds each device gets `{"type": "ping"}` (the RPi
+    answers `{"type": "pong"}`); a device that has sent nothing for
+    `ping_timeout` seconds is closed and unregistered, which catches half-open
+    sockets a clean disconnect never reports. Only devices that have answered
+    a ping at least once are reaped: older firmware ignores the message and
+    may stay quiet for long, so its sockets are left to the protocol-level
+    pings of the ASGI server (uvicorn's `--ws-ping-interval`).
+    """
+
+    def __init__(self, ping_interval: float, ping_timeout: float, max_queue: int):
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.max_queue = max_queue
+        self._connections = {}  # device_id -> DeviceConnection
+        self._on_close = []
+        self._task = None
+        self.opened = 0
+        self.reaped = 0
+
+    def on_close(self, callback):
+        """Call `callback(conn)` whenever a connection goes away."""
+        self._on_close.append(callback)
+
+    def open(self, device_id: str, websocket) -> DeviceConnection:
+        previous = self._connections.get(device_id)
+        if previous is not None:
+            self._drop(previous, code=1012)  # superseded by a reconnect
+        conn = DeviceConnection(device_id, websocket, self.max_queue, self._dead)
+        self._connections[device_id] = conn
+        self.opened += 1
+        return conn
+
+    def close(self, conn: DeviceConnection):
+        """The socket handler is done with `conn`."""
+        self._drop(conn)
+
+    def _dead(self, conn: DeviceConnection):
+        self.reaped += 1
+        self._drop(conn, code=1011)
+
+    def _drop(self, conn: DeviceConnection, code: int = 1000):
+        if self._connections.get(conn.device_id) is conn:
+            del self._connections[conn.device_id]
+        if conn.closed:
+            return
+        for callback in self._on_close:
+            callback(conn)
+        asyncio.get_running_loop().create_task(conn.close(code))
+
+    def start(self):
+        self._task = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        for conn in list(self._connections.values()):
+            self._drop(conn, code=1001)
+
+    async def _reap(self):
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            now = time.monotonic()
+            for conn in list(self._connections.values()):
+                if conn.answers_pings and now - conn.last_seen > self.ping_timeout:
+                    l.iprint(f"Reaping silent RPi {conn.device_id}")
+                    self._dead(conn)
+                    continue
+                try:
+                    await conn.send(ping)
+                except ConnectionError:
+                    pass
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def stats(self, detail: bool = False) -> dict:
+        now = time.monotonic()
+        per_device = {d: c.stats(now) for d, c in self._connections.items()}
+        data = {
+            "connected": len(per_device),
+            "opened": self.opened,
+            "reaped": self.reaped,
+            "rx_per_s": sum(s["rx_per_s"] for s in per_device.values()),
+            "tx_per_s": sum(s["tx_per_s"] for s in per_device.values()),
+            "queued": sum(s["queue_depth"] for s in per_device.values()),
+            "dropped": sum(s["dropped"] for s in per_device.values()),
+        }
+        if detail:
+            data["devices"] = per_device
+        return data
+
+
+device_connections = ConnectionRegistry(
+    settings.ws_ping_interval, settings.ws_ping_timeout, settings.ws_send_queue
+)
+
+registry.add(
+    Gauge(
+        "edl_ws_devices_connected",
+        "RPi WebSocket connections open on this worker.",
+        lambda: len(device_connections),
+    )
+)
+registry.add(
+    Gauge(
+        "edl_ws_send_queue_frames",
+        "Frames queued for RPi sockets, summed over connections.",
+        lambda: device_connections.stats()["queued"],
+    )
+)
+registry.add(
+    Gauge(
+        "edl_ws_messages_per_second",
+        "RPi messages per second averaged over each connection's lifetime.",
+        lambda: {
+            ("rx",): device_connections.stats()["rx_per_s"],
+            ("tx",): device_connections.stats()["tx_per_s"],
+        },
+        ("direction",),
+    )
+)
+registry.add(
+    Gauge(
+        "edl_ws_connections_total",
+        "RPi connections opened, and reaped for silence or failed sends.",
+        lambda: {
+            ("opened",): device_connections.opened,
+            ("reaped",): device_connections.reaped,
+        },
+        ("event",),
+        kind="counter",
+    )
+)
@@ -0,0 +1,139 @@
+"""In-memory directory of `user_auth` credentials and `device_keys` codes."""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from utils.database import run_query
+from utils.sprint import Logger
+
+l = Logger.get_instance(True)
+
+BUCKET = settings.influxdb_bucket
+
+# Incremental refreshes re-read this much history, so points written by other
+# workers just before the previous refresh are not missed.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class CredentialDirectory:
+    """Username and device-code indexes over `user_auth` / `device_keys`.
+
+    Loaded once at startup and updated in place by sign-up, so login and
+    sign-up normally need no InfluxDB read. A lookup miss triggers an
+    incremental refresh (at most one per `min_refresh` seconds) to pick up
+    records written elsewhere, e.g. by another worker. `run_refresher` also
+    refreshes every `min_refresh` seconds, so a user replaced or re-signed up
+    on another worker stops matching here even while lookups keep hitting.
+    """
+
+    def __init__(self, min_refresh: float):
+        self.min_refresh = min_refresh
+        self._devices = {}  # device_id -> (time, username, password)
+        self._users = {}  # username -> device_id
+        self._codes = {}  # device code -> device_id
+        self._since = None  # start of the next incremental refresh
+        self._last_refresh = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def set_user(self, device_id: str, username: str, password: str, at: datetime):
+        """Record a sign-up; a device keeps only its newest user."""
+        current = self._devices.get(device_id)
+        if current is not None:
+            if at < current[0]:
+                return
+            if self._users.get(current[1]) == device_id:
+                del self._users[current[1]]
+        self._devices[device_id] = (at, username, password)
+        owner = self._users.get(username)
+        if owner is None or self._devices[owner][0] <= at:
+            self._users[username] = device_id
+
+    def check(self, username: str, password: str):
+        """Device id of `username` if `password` matches, else None."""
+        device_id = self._users.get(username)
+        if device_id is None or self._devices[device_id][2] != password:
+            return None
+        return device_id
+
+    def device_for_code(self, code: str):
+        return self._codes.get(code)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Load records newer than the previous refresh (everything on the first call).
+
+        Returns False without querying if the last refresh was too recent.
+        """
+        async with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.min_refresh:
+                return False
+            self._last_refresh = time.monotonic()
+            started = datetime.now(timezone.utc)
+            start = "0" if self._since is None else self._since.isoformat()
+            query = f"""
+            from(bucket: "{BUCKET}")
+              |> range(start: {start})
+              |> filter(fn: (r) => r._measurement == "user_auth" or r._measurement == "device_keys")
+            """
+            tables = await run_query(query)
+
+            sign_ups = {}  # (time, device_id) -> {"uname": ..., "password": ...}
+            for table in tables:
+                for record in table.records:
+                    device_id = record.values.get("device_id")
+                    if not device_id:
+                        continue
+                    if record.get_measurement() == "device_keys":
+                        self._codes[record.get_value()] = device_id
+                        continue
+                    fields = sign_ups.setdefault((record.get_time(), device_id), {})
+                    fields[record.get_field()] = record.get_value()
+
+            for (at, device_id), fields in sorted(sign_ups.items()):
+                if "uname" in fields:
+                    self.set_user(device_id, fields["uname"], fields.get("password"), at)
+            self._since = started - REFRESH_OVERLAP
+            return True
+
+    async def run_refresher(self):
+        """Refresh every `min_refresh` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.min_refresh)
+            try:
+                await self.refresh(force=True)
+            except Exception as e:
+                l.eprint(f"Could not refresh credential directory: {e}")
+
+    async def login(self, username: str, password: str):
+        device_id = self.check(username, password)
+        if device_id is None and await self.refresh():
+            device_id = self.check(username, password)
+        return device_id
+
+    async def lookup_code(self, code: str):
+        device_id = self.device_for_code(code)
+        if device_id is None and await self.refresh():
+            device_id = self.device_for_code(code)
+        return device_id
+
+    async def device_for_key(self, key: str):
+        """Device id whose `device_keys` code is `key`, the RPi's own credential."""
+        if not key or not isinstance(key, str):
+            return None
+        return await self.lookup_code(key)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+credential_directory = CredentialDirectory(settings.auth_refresh_interval)
+
+
+async def warm_credentials():
+    """Startup load; on failure the first login or sign-up loads instead."""
+    try:
+        await credential_directory.refresh(force=True)
+        l.iprint(f"Credential directory loaded with {len(credential_directory)} user(s)")
+    except Exception as e:
+        l.eprint(f"Could not load credential directory: {e}")
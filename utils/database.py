@@ -1,11 +1,193 @@
-from influxdb_client import InfluxDBClient
+"""InfluxDB client and the async data-access layer used by every route."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from influxdb_client import Dialect, InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
 from config import settings
+from utils.metrics import (
+    call_site,
+    influx_coalesced,
+    influx_errors,
+    influx_rows,
+    influx_seconds,
+    influx_wait_seconds,
+    record_count,
+)
 
 # Initialize InfluxDB Client
 influxdb_client = InfluxDBClient(
     url=settings.influxdb_url, token=settings.influxdb_token, org=settings.influxdb_org
 )
 
-# Create InfluxDB APIs
-write_api = influxdb_client.write_api()
+# Create InfluxDB APIs. Writes are synchronous so failures surface to the caller;
+# they only ever run on the executor below.
+write_api = influxdb_client.write_api(write_options=SYNCHRONOUS)
 query_api = influxdb_client.query_api()
+
+# The client library is blocking, so every call is pushed onto this pool.
+# Queries and writes get separate limits so a burst of slow Flux queries
+# cannot starve ingestion (and vice versa).
+executor = ThreadPoolExecutor(
+    max_workers=settings.influxdb_max_queries + settings.influxdb_max_writes,
+    thread_name_prefix="influxdb",
+)
+query_slots = asyncio.Semaphore(settings.influxdb_max_queries)
+write_slots = asyncio.Semaphore(settings.influxdb_max_writes)
+
+
+_inflight = {}  # (query, org) -> task running that query
+
+
+async def run_query(
+    query: str, org: str = settings.influxdb_org, site: str = None, share: bool = True
+):
+    """Run a Flux query on the executor and return its tables.
+
+    Concurrent calls with the same query text share one InfluxDB round trip
+    and get the same table objects, which callers must not modify; pass
+    `share=False` for a private result. A caller that is cancelled does not
+    cancel the shared query. Duration and record count are recorded under
+    `site`, which defaults to the calling function.
+    """
+    labels = ("query", site or call_site())
+    if not share:
+        return await _query(query, org, labels)
+    key = (query, org)
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_query(query, org, labels))
+        task.add_done_callback(partial(_forget, key))
+    else:
+        influx_coalesced.inc(labels)
+    return await asyncio.shield(task)
+
+
+def _forget(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here too, in case every caller was cancelled
+
+
+async def _query(query: str, org: str, labels):
+    waited = time.perf_counter()
+    async with query_slots:
+        started = time.perf_counter()
+        influx_wait_seconds.observe(started - waited, ("query",))
+        loop = asyncio.get_running_loop()
+        try:
+            tables = await loop.run_in_executor(
+                executor, partial(query_api.query, query, org=org)
+            )
+        except Exception:
+            influx_errors.inc(labels)
+            raise
+        finally:
+            influx_seconds.observe(time.perf_counter() - started, labels)
+        influx_rows.observe(sum(len(table.records) for table in tables), labels)
+        return tables
+
+
+# Raw CSV: a header row per table schema, no annotation rows.
+CSV_DIALECT = Dialect(header=True, annotations=[])
+
+
+async def run_csv_query(query: str, org: str = settings.influxdb_org, site=None):
+    """Run a Flux query on the executor and return its raw CSV rows.
+
+    Rows are lists of strings, header rows included. Nothing is parsed into
+    records, so callers that build arrays column by column skip that cost.
+    """
+    labels = ("query", site or call_site())
+    waited = time.perf_counter()
+    async with query_slots:
+        started = time.perf_counter()
+        influx_wait_seconds.observe(started - waited, ("query",))
+        loop = asyncio.get_running_loop()
+
+        def read():
+            return list(query_api.query_csv(query, org=org, dialect=CSV_DIALECT))
+
+        try:
+            rows = await loop.run_in_executor(executor, read)
+        except Exception:
+            influx_errors.inc(labels)
+            raise
+        finally:
+            influx_seconds.observe(time.perf_counter() - started, labels)
+        influx_rows.observe(len(rows), labels)
+        return rows
+
+
+async def run_write(
+    record,
+    bucket: str = settings.influxdb_bucket,
+    org: str = settings.influxdb_org,
+    site: str = None,
+):
+    """Write a record (or list of records) to InfluxDB on the executor."""
+    labels = ("write", site or call_site())
+    waited = time.perf_counter()
+    async with write_slots:
+        started = time.perf_counter()
+        influx_wait_seconds.observe(started - waited, ("write",))
+        loop = asyncio.get_running_loop()
+        try:
+            write = partial(write_api.write, bucket=bucket, org=org, record=record)
+            result = await loop.run_in_executor(executor, write)
+        except Exception:
+            influx_errors.inc(labels)
+            raise
+        finally:
+            influx_seconds.observe(time.perf_counter() - started, labels)
+        influx_rows.observe(record_count(record), labels)
+        return result
+
+
+async def stream_query(
+    query: str, org: str = settings.influxdb_org, chunk_size: int = 2000, site=None
+):
+    """Yield lists of up to `chunk_size` FluxRecords as InfluxDB streams them.
+
+    Only one chunk is in memory at a time. The query keeps its slot until the
+    stream is exhausted or closed, since it holds an open HTTP response. The
+    recorded duration covers the whole stream, including the consumer's time.
+    """
+    labels = ("stream", site or call_site())
+    waited = time.perf_counter()
+    async with query_slots:
+        started = time.perf_counter()
+        influx_wait_seconds.observe(started - waited, ("query",))
+        rows = 0
+        loop = asyncio.get_running_loop()
+        try:
+            records = await loop.run_in_executor(
+                executor, partial(query_api.query_stream, query, org=org)
+            )
+        except Exception:
+            influx_errors.inc(labels)
+            influx_seconds.observe(time.perf_counter() - started, labels)
+            raise
+        try:
+            while True:
+                chunk = await loop.run_in_executor(
+                    executor, list, islice(records, chunk_size)
+                )
+                if not chunk:
+                    return
+                rows += len(chunk)
+                yield chunk
+        except Exception:
+            influx_errors.inc(labels)
+            raise
+        finally:
+            influx_seconds.observe(time.perf_counter() - started, labels)
+            influx_rows.observe(rows, labels)
+            close = getattr(records, "close", None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
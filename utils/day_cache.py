@@ -0,0 +1,231 @@
+"""Result cache for queries over past (immutable) IST days."""
+
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import orjson
+from fastapi import Response
+
+from utils.timerange import day_number, today_number
+from config import settings
+
+
+class DayCache:
+    """LRU cache of JSON-able results keyed by (endpoint, device, phase, day, params).
+
+    Values are kept serialised with orjson, so the byte bound is exact, and a
+    hit is handed back as those bytes for the route to send unparsed. With a
+    `path`, entries are also written to an SQLite file that survives restarts
+    and is consulted on a memory miss. Backfilled points for a cached day drop
+    every entry of that device and day via `invalidate`.
+
+    SQLite is only touched from one writer thread, in submission order, so
+    disk reads, inserts and commits never block the event loop.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, path: str = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (serialised value, (device_id, day))
+        self._days = {}  # (device_id, day) -> {key, ...}
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._db = None
+        self._disk = None
+        self._stored = set()  # (device_id, day) with rows on disk
+        self._generations = {}  # (device_id, day) -> invalidations so far
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._disk = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="day-cache"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS day_cache ("
+                "key TEXT PRIMARY KEY, device_id TEXT, day INTEGER, value BLOB)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS day_cache_device_day "
+                "ON day_cache (device_id, day)"
+            )
+            self._db.commit()
+            self._stored.update(
+                self._db.execute("SELECT DISTINCT device_id, day FROM day_cache")
+            )
+
+    @staticmethod
+    def key(endpoint: str, device_id: str, phase: str, day: int, params=()) -> str:
+        return "|".join(map(str, (endpoint, device_id, phase, day, *params)))
+
+    def get(self, key: str):
+        """Serialised value from the memory tier; `load` also consults the disk."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def load(self, key: str):
+        data = self.get(key)
+        if data is not None:
+            return data
+        if self._db is not None:
+            loop = asyncio.get_running_loop()
+            row = await loop.run_in_executor(self._disk, self._select, key)
+            if row is not None:
+                self.disk_hits += 1
+                self._stored.add((row[0], row[1]))
+                self._remember(key, row[0], row[1], row[2])
+                return row[2]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, device_id: str, day: int, data: bytes):
+        self._remember(key, device_id, day, data)
+        if self._db is not None:
+            self._stored.add((device_id, day))
+            self._disk.submit(self._insert, key, device_id, day, data)
+
+    def _select(self, key: str):
+        return self._db.execute(
+            "SELECT device_id, day, value FROM day_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+    def _insert(self, key: str, device_id: str, day: int, data: bytes):
+        self._db.execute(
+            "INSERT OR REPLACE INTO day_cache VALUES (?, ?, ?, ?)",
+            (key, device_id, day, data),
+        )
+        self._db.commit()
+
+    def _remember(self, key: str, device_id: str, day: int, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (data, (device_id, day))
+        self._bytes += len(data)
+        self._days.setdefault((device_id, day), set()).add(key)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        data, day_key = entry
+        self._bytes -= len(data)
+        keys = self._days.get(day_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._days[day_key]
+        return True
+
+    def invalidate(self, device_id: str, days):
+        """Forget every cached result of `device_id` for the given day numbers.
+
+        Days with nothing cached cost a set lookup, so routine backfill of
+        uncached days never reaches SQLite.
+        """
+        stored = []
+        for day in days:
+            # A load already running for this day must not cache what it read.
+            self._generations[(device_id, day)] = (
+                self._generations.get((device_id, day), 0) + 1
+            )
+            dropped = 0
+            for key in list(self._days.get((device_id, day), ())):
+                dropped += self._drop(key)
+            if (device_id, day) in self._stored:
+                self._stored.discard((device_id, day))
+                stored.append(day)
+            else:
+                self.invalidations += dropped
+        if stored:
+            # Every memory entry is also on disk, so the rowcount covers both.
+            self._disk.submit(self._delete, device_id, stored)
+
+    def _delete(self, device_id: str, days):
+        for day in days:
+            self.invalidations += self._db.execute(
+                "DELETE FROM day_cache WHERE device_id = ? AND day = ?",
+                (device_id, day),
+            ).rowcount
+        self._db.commit()
+
+    async def close(self):
+        """Wait for queued disk writes to finish."""
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.shutdown)
+
+    async def cached(
+        self, endpoint: str, device_id: str, phase: str, target_date: date, params, load
+    ):
+        """`await load()` as JSON bytes, cached if `target_date` is a past IST day.
+
+        Empty results give None and are not cached, so a day that gets its
+        first data later is not stuck at 404. Nor is a result whose day was
+        invalidated while it loaded, since it may predate the backfill.
+        """
+        day = day_number(target_date)
+        if day >= today_number():
+            value = await load()
+            return orjson.dumps(value) if value else None
+        key = self.key(endpoint, device_id, phase, day, params)
+        data = await self.load(key)
+        if data is None:
+            generation = self._generations.get((device_id, day), 0)
+            value = await load()
+            if not value:
+                return None
+            data = orjson.dumps(value)
+            if self._generations.get((device_id, day), 0) == generation:
+                self.put(key, device_id, day, data)
+        return data
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "disk": self._db is not None,
+        }
+
+
+def json_object(parts: dict) -> bytes:
+    """A JSON object from `{name: serialised value}`, None becoming null.
+
+    Wraps cached bytes in a response body without parsing them again.
+    """
+    members = (
+        orjson.dumps(str(name)) + b":" + (b"null" if value is None else value)
+        for name, value in parts.items()
+    )
+    return b"{" + b",".join(members) + b"}"
+
+
+def json_response(body: bytes, status_code: int = 200) -> Response:
+    return Response(
+        content=body, status_code=status_code, media_type="application/json"
+    )
+
+
+day_cache = DayCache(
+    settings.day_cache_max_entries,
+    settings.day_cache_max_bytes,
+    settings.day_cache_path or None,
+)
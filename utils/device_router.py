@@ -0,0 +1,453 @@
+"""Routing of commands and status between RPi sockets and HTTP handlers.
+
+Each RPi keeps one WebSocket open to one worker. With a single worker the
+`LocalRouter` is enough; with `uvicorn --workers N` the `UnixSocketRouter`
+lets a `/remote-control` request on any worker reach the socket's owner.
+"""
+
+import asyncio
+import fcntl
+from abc import ABC, abstractmethod
+import itertools
+import json
+import os
+import uuid
+
+from config import settings
+from utils.commands import CommandTracker
+from utils.sprint import Logger
+
+l = Logger.get_instance(True)
+
+
+class DeviceRouter(ABC):
+    """Interface of the routing layer, plus the in-process bookkeeping.
+
+    `register(device_id, send)` is called by the worker holding a device
+    socket, where `send` is a coroutine function taking one text frame.
+    `broadcast(kind, data)` hands JSON-able `data` to the `listen(kind, ...)`
+    handler of every other worker; per-process state fed by ingestion (last
+    values, running analytics, cache invalidation) is kept in step that way.
+    """
+
+    def __init__(self):
+        self._sockets = {}  # device_id -> send(text), for sockets on this worker
+        self._statuses = {}  # device_id -> {"R": ..., "Y": ..., "B": ...}
+        self.worker = uuid.uuid4().hex[:8]
+        self.commands = CommandTracker(self.worker)
+        self.on_publish = None  # set by the live hub: on_publish(device_id, update)
+        self._listeners = {}  # broadcast kind -> handler(data)
+
+    # Whether `publish` reaches other workers (so updates are worth building
+    # even without local subscribers).
+    fans_out = False
+
+    @property
+    def is_leader(self) -> bool:
+        """Whether this worker does the once-per-host jobs (a single worker does)."""
+        return True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def register(self, device_id: str, send):
+        self._sockets[device_id] = send
+        self._statuses.setdefault(device_id, {"R": None, "Y": None, "B": None})
+
+    def unregister(self, device_id: str, send=None):
+        """Forget a socket; with `send`, only if it is still the registered one."""
+        if send is not None and self._sockets.get(device_id) != send:
+            return
+        self._sockets.pop(device_id, None)
+
+    def set_status(self, device_id: str, status: dict):
+        self._statuses[device_id] = status
+
+    async def deliver(self, device_id: str, message: dict) -> bool:
+        """Send `message` over a socket held by this worker."""
+        send = self._sockets.get(device_id)
+        if send is None:
+            return False
+        try:
+            await send(json.dumps(message))
+        except ConnectionError as e:
+            l.eprint(f"Could not send to {device_id}: {e}")
+            return False
+        return True
+
+    @abstractmethod
+    async def send(self, device_id: str, message: dict) -> bool:
+        """Send `message` to the device, wherever its socket is. False if not connected."""
+
+    @abstractmethod
+    async def is_connected(self, device_id: str) -> bool:
+        """Whether the device has a socket open on any worker."""
+
+    @abstractmethod
+    async def get_status(self, device_id: str):
+        """Last reported relay status, or None if unknown."""
+
+    async def request(self, device_id: str, message: dict, timeout: float):
+        """Send `message` with a correlation `id` and track it for `timeout` seconds.
+
+        Returns a future resolved with the device's reply (or failing with
+        `asyncio.TimeoutError`), or None if the device is not connected.
+        """
+        command_id, future = self.commands.new(device_id, timeout)
+        if not await self.send(device_id, {**message, "id": command_id}):
+            self.commands.fail(command_id)
+            return None
+        return future
+
+    def on_reply(self, reply: dict):
+        """Handle a device message carrying the `id` of a command."""
+        command_id = reply.get("id")
+        if self.commands.owns(command_id):
+            self.commands.resolve(command_id, reply)
+        else:
+            self.forward_reply(command_id, reply)
+
+    def forward_reply(self, command_id, reply: dict):
+        """Pass a reply to the worker that issued the command (none locally)."""
+
+    def subscribe(self, device_id: str):
+        """This worker now has live subscribers for `device_id`."""
+
+    def unsubscribe(self, device_id: str):
+        """This worker has no live subscribers for `device_id` any more."""
+
+    def publish(self, device_id: str, update: dict):
+        """Pass a live update to subscribers on other workers (none locally)."""
+
+    def listen(self, kind: str, handler):
+        """Call `handler(data)` for every `kind` broadcast of another worker."""
+        self._listeners[kind] = handler
+
+    def broadcast(self, kind: str, data):
+        """Hand `data` to the `kind` listeners of other workers (none locally)."""
+
+    def _on_broadcast(self, kind: str, data):
+        handler = self._listeners.get(kind)
+        if handler is not None:
+            try:
+                handler(data)
+            except Exception as e:
+                l.eprint(f"Could not apply {kind} broadcast: {e!r}")
+
+
+class LocalRouter(DeviceRouter):
+    """Single-process backend: every socket lives in this worker."""
+
+    async def send(self, device_id: str, message: dict) -> bool:
+        return await self.deliver(device_id, message)
+
+    async def is_connected(self, device_id: str) -> bool:
+        return device_id in self._sockets
+
+    async def get_status(self, device_id: str):
+        return self._statuses.get(device_id)
+
+
+class _Broker:
+    """Registry shared by all workers, served on a Unix socket by one of them.
+
+    Frames are newline-delimited JSON objects with an `op` field. Requests
+    carrying an `id` get a `{"op": "result", "id": ...}` reply.
+    """
+
+    def __init__(self):
+        self.owners = {}  # device_id -> writer of the owning worker
+        self.statuses = {}
+        self.workers = {}  # worker id -> writer, for routing command replies
+        self.subscribers = {}  # device_id -> {writer, ...} with live subscribers
+        self.handlers = {}  # client handler task -> writer
+
+    async def close(self):
+        """Disconnect every client and wait for the handlers to finish."""
+        for writer in self.handlers.values():
+            writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    async def handle(self, reader, writer):
+        self.handlers[asyncio.current_task()] = writer
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                reply = self.dispatch(frame, writer)
+                if reply is not None:
+                    _write(writer, {"op": "result", "id": frame["id"], **reply})
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for device_id, owner in list(self.owners.items()):
+                if owner is writer:
+                    del self.owners[device_id]
+            for worker, owner in list(self.workers.items()):
+                if owner is writer:
+                    del self.workers[worker]
+            for device_id, writers in list(self.subscribers.items()):
+                writers.discard(writer)
+                if not writers:
+                    del self.subscribers[device_id]
+            writer.close()
+            self.handlers.pop(asyncio.current_task(), None)
+
+    def dispatch(self, frame: dict, writer):
+        op, device_id = frame["op"], frame.get("device_id")
+        if op == "hello":
+            self.workers[frame["worker"]] = writer
+        elif op == "reply":
+            owner = self.workers.get(frame["worker"])
+            if owner is not None:
+                _write(owner, {"op": "reply", "reply": frame["reply"]})
+        elif op == "publish":
+            for subscriber in self.subscribers.get(device_id, ()):
+                if subscriber is not writer:
+                    _write(subscriber, frame)
+        elif op == "broadcast":
+            for other in self.handlers.values():
+                if other is not writer:
+                    _write(other, frame)
+        elif op == "subscribe":
+            self.subscribers.setdefault(device_id, set()).add(writer)
+        elif op == "unsubscribe":
+            writers = self.subscribers.get(device_id)
+            if writers is not None:
+                writers.discard(writer)
+                if not writers:
+                    del self.subscribers[device_id]
+        elif op == "register":
+            self.owners[device_id] = writer
+        elif op == "unregister":
+            if self.owners.get(device_id) is writer:
+                del self.owners[device_id]
+        elif op == "status":
+            self.statuses[device_id] = frame["status"]
+        elif op == "send":
+            owner = self.owners.get(device_id)
+            if owner is not None:
+                deliver = {"op": "deliver", "device_id": device_id}
+                _write(owner, {**deliver, "message": frame["message"]})
+            return {"ok": owner is not None}
+        elif op == "query":
+            return {
+                "ok": device_id in self.owners,
+                "status": self.statuses.get(device_id),
+            }
+        return None
+
+
+def _write(writer, frame: dict):
+    writer.write(json.dumps(frame).encode() + b"\n")
+
+
+class UnixSocketRouter(DeviceRouter):
+    """Cross-worker backend using a broker on a Unix socket.
+
+    Every worker tries to take an exclusive `flock` on `<path>.lock`; the one
+    that gets it serves the broker, and all workers (the broker's own
+    included) connect to it as clients. Sockets held by this worker are
+    served directly; anything else is asked of the broker. If the broker's
+    worker exits, its lock is released and another worker takes over, then
+    every client re-registers its devices.
+    """
+
+    REQUEST_TIMEOUT = 2.0
+    RECONNECT_DELAY = 0.2
+    fans_out = True
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._interest = set()  # devices with live subscribers on this worker
+        self._lock_fd = None
+        self._broker = None
+        self._server = None
+        self._writer = None
+        self._results = {}  # request id -> future
+        self._ids = itertools.count()
+        self._task = None
+        self._ready = asyncio.Event()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), self.REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            l.eprint(f"Device router broker not reachable at {self.path}, retrying")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._broker.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the lock
+
+    def _try_become_broker(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                if self._server is None and self._try_become_broker():
+                    # The lock holder owns the path, so a stale file can go.
+                    self._broker = _Broker()
+                    self._server = await asyncio.start_unix_server(
+                        self._broker.handle, path=self.path
+                    )
+                    l.iprint(f"Device router broker listening on {self.path}")
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+
+            self._post({"op": "hello", "worker": self.worker})
+            for device_id in self._interest:
+                self._post({"op": "subscribe", "device_id": device_id})
+            for device_id in self._sockets:
+                status = self._statuses.get(device_id)
+                self._post({"op": "register", "device_id": device_id})
+                self._post({"op": "status", "device_id": device_id, "status": status})
+            self._ready.set()
+            try:
+                while line := await reader.readline():
+                    await self._on_frame(json.loads(line))
+            except (ConnectionError, ValueError):
+                pass
+            self._ready.clear()
+            self._writer = None
+            for future in self._results.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Device router broker lost"))
+            l.eprint("Lost the device router broker, reconnecting")
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    async def _on_frame(self, frame: dict):
+        if frame["op"] == "deliver":
+            try:
+                await self.deliver(frame["device_id"], frame["message"])
+            except Exception as e:
+                l.eprint(f"Could not deliver to {frame['device_id']}: {e}")
+        elif frame["op"] == "publish":
+            if self.on_publish is not None:
+                self.on_publish(frame["device_id"], frame["update"])
+        elif frame["op"] == "broadcast":
+            self._on_broadcast(frame["kind"], frame["data"])
+        elif frame["op"] == "reply":
+            self.commands.resolve(frame["reply"].get("id"), frame["reply"])
+        elif frame["op"] == "result":
+            future = self._results.pop(frame["id"], None)
+            if future is not None and not future.done():
+                future.set_result(frame)
+
+    def _post(self, frame: dict):
+        if self._writer is not None:
+            _write(self._writer, frame)
+
+    async def _request(self, frame: dict) -> dict:
+        if self._writer is None:
+            raise ConnectionError("Device router broker not connected")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._results[request_id] = future
+        _write(self._writer, {**frame, "id": request_id})
+        try:
+            return await asyncio.wait_for(future, self.REQUEST_TIMEOUT)
+        finally:
+            self._results.pop(request_id, None)
+
+    def register(self, device_id: str, send):
+        super().register(device_id, send)
+        self._post({"op": "register", "device_id": device_id})
+
+    def unregister(self, device_id: str, send=None):
+        if send is not None and self._sockets.get(device_id) != send:
+            return
+        super().unregister(device_id)
+        self._post({"op": "unregister", "device_id": device_id})
+
+    def set_status(self, device_id: str, status: dict):
+        super().set_status(device_id, status)
+        self._post({"op": "status", "device_id": device_id, "status": status})
+
+    def subscribe(self, device_id: str):
+        self._interest.add(device_id)
+        self._post({"op": "subscribe", "device_id": device_id})
+
+    def unsubscribe(self, device_id: str):
+        self._interest.discard(device_id)
+        self._post({"op": "unsubscribe", "device_id": device_id})
+
+    def publish(self, device_id: str, update: dict):
+        self._post({"op": "publish", "device_id": device_id, "update": update})
+
+    def broadcast(self, kind: str, data):
+        self._post({"op": "broadcast", "kind": kind, "data": data})
+
+    @property
+    def is_leader(self) -> bool:
+        """The worker serving the broker; another takes over if it exits."""
+        return self._server is not None
+
+    def forward_reply(self, command_id, reply: dict):
+        if isinstance(command_id, str) and "-" in command_id:
+            worker = command_id.split("-", 1)[0]
+            self._post({"op": "reply", "worker": worker, "reply": reply})
+
+    async def send(self, device_id: str, message: dict) -> bool:
+        if device_id in self._sockets:
+            return await self.deliver(device_id, message)
+        try:
+            reply = await self._request(
+                {"op": "send", "device_id": device_id, "message": message}
+            )
+        except (ConnectionError, asyncio.TimeoutError):
+            return False
+        return reply["ok"]
+
+    async def _query(self, device_id: str) -> dict:
+        try:
+            return await self._request({"op": "query", "device_id": device_id})
+        except (ConnectionError, asyncio.TimeoutError):
+            return {"ok": False, "status": None}
+
+    async def is_connected(self, device_id: str) -> bool:
+        if device_id in self._sockets:
+            return True
+        return (await self._query(device_id))["ok"]
+
+    async def get_status(self, device_id: str):
+        if device_id in self._sockets:
+            return self._statuses.get(device_id)
+        return (await self._query(device_id))["status"]
+
+
+def create_router(backend: str, path: str) -> DeviceRouter:
+    if backend == "local":
+        return LocalRouter()
+    if backend == "unix":
+        return UnixSocketRouter(path)
+    raise ValueError(f"Unknown DEVICE_ROUTER backend '{backend}', use local or unix")
+
+
+device_router = create_router(settings.device_router, settings.device_router_socket)
@@ -0,0 +1,83 @@
+"""Flux window selection and LTTB decimation for history endpoints."""
+
+import math
+import re
+
+AGGREGATES = ("mean", "min", "max")
+MODES = ("aggregate", "lttb")
+
+MAX_POINTS = 10_000  # hard cap on rows per phase when downsampling
+LTTB_MAX_INPUT = 20_000  # rows per phase fetched before LTTB decimation
+
+_DURATION = re.compile(r"^(\d+)(s|m|h|d)$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_every(every: str) -> int:
+    """Parse a simple Flux duration (`30s`, `5m`, `1h`, `1d`) into seconds."""
+    match = _DURATION.match(every.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{every}', use e.g. 30s, 5m, 1h")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def window_seconds(range_seconds: int, points: int = None, every: str = None) -> int:
+    """Pick the aggregation window for a range.
+
+    `points` asks for about that many windows; `every` asks for a fixed
+    window, widened if it would yield more than `MAX_POINTS` rows. Returns
+    None when raw data was requested.
+    """
+    if points is not None:
+        points = min(points, MAX_POINTS)
+        return max(1, math.ceil(range_seconds / points))
+    if every is not None:
+        return max(parse_every(every), math.ceil(range_seconds / MAX_POINTS))
+    return None
+
+
+def lttb_input_window(range_seconds: int) -> int:
+    """Pre-aggregation window keeping LTTB input under `LTTB_MAX_INPUT` rows."""
+    return max(1, math.ceil(range_seconds / LTTB_MAX_INPUT))
+
+
+def aggregate_window(seconds: int, fn: str = "mean") -> str:
+    """Flux `aggregateWindow` stage for a window in seconds (empty if None)."""
+    if not seconds or seconds <= 1:
+        return ""
+    return f"|> aggregateWindow(every: {seconds}s, fn: {fn}, createEmpty: false)"
+
+
+def lttb(xs: list, ys: list, threshold: int) -> list:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` shape-preserving points.
+
+    `xs` must be increasing. `None` values in `ys` are treated as 0.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    ys = [0.0 if y is None else y for y in ys]
+
+    selected = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex.
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
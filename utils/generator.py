@@ -1,32 +1,308 @@
-"""Module that generates the data for db"""
+"""Synthetic three-phase `power_data` for seeding InfluxDB and load tests.
 
-import csv
-import random
-from datetime import datetime, timedelta
+    python -m utils.generator --days 1 --format lp --output seed.lp
+    python -m utils.generator --devices 50 --days 7 --format csv | gzip > seed.csv.gz
+    python -m utils.generator --minutes 10 --format post --device-key $KEY
 
-CSV_FILENAME = "sensor_data.csv"
+Every device produces one sample per phase per `1 / rate` seconds with all ten
+`POWER_FIELDS`, generated with NumPy an hour (`--chunk`) at a time so memory
+stays flat however long the range is. The load follows an IST daily profile
+with appliances switching on and off; voltage sags under load, frequency is
+shared by the three phases and energy is the running integral of power.
 
-NUM_POINTS = 500  # Generates 500 random data points over the last 24 hours
+`lp` is InfluxDB line protocol (usable with `influx write`), `csv` has one
+row per sample with epoch-ns `time`, and `post` sends batches to
+`/api/write-data` as the binary columnar body (`--post-format json` for the
+JSON one) to `--url`. The server files posted batches under the device
+that `--device-key` (its `device_keys` code) belongs to, so `post` takes a
+single device.
+"""
 
-time_now = datetime.utcnow()
-time_start = time_now - timedelta(hours=24)
+import argparse
+import gzip
+import sys
+import time
+from datetime import datetime, timedelta, timezone
 
-with open(CSV_FILENAME, mode="w", newline="") as file:
-    writer = csv.writer(file)
+import numpy as np
 
-    # Write CSV header
-    writer.writerow(["time", "device_id", "I", "V", "P"])
+from utils.binary_ingest import CONTENT_TYPE as BINARY_CONTENT_TYPE
+from utils.binary_ingest import pack_power_buffers
+from utils.line_protocol import MEASUREMENT, POWER_FIELDS, escape_tag
 
-    # Generate random data points
-    for _ in range(NUM_POINTS):
-        timestamp = time_start + timedelta(
-            seconds=random.randint(0, 86400)
-        )  # Random time in last 24hrs
-        I = round(random.uniform(0.1, 10.0), 2)  # Random float for Current (I)
-        V = round(random.uniform(110.0, 250.0), 2)  # Random float for Voltage (V)
-        P = round(I * V, 2)  # Power (P = I * V)
+PHASES = b"RYB"
+IST = timezone(timedelta(hours=5, minutes=30))
 
-        # Write to CSV
-        writer.writerow([timestamp.isoformat(), "random12", I, V, P])
+# Loads (A) an appliance switch can land on, and the chance of a switch per second.
+APPLIANCE_LOADS = np.array([0.0, 0.0, 0.4, 1.2, 2.5, 4.0, 7.5])
+SWITCH_RATE = 1 / 900
 
-print(f"Data written to {CSV_FILENAME}")
+# Decimals kept per field, so the text formats stay compact.
+DECIMALS = {
+    "power_watt": 2,
+    "power_var": 2,
+    "power_va": 2,
+    "voltage_rms": 2,
+    "current_rms": 3,
+    "power_factor": 3,
+    "voltage_thd": 2,
+    "current_thd": 2,
+    "energy_kwh": 5,
+    "voltage_freq": 3,
+}
+
+
+class DeviceSimulator:
+    """Readings of one device, continuous across consecutive `chunk()` calls."""
+
+    def __init__(self, device_id: str, rate: float = 1.0, seed: int = None):
+        self.device_id = device_id
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        # Per-device character: how big the household is and how it is wired.
+        self.scale = self.rng.uniform(0.6, 1.8)
+        self.phase_share = self.rng.dirichlet([4, 4, 4]) * 3
+        self.voltage_phase = self.rng.uniform(0, 2 * np.pi)
+        self.levels = self.rng.choice(APPLIANCE_LOADS, 3)
+        self.energy = self.rng.uniform(0, 500, 3)
+
+    def _daily_profile(self, seconds: np.ndarray) -> np.ndarray:
+        """Base load (A) by IST hour: night floor, morning and evening peaks."""
+        hour = (seconds / 3600 + 5.5) % 24
+        return (
+            0.3
+            + 1.2 * np.exp(-((hour - 8) ** 2) / 2)
+            + 2.0 * np.exp(-((hour - 20) ** 2) / 4)
+        )
+
+    def _appliances(self, phase: int, n: int) -> np.ndarray:
+        """Piecewise-constant appliance load, carried over from the last chunk."""
+        switches = self.rng.random(n) < SWITCH_RATE / self.rate
+        levels = np.concatenate(
+            ([self.levels[phase]], self.rng.choice(APPLIANCE_LOADS, switches.sum()))
+        )
+        load = levels[np.cumsum(switches)]
+        self.levels[phase] = load[-1]
+        return load
+
+    def chunk(self, start_ns: int, n: int):
+        """`n` timestamps from `start_ns`, as `(phases, times, columns)`.
+
+        Samples are interleaved R, Y, B per timestamp, as the RPi sends
+        them. `times` is int64 epoch ns and `columns` one float64 array per
+        entry of `POWER_FIELDS`.
+        """
+        rng = self.rng
+        step_ns = int(1e9 / self.rate)
+        ts = start_ns + np.arange(n, dtype=np.int64) * step_ns
+        seconds = ts / 1e9
+        base = self._daily_profile(seconds) * self.scale
+        freq = (
+            50
+            + 0.03 * np.sin(2 * np.pi * seconds / 900)
+            + rng.normal(0, 0.01, n)
+        )
+        fields = {name: np.empty((n, 3)) for name in POWER_FIELDS}
+
+        current = np.empty((n, 3))
+        for phase in range(3):
+            current[:, phase] = np.maximum(
+                base * self.phase_share[phase] * (1 + rng.normal(0, 0.05, n))
+                + self._appliances(phase, n),
+                0.02,
+            )
+        total = current.sum(axis=1)
+        angle = 2 * np.pi * seconds / 86400 + self.voltage_phase
+        for phase in range(3):
+            i = current[:, phase]
+            v = (
+                230
+                + 5 * np.sin(angle + phase)
+                - 0.25 * i
+                + rng.normal(0, 0.6, n)
+            )
+            pf = np.clip(0.97 - 0.12 * np.exp(-i / 2) + rng.normal(0, 0.01, n), 0.5, 1)
+            va = v * i
+            watt = va * pf
+            energy = self.energy[phase] + np.cumsum(watt) / self.rate / 3.6e6
+            self.energy[phase] = energy[-1]
+
+            fields["voltage_rms"][:, phase] = v
+            fields["current_rms"][:, phase] = i
+            fields["power_factor"][:, phase] = pf
+            fields["power_va"][:, phase] = va
+            fields["power_watt"][:, phase] = watt
+            fields["power_var"][:, phase] = np.sqrt(np.maximum(va**2 - watt**2, 0))
+            fields["energy_kwh"][:, phase] = energy
+            fields["voltage_thd"][:, phase] = np.clip(
+                1.5 + 0.04 * total + rng.normal(0, 0.1, n), 0.5, 8
+            )
+            fields["current_thd"][:, phase] = np.clip(
+                6 + 30 * np.exp(-i / 1.5) + rng.normal(0, 0.8, n), 1, 80
+            )
+            fields["voltage_freq"][:, phase] = freq
+
+        phases = PHASES * n
+        times = np.repeat(ts, 3).astype("<i8")
+        columns = [
+            np.round(fields[name].ravel(), DECIMALS[name]).astype("<f8")
+            for name in POWER_FIELDS
+        ]
+        return phases, times, columns
+
+
+def generate(device_ids, start: datetime, seconds: int, rate=1.0, chunk=3600, seed=0):
+    """Yield `(device_id, phases, times, columns)` chunks, device by device."""
+    start_ns = int(start.timestamp()) * 10**9
+    total = int(seconds * rate)
+    step = max(int(chunk * rate), 1)
+    for index, device_id in enumerate(device_ids):
+        device_seed = None if seed is None else seed + index
+        simulator = DeviceSimulator(device_id, rate, device_seed)
+        for offset in range(0, total, step):
+            n = min(step, total - offset)
+            first = start_ns + int(offset * 1e9 / rate)
+            yield (device_id, *simulator.chunk(first, n))
+
+
+# Fixed decimals are about twice as fast to format as `%r`, and the values
+# are always finite, so the text formats skip the ingest encoder.
+_FIELDS_TEMPLATE = ",".join(f"%.{DECIMALS[name]}f" for name in POWER_FIELDS)
+_LP_FIELDS_TEMPLATE = ",".join(
+    f"{name}=%.{DECIMALS[name]}f" for name in POWER_FIELDS
+)
+CSV_HEADER = ",".join(("time", "device_id", "phase") + POWER_FIELDS) + "\n"
+
+
+def to_line_protocol(device_id, phases, times, columns) -> bytes:
+    tag = f"{MEASUREMENT},device_id={escape_tag(device_id)},phase="
+    template = tag.replace("%", "%%") + "%s " + _LP_FIELDS_TEMPLATE + " %d"
+    rows = zip(phases.decode(), *(c.tolist() for c in columns), times.tolist())
+    return ("\n".join([template % row for row in rows]) + "\n").encode()
+
+
+def csv_field(value: str) -> str:
+    """Quote a CSV field containing a separator, quote or newline."""
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def to_csv(device_id, phases, times, columns) -> bytes:
+    # The id goes in through the template, so `%` in it must be doubled.
+    device = csv_field(device_id).replace("%", "%%")
+    template = "%d," + device + ",%s," + _FIELDS_TEMPLATE
+    rows = zip(times.tolist(), phases.decode(), *(c.tolist() for c in columns))
+    return ("\n".join([template % row for row in rows]) + "\n").encode()
+
+
+def to_json_samples(phases, times, columns) -> list:
+    names = ("time", "phase") + POWER_FIELDS
+    rows = zip(times.tolist(), phases.decode(), *(c.tolist() for c in columns))
+    return [dict(zip(names, row)) for row in rows]
+
+
+def post_batches(
+    chunks, url: str, batch: int, body_format: str, device_key=None, compress=False
+):
+    """POST every chunk to `/write-data` in batches of `batch` samples."""
+    import orjson
+    import requests
+
+    session = requests.Session()
+    headers = {}
+    if device_key:
+        headers["X-Device-Key"] = device_key
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    sent = 0
+    for _, phases, times, columns in chunks:
+        for i in range(0, len(phases), batch):
+            end = i + batch
+            part = (phases[i:end], times[i:end], [c[i:end] for c in columns])
+            if body_format == "binary":
+                body = pack_power_buffers(*part)
+                content_type = BINARY_CONTENT_TYPE
+            else:
+                body = orjson.dumps(to_json_samples(*part))
+                content_type = "application/json"
+            if compress:
+                body = gzip.compress(body, 1)
+            response = session.post(
+                url, data=body, headers={**headers, "Content-Type": content_type}
+            )
+            response.raise_for_status()
+            sent += len(part[0])
+    return sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--device-ids", nargs="+", help="default: random12")
+    parser.add_argument("--devices", type=int, help="simulate sim0001..simNNNN")
+    parser.add_argument("--start", help="YYYY-MM-DD (IST) or ISO time; default: now - range")
+    parser.add_argument("--days", type=float, default=0)
+    parser.add_argument("--hours", type=float, default=0)
+    parser.add_argument("--minutes", type=float, default=0)
+    parser.add_argument("--rate", type=float, default=1.0, help="samples/s per phase")
+    parser.add_argument("--chunk", type=int, default=3600, help="seconds per NumPy batch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("lp", "csv", "post"), default="lp")
+    parser.add_argument("--output", default="-", help="file for lp/csv, - for stdout")
+    parser.add_argument("--url", default="http://localhost:8000/api/write-data")
+    parser.add_argument("--post-format", choices=("binary", "json"), default="binary")
+    parser.add_argument("--batch", type=int, default=3000, help="samples per POST")
+    parser.add_argument("--gzip", action="store_true", help="gzip the POST bodies")
+    parser.add_argument("--device-key", help="device code sent with the POSTs")
+    args = parser.parse_args(argv)
+
+    seconds = int(args.days * 86400 + args.hours * 3600 + args.minutes * 60) or 86400
+    if args.device_ids:
+        device_ids = args.device_ids
+    elif args.devices:
+        device_ids = [f"sim{i:04d}" for i in range(1, args.devices + 1)]
+    else:
+        device_ids = ["random12"]
+    if args.format == "post" and len(device_ids) > 1:
+        parser.error(
+            "--format post takes one device: the server files every batch under "
+            "the device of --device-key"
+        )
+    if args.start is None:
+        start = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    elif len(args.start) == 10:
+        start = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=IST)
+    else:
+        start = datetime.fromisoformat(args.start)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+
+    chunks = generate(device_ids, start, seconds, args.rate, args.chunk, args.seed)
+    started = time.perf_counter()
+    if args.format == "post":
+        count = post_batches(
+            chunks, args.url, args.batch, args.post_format, args.device_key, args.gzip
+        )
+    else:
+        encode = to_line_protocol if args.format == "lp" else to_csv
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        count = 0
+        try:
+            if args.format == "csv":
+                out.write(CSV_HEADER.encode())
+            for device_id, phases, times, columns in chunks:
+                out.write(encode(device_id, phases, times, columns))
+                count += len(phases)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{count} samples for {len(device_ids)} device(s) in {elapsed:.1f} s "
+        f"({count / elapsed:,.0f}/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
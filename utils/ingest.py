@@ -0,0 +1,283 @@
+"""In-process ingestion queue that batches writes from every device."""
+
+import asyncio
+import time
+from collections import deque
+
+from influxdb_client.rest import ApiException
+
+from config import settings
+from utils.database import run_write
+from utils.line_protocol import join_lines
+from utils.metrics import Gauge, registry
+from utils.sprint import Logger
+
+l = Logger.get_instance(True)
+
+
+class IngestQueueFull(Exception):
+    """Raised when accepting a request would exceed the pending-point limit."""
+
+
+def is_rejection(error: Exception) -> bool:
+    """True for InfluxDB 4xx answers, which fail the same way on every retry.
+
+    429 (rate limited) is a 4xx worth retrying, so it does not count.
+    """
+    if not isinstance(error, ApiException) or error.status is None:
+        return False
+    return 400 <= error.status < 500 and error.status != 429
+
+
+class Receipt:
+    """Outcome of one tracked `submit()`, settled as its records leave the queue.
+
+    `done` resolves to `{"written": n, "dropped": n, "invalid": n}` once every
+    record was written, dropped after its retries or rejected by InfluxDB.
+    """
+
+    __slots__ = ("remaining", "outcome", "done")
+
+    def __init__(self, count: int):
+        self.remaining = count
+        self.outcome = {"written": 0, "dropped": 0, "invalid": 0}
+        self.done = asyncio.get_running_loop().create_future()
+
+    def settle(self, outcome: str, count: int):
+        self.outcome[outcome] += count
+        self.remaining -= count
+        if self.remaining <= 0 and not self.done.done():
+            self.done.set_result(self.outcome)
+
+
+class IngestPipeline:
+    """Merges submitted line-protocol records into size- and time-bounded batches.
+
+    Routes call `submit()`, which only appends to an in-memory buffer. A single
+    background task drains the buffer, writing a batch as soon as
+    `batch_size` records are pending or the oldest pending record has waited
+    `flush_interval` seconds. `submit()` raises `IngestQueueFull` once
+    `max_pending` records are waiting, so callers can shed load. With
+    `track=True` it returns a `Receipt` for callers that must know when
+    their records are stored.
+    """
+
+    RATE_WINDOW = 60  # seconds of history used for the throughput figures
+
+    def __init__(
+        self,
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+        max_pending: int = 100_000,
+        max_retries: int = 3,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._chunks = deque()
+        self._pending = 0
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+        self._started_at = time.monotonic()
+        self._written_log = deque()  # (monotonic time, points) per batch
+        self.counters = {
+            "requests_accepted": 0,
+            "requests_rejected": 0,
+            "points_accepted": 0,
+            "points_rejected": 0,
+            "points_written": 0,
+            "points_dropped": 0,
+            "points_invalid": 0,
+            "batches_written": 0,
+            "write_failures": 0,
+        }
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, records: list, track: bool = False):
+        """Queue records for the next batch; never touches InfluxDB."""
+        count = len(records)
+        if self._closing or self._pending + count > self.max_pending:
+            self.counters["requests_rejected"] += 1
+            self.counters["points_rejected"] += count
+            raise IngestQueueFull(f"{self._pending} points already pending")
+
+        receipt = Receipt(count) if track and count else None
+        self._chunks.append((records, receipt))
+        self._pending += count
+        self.counters["requests_accepted"] += 1
+        self.counters["points_accepted"] += count
+        if self._pending >= self.batch_size:
+            self._batch_ready.set()
+        return receipt
+
+    def start(self):
+        """Start the background writer on the running loop."""
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting records and flush everything still pending."""
+        self._closing = True
+        self._batch_ready.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def _take(self, limit: int) -> tuple:
+        """Pop up to `limit` records from the front of the buffer.
+
+        Also returns `(receipt, offset, count)` for the tracked records in it.
+        """
+        batch, receipts = [], []
+        while self._chunks and len(batch) < limit:
+            chunk, receipt = self._chunks.popleft()
+            room = limit - len(batch)
+            if len(chunk) > room:
+                self._chunks.appendleft((chunk[room:], receipt))
+                chunk = chunk[:room]
+            if receipt is not None:
+                receipts.append((receipt, len(batch), len(chunk)))
+            batch.extend(chunk)
+        self._pending -= len(batch)
+        return batch, receipts
+
+    @staticmethod
+    def _settle(receipts, outcome: str, start: int, stop: int):
+        """Settle the tracked records among positions `start:stop` of a batch."""
+        for receipt, offset, count in receipts:
+            first, last = max(offset, start), min(offset + count, stop)
+            if last > first:
+                receipt.settle(outcome, last - first)
+
+    async def _write(self, batch: list, receipts=(), start: int = 0):
+        """Write a batch, retrying server and connection errors with backoff.
+
+        A 4xx rejection is not retried: the batch is split in halves until
+        the points InfluxDB refuses are isolated and dropped, so the valid
+        points around them are still written. `start` is the position of
+        `batch` in the batch `receipts` refer to.
+        """
+        stop = start + len(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                await run_write(join_lines(batch))
+            except Exception as e:
+                self.counters["write_failures"] += 1
+                if is_rejection(e):
+                    await self._split(batch, receipts, start, e)
+                    return
+                l.eprint(
+                    f"Ingest batch of {len(batch)} points failed "
+                    f"(attempt {attempt + 1}): {e}"
+                )
+                if attempt < self.max_retries:
+                    await asyncio.sleep(min(2**attempt, 10))
+                continue
+            self.counters["points_written"] += len(batch)
+            self.counters["batches_written"] += 1
+            self._written_log.append((time.monotonic(), len(batch)))
+            self._trim_log()
+            self._settle(receipts, "written", start, stop)
+            return
+        self.counters["points_dropped"] += len(batch)
+        self._settle(receipts, "dropped", start, stop)
+
+    async def _split(self, batch: list, receipts, start: int, error: Exception):
+        if len(batch) == 1:
+            self.counters["points_invalid"] += 1
+            l.eprint(f"Dropping point rejected by InfluxDB: {error}", sampled=True)
+            self._settle(receipts, "invalid", start, start + 1)
+            return
+        middle = len(batch) // 2
+        await self._write(batch[:middle], receipts, start)
+        await self._write(batch[middle:], receipts, start + middle)
+
+    async def _run(self):
+        while True:
+            if self._pending < self.batch_size and not self._closing:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), timeout=self.flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+
+            # Drain full batches first, then whatever is left after the timeout.
+            while self._pending:
+                await self._write(*self._take(self.batch_size))
+                if self._pending < self.batch_size and not self._closing:
+                    break
+
+            if self._closing and not self._pending:
+                return
+
+    def _trim_log(self):
+        cutoff = time.monotonic() - self.RATE_WINDOW
+        while self._written_log and self._written_log[0][0] < cutoff:
+            self._written_log.popleft()
+
+    def stats(self) -> dict:
+        """Counters plus recent and lifetime write throughput."""
+        self._trim_log()
+        now = time.monotonic()
+        window = min(self.RATE_WINDOW, now - self._started_at) or 1.0
+        recent = sum(points for _, points in self._written_log)
+        batches = self.counters["batches_written"]
+        return {
+            **self.counters,
+            "pending_points": self._pending,
+            "max_pending": self.max_pending,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "avg_batch_points": (
+                self.counters["points_written"] / batches if batches else 0
+            ),
+            "points_per_sec_recent": recent / window,
+            "points_per_sec_lifetime": self.counters["points_written"]
+            / max(now - self._started_at, 1e-9),
+            "uptime_sec": now - self._started_at,
+        }
+
+
+pipeline = IngestPipeline(
+    batch_size=settings.ingest_batch_size,
+    flush_interval=settings.ingest_flush_interval,
+    max_pending=settings.ingest_max_pending,
+    max_retries=settings.ingest_max_retries,
+)
+
+registry.add(
+    Gauge(
+        "edl_ingest_points_per_second",
+        "Points written to InfluxDB per second over the last minute.",
+        lambda: pipeline.stats()["points_per_sec_recent"],
+    )
+)
+registry.add(
+    Gauge(
+        "edl_ingest_pending_points",
+        "Points accepted but not yet written.",
+        lambda: pipeline._pending,
+    )
+)
+registry.add(
+    Gauge(
+        "edl_ingest_points_total",
+        "Ingest point counters by outcome.",
+        lambda: {
+            (outcome,): pipeline.counters[f"points_{outcome}"]
+            for outcome in ("accepted", "rejected", "written", "dropped", "invalid")
+        },
+        ("outcome",),
+        kind="counter",
+    )
+)
@@ -0,0 +1,128 @@
+"""In-memory store of the newest `power_data` sample per device and phase."""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from utils.database import run_query
+from utils.line_protocol import POWER_FIELDS
+from utils.sprint import Logger
+
+l = Logger.get_instance(True)
+
+BUCKET = settings.influxdb_bucket
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def ns_to_datetime(ts: int) -> datetime:
+    """Epoch nanoseconds to an aware UTC datetime (microsecond precision)."""
+    return _EPOCH + timedelta(microseconds=ts // 1000)
+
+
+def _datetime_to_ns(dt: datetime) -> int:
+    return (dt - _EPOCH) // timedelta(microseconds=1) * 1000
+
+
+class LastValueStore:
+    """Newest sample per (device, phase), kept current by the ingestion path.
+
+    Values are stored as `(epoch_ns, values)` with `values` in `POWER_FIELDS`
+    order, exactly as the line-protocol encoder reports them, so updating is a
+    dict assignment per phase and reading never touches InfluxDB.
+
+    Devices InfluxDB has no samples for are remembered for `miss_ttl`
+    seconds, so polling an unknown or silent device does not cost a Flux
+    query per request.
+    """
+
+    def __init__(self, miss_ttl: float = 30):
+        self.miss_ttl = miss_ttl
+        self._devices = {}  # device_id -> {phase: (epoch_ns, values)}
+        self._misses = {}  # device_id -> monotonic time its miss expires
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def update(self, device_id: str, latest: dict):
+        """Merge `{phase: (epoch_ns, values)}`, keeping the newer sample per phase."""
+        phases = self._devices.setdefault(device_id, {})
+        self._misses.pop(device_id, None)
+        for phase, sample in latest.items():
+            current = phases.get(phase)
+            if current is None or sample[0] >= current[0]:
+                phases[phase] = sample
+
+    def get(self, device_id: str) -> dict:
+        """Return `{phase: {"time": datetime, <field>: value, ...}}` for a device."""
+        return {
+            phase: {"time": ns_to_datetime(ts), **dict(zip(POWER_FIELDS, values))}
+            for phase, (ts, values) in self._devices.get(device_id, {}).items()
+        }
+
+    async def load(self, device_ids: list = None):
+        """Fill the store from InfluxDB with `last()` per device and phase.
+
+        Loads every device when `device_ids` is None (startup warm-up), or only
+        the listed devices on a cache miss. Returns the devices found.
+        """
+        device_filter = ""
+        if device_ids is not None:
+            wanted = ", ".join(f'"{d}"' for d in device_ids)
+            device_filter = (
+                f"|> filter(fn: (r) => contains(value: r.device_id, set: [{wanted}]))"
+            )
+        query = f"""
+        from(bucket: "{BUCKET}")
+          |> range(start: -1y)
+          |> filter(fn: (r) => r._measurement == "power_data")
+          {device_filter}
+          |> last()
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        """
+        tables = await run_query(query)
+
+        found = set()
+        for table in tables:
+            for record in table.records:
+                device_id = record.values.get("device_id")
+                phase = record.values.get("phase")
+                if not device_id or not phase:
+                    continue
+                values = tuple(record.values.get(name) for name in POWER_FIELDS)
+                self.update(device_id, {phase: (_datetime_to_ns(record.get_time()), values)})
+                found.add(device_id)
+        return found
+
+    async def ensure(self, device_ids: list) -> list:
+        """Load any of `device_ids` not yet in the store; return those still missing."""
+        now = time.monotonic()
+        missing = [
+            d
+            for d in device_ids
+            if d not in self._devices and self._misses.get(d, 0) <= now
+        ]
+        if missing:
+            found = await self.load(missing)
+            now = time.monotonic()
+            if len(self._misses) > 10_000:
+                self._misses = {d: t for d, t in self._misses.items() if t > now}
+            for device_id in missing:
+                if device_id not in found and device_id not in self._devices:
+                    self._misses[device_id] = now + self.miss_ttl
+        return [d for d in device_ids if d not in self._devices]
+
+
+last_values = LastValueStore(settings.last_values_miss_ttl)
+
+
+async def warm_last_values():
+    """Startup warm-up; a failure only means the first reads fall back to InfluxDB."""
+    try:
+        devices = await last_values.load()
+        l.iprint(f"Last-value cache warmed for {len(devices)} device(s)")
+    except Exception as e:
+        l.eprint(f"Could not warm last-value cache: {e}")
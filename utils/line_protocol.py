@@ -0,0 +1,183 @@
+"""Fast-path line-protocol encoder for the `power_data` measurement."""
+
+import math
+from datetime import datetime, timedelta, timezone
+
+MEASUREMENT = "power_data"
+
+# Field order written for every sample; this is the schema the RPis send.
+POWER_FIELDS = (
+    "power_watt",
+    "power_var",
+    "power_va",
+    "voltage_rms",
+    "current_rms",
+    "power_factor",
+    "voltage_thd",
+    "current_thd",
+    "energy_kwh",
+    "voltage_freq",
+)
+
+_FIELD_TEMPLATE = ",".join(f"{name}=%r" for name in POWER_FIELDS)
+# float32 columns carry ~7 significant digits; don't print the widening noise.
+_FIELD_TEMPLATE_F32 = ",".join(f"{name}=%.7g" for name in POWER_FIELDS)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+
+
+class SchemaError(ValueError):
+    """Raised when a sample does not carry the fixed `power_data` schema."""
+
+
+def phase_tag(value) -> str:
+    """Escaped `phase` tag value; empty values and control characters raise.
+
+    Line protocol has no empty tags and no escape for newlines.
+    """
+    value = "" if value is None else str(value)
+    if not value or any(ord(c) < 0x20 or ord(c) == 0x7F for c in value):
+        raise SchemaError(f"Invalid phase: {value!r}")
+    return escape_tag(value)
+
+
+def escape_tag(value: str) -> str:
+    """Escape a tag key/value for line protocol."""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace(",", "\\,")
+        .replace("=", "\\=")
+        .replace(" ", "\\ ")
+    )
+
+
+def now_ns() -> int:
+    """Current UTC time in epoch nanoseconds."""
+    return (datetime.now(timezone.utc) - _EPOCH) // _ONE_US * 1000
+
+
+def to_epoch_ns(value, default: int) -> int:
+    """Convert an epoch-ns integer or ISO-8601 string to epoch ns.
+
+    Naive ISO strings are taken as UTC, as the `Point` path did. Anything
+    missing or unparsable falls back to `default`.
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return default
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return (dt - _EPOCH) // _ONE_US * 1000
+    return default
+
+
+def _finite_fields(values, template: str = "%r") -> str:
+    """Slow path for samples carrying NaN/inf, which line protocol cannot store."""
+    return ",".join(
+        f"{name}={template % value}"
+        for name, value in zip(POWER_FIELDS, values)
+        if math.isfinite(value)
+    )
+
+
+def encode_power_lines(
+    samples: list, device_id: str, default_ns: int = None, observe=None
+) -> list:
+    """Encode `power_data` samples into one line-protocol string per sample.
+
+    The schema is checked once against the first sample; a later sample
+    missing the `phase` tag or a field, or carrying a non-numeric value,
+    raises `SchemaError`, as does an empty phase or one with control
+    characters (one bad line would fail the whole merged write). Non-finite
+    field values are dropped, as the `Point` path did. If given,
+    `observe(phase, epoch_ns, values)` is called for every sample whose
+    fields are all finite, with `values` in `POWER_FIELDS` order.
+    """
+    if not samples:
+        return []
+    missing = [k for k in ("phase",) + POWER_FIELDS if k not in samples[0]]
+    if missing:
+        raise SchemaError(f"Missing required field: '{missing[0]}'")
+
+    if default_ns is None:
+        default_ns = now_ns()
+    prefix = f"{MEASUREMENT},device_id={escape_tag(device_id)},phase="
+    phase_tags = {}
+    isfinite = math.isfinite
+    lines = []
+    append = lines.append
+
+    try:
+        for p in samples:
+            phase = p["phase"]
+            tag = phase_tags.get(phase)
+            if tag is None:
+                tag = phase_tags[phase] = prefix + phase_tag(phase)
+            values = tuple([float(p[k]) for k in POWER_FIELDS])
+            ts = to_epoch_ns(p.get("time"), default_ns)
+            if all(map(isfinite, values)):
+                append(f"{tag} {_FIELD_TEMPLATE % values} {ts}")
+                if observe is not None:
+                    observe(phase, ts, values)
+            else:
+                fields = _finite_fields(values)
+                if fields:
+                    append(f"{tag} {fields} {ts}")
+    except KeyError as e:
+        raise SchemaError(f"Missing required field: {e}") from None
+    except SchemaError:
+        raise
+    except (TypeError, ValueError) as e:
+        raise SchemaError(f"Invalid field value: {e}") from None
+    return lines
+
+
+def encode_power_columns(
+    phases: bytes,
+    times,
+    columns: list,
+    device_id: str,
+    default_ns: int = None,
+    float32: bool = False,
+    observe=None,
+) -> list:
+    """Encode column-oriented `power_data` samples without per-sample dicts.
+
+    `phases` holds one ASCII phase code per sample, `times` the epoch-ns
+    timestamps (0 means "use `default_ns`") and `columns` one sequence of
+    floats per entry of `POWER_FIELDS`, all of equal length. `observe` is
+    called as in `encode_power_lines`.
+    """
+    if len(columns) != len(POWER_FIELDS):
+        raise SchemaError(f"Expected {len(POWER_FIELDS)} field columns")
+    if default_ns is None:
+        default_ns = now_ns()
+    prefix = f"{MEASUREMENT},device_id={escape_tag(device_id)},phase="
+    template = _FIELD_TEMPLATE_F32 if float32 else _FIELD_TEMPLATE
+    value_format = "%.7g" if float32 else "%r"
+    phase_tags = {code: prefix + phase_tag(chr(code)) for code in set(phases)}
+    isfinite = math.isfinite
+    lines = []
+    append = lines.append
+
+    for code, ts, values in zip(phases, times, zip(*columns)):
+        ts = ts or default_ns
+        if all(map(isfinite, values)):
+            append(f"{phase_tags[code]} {template % values} {ts}")
+            if observe is not None:
+                observe(chr(code), ts, values)
+        else:
+            fields = _finite_fields(values, value_format)
+            if fields:
+                append(f"{phase_tags[code]} {fields} {ts}")
+    return lines
+
+
+def join_lines(lines: list) -> bytes:
+    """Join encoded lines into a single write payload."""
+    return "\n".join(lines).encode()
@@ -0,0 +1,133 @@
+"""Fan-out of new readings and relay status to subscribed app clients."""
+
+import asyncio
+import time
+
+from analytics.three_phase import live_metrics
+from config import settings
+from utils.device_router import device_router
+from utils.last_values import ns_to_datetime
+from utils.line_protocol import POWER_FIELDS
+from utils.metrics import Gauge, registry
+
+
+class Subscriber:
+    """One app connection; updates are merged until its sender gets to them.
+
+    `offer()` never awaits, so a slow phone only delays its own updates: while
+    a send is in flight (or the rate limit holds it back) newer readings
+    replace older ones per phase instead of queueing up.
+    """
+
+    def __init__(self, send, min_interval: float):
+        self.send = send
+        self.min_interval = min_interval
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.coalesced = 0
+
+    def offer(self, update: dict):
+        if self.pending:
+            self.coalesced += 1
+        for key, value in update.items():
+            if key == "values":
+                self.pending.setdefault("values", {}).update(value)
+            else:
+                self.pending[key] = value
+        self.ready.set()
+
+    async def run(self, device_id: str):
+        """Send merged updates, at most one per `min_interval` seconds."""
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            update, self.pending = self.pending, {}
+            started = time.monotonic()
+            await self.send({"type": "update", "device_id": device_id, **update})
+            delay = self.min_interval - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+class LiveHub:
+    """Per-device subscriber sets fed by ingestion and the RPi socket handler.
+
+    With the unix device router, updates are also published through the
+    broker, so subscribers on other workers receive them too.
+    """
+
+    def __init__(self, router, min_interval: float):
+        self.router = router
+        self.min_interval = min_interval
+        self._subscribers = {}  # device_id -> {Subscriber, ...}
+        router.on_publish = self._deliver
+
+    def subscribe(self, device_id: str, send) -> Subscriber:
+        subscriber = Subscriber(send, self.min_interval)
+        subscribers = self._subscribers.setdefault(device_id, set())
+        if not subscribers:
+            self.router.subscribe(device_id)
+        subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, device_id: str, subscriber: Subscriber):
+        subscribers = self._subscribers.get(device_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[device_id]
+            self.router.unsubscribe(device_id)
+
+    def wanted(self, device_id: str) -> bool:
+        """Whether anyone, here or on another worker, may want this device's updates."""
+        return device_id in self._subscribers or self.router.fans_out
+
+    def publish(self, device_id: str, update: dict):
+        self._deliver(device_id, update)
+        self.router.publish(device_id, update)
+
+    def _deliver(self, device_id: str, update: dict):
+        for subscriber in self._subscribers.get(device_id, ()):
+            subscriber.offer(update)
+
+    def publish_values(self, device_id: str, latest: dict):
+        """Publish `{phase: (epoch_ns, values)}` as reported by the encoders."""
+        if not latest or not self.wanted(device_id):
+            return
+        values = {
+            phase: {
+                "timestamp": ns_to_datetime(ts).isoformat(),
+                **dict(zip(POWER_FIELDS, sample)),
+            }
+            for phase, (ts, sample) in latest.items()
+        }
+        update = {"values": values}
+        three_phase = live_metrics(values)
+        if three_phase:
+            update["three_phase"] = three_phase
+        self.publish(device_id, update)
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+        }
+
+
+live_hub = LiveHub(device_router, settings.live_min_interval)
+
+registry.add(
+    Gauge(
+        "edl_live_subscribers",
+        "App clients subscribed to /ws/live on this worker.",
+        lambda: live_hub.stats()["subscribers"],
+    )
+)
+registry.add(
+    Gauge(
+        "edl_commands_pending",
+        "Relay commands awaiting an RPi reply.",
+        lambda: len(device_router.commands),
+    )
+)
@@ -0,0 +1,219 @@
+"""In-process metrics rendered in the Prometheus text format at `/metrics`.
+
+Histograms and counters are plain dicts updated inline (a bisect and a few
+additions per observation), so they can stay on in production. Gauges are
+read from the existing `stats()` methods only when `/metrics` is scraped.
+"""
+
+import sys
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+SIZE_BUCKETS = (1, 10, 100, 1000, 5000, 10_000, 50_000, 100_000, 1_000_000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}  # label values -> total
+
+    def inc(self, labels=(), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per combination of labels."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf, sum]
+
+    def observe(self, value: float, labels=()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ("le",)
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                total += count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {total}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {total}"
+
+
+class Gauge:
+    """Value(s) computed at scrape time by `collect()`.
+
+    `collect` returns a number, or a dict of label values to numbers.
+    """
+
+    def __init__(self, name: str, help: str, collect, labelnames=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = labelnames
+        self.kind = kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {float(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.add(
+    Histogram(
+        "edl_http_request_duration_seconds",
+        "HTTP request latency by route template.",
+        ("method", "route", "status"),
+    )
+)
+influx_seconds = registry.add(
+    Histogram(
+        "edl_influxdb_duration_seconds",
+        "Time spent in InfluxDB calls, excluding the wait for a slot.",
+        ("op", "site"),
+    )
+)
+influx_wait_seconds = registry.add(
+    Histogram(
+        "edl_influxdb_slot_wait_seconds",
+        "Time InfluxDB calls waited for a query or write slot.",
+        ("op",),
+    )
+)
+influx_rows = registry.add(
+    Histogram(
+        "edl_influxdb_rows",
+        "Records returned per query or points sent per write.",
+        ("op", "site"),
+        SIZE_BUCKETS,
+    )
+)
+influx_errors = registry.add(
+    Counter(
+        "edl_influxdb_errors_total",
+        "InfluxDB calls that raised.",
+        ("op", "site"),
+    )
+)
+influx_coalesced = registry.add(
+    Counter(
+        "edl_influxdb_coalesced_total",
+        "Queries answered by an identical query already in flight.",
+        ("op", "site"),
+    )
+)
+
+_sites = {}  # code object -> label
+
+
+def call_site(depth: int = 2) -> str:
+    """`module:function` of the caller's caller, e.g. `api.routes:query_data.load`."""
+    try:
+        frame = sys._getframe(depth)
+    except ValueError:
+        return "unknown"
+    code = frame.f_code
+    site = _sites.get(code)
+    if site is None:
+        name = getattr(code, "co_qualname", code.co_name).replace("<locals>.", "")
+        site = _sites[code] = f"{frame.f_globals.get('__name__', '?')}:{name}"
+    return site
+
+
+def record_count(record) -> int:
+    """Points in anything `write_api.write` accepts."""
+    if isinstance(record, (bytes, str)):
+        return record.count(b"\n" if isinstance(record, bytes) else "\n") + 1
+    if isinstance(record, (list, tuple)):
+        return len(record)
+    return 1
+
+
+class HTTPMetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template.
+
+    The template (`/api/query-data/`, not the raw path) keeps the label set
+    bounded; requests that match no route are labelled `unmatched`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                (
+                    scope["method"],
+                    getattr(route, "path", "unmatched"),
+                    status,
+                ),
+            )
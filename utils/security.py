@@ -1,3 +1,6 @@
+import time
+from collections import OrderedDict
+
 import jwt
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
@@ -18,22 +21,84 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 3600
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+FLEET_SCOPE = "fleet"
+FLEET_USERS = {name.strip() for name in settings.fleet_users.split(",") if name.strip()}
+
+
 def create_access_token(device_id: str, username: str) -> str:
-    """Generate a JWT token with expiration"""
+    """Generate a JWT token with expiration
+
+    Users listed in `FLEET_USERS` get the `fleet` scope, which grants every device.
+    """
 
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {"uname": username, "device_id": device_id, "exp": expire}
+    if username in FLEET_USERS:
+        payload["scope"] = FLEET_SCOPE
 
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
 
-def verify_token(token: str = Depends(oauth2_scheme)) -> dict:
-    """Verify JWT token and return decoded payload"""
+def decode_token(token: str) -> dict:
+    """Decode and verify a JWT, raising 401 if it is invalid or expired"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload  # Contains device_id & uname
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+
+class TokenCache:
+    """Bounded LRU of already-verified tokens and their payloads.
+
+    An entry is only served until the token's own `exp`, so a cached token
+    expires exactly when decoding it would start failing.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._tokens = OrderedDict()  # token -> (exp timestamp, payload)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        entry = self._tokens.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.time():
+            del self._tokens[token]
+            self.misses += 1
+            return None
+        self._tokens.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, token: str, payload: dict):
+        exp = payload.get("exp")
+        if self.max_size <= 0 or exp is None:
+            return
+        self._tokens[token] = (exp, payload)
+        self._tokens.move_to_end(token)
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+
+    def clear(self):
+        self._tokens.clear()
+
+
+token_cache = TokenCache(settings.token_cache_size)
+
+
+async def verify_token(token: str = Depends(oauth2_scheme)) -> dict:
+    """Verify JWT token and return decoded payload
+
+    Async so FastAPI runs it on the event loop rather than the threadpool.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_token(token)  # Contains device_id & uname
+        token_cache.put(token, payload)
+    return payload
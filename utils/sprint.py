@@ -1,18 +1,96 @@
-"""Simple Module that prints onto the console"""
+"""Logging for the whole server, behind the original `Logger` print API.
 
+Calls only enqueue a record; a `QueueListener` thread formats and writes it,
+so logging never blocks the event loop on stdout. Messages are joined only if
+their level is enabled, so a disabled `dprint` costs one attribute check.
+"""
 
-class Logger:
-    """Class that prints different types of messages to the console"""
+import atexit
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from config import settings
+from utils.metrics import Gauge, registry
+
+TEST = logging.INFO + 1
+logging.addLevelName(TEST, "TEST")
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Enqueues records without formatting them and drops them when full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only merge the message; time, colour and JSON are the listener's job.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
+
+class _TextFormatter(logging.Formatter):
     GREEN = "\033[32m"
     RED = "\033[31m"
     RESET = "\033[0m"
     YELLOW = "\033[33m"
 
-    INFO_PREFIX = f"{GREEN}[INFO]:  {RESET}"
-    ERROR_PREFIX = f"{RED}[ERROR]:  {RESET}"
-    TEST_PREFIX = f"{GREEN}[TEST]:  {RESET}"
-    DEBUG_PREFIX = f"{YELLOW}[DEBUG]: {RESET}"
+    PREFIXES = {
+        logging.DEBUG: f"{YELLOW}[DEBUG]: {RESET}",
+        logging.INFO: f"{GREEN}[INFO]:  {RESET}",
+        TEST: f"{GREEN}[TEST]:  {RESET}",
+        logging.WARNING: f"{YELLOW}[WARN]:  {RESET}",
+        logging.ERROR: f"{RED}[ERROR]:  {RESET}",
+    }
+
+    def format(self, record):
+        fields = getattr(record, "fields", None)
+        text = record.msg
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        prefix = self.PREFIXES.get(record.levelno, f"[{record.levelname}]: ")
+        return f"{self.formatTime(record)} {prefix} {text}"
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname.lower(),
+            "msg": record.msg,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class Logger:
+    """Leveled logger used by every module as `l = Logger.get_instance(True)`.
+
+    The level comes from `LOG_LEVEL`; the `debug` argument is kept for the
+    existing call sites but no longer turns debug output on by itself.
+    Keyword arguments are attached as structured fields (`key=value` in text,
+    keys in JSON). `sampled=True` logs one in `LOG_SAMPLE_EVERY` calls from
+    the same line, for per-message logs.
+    """
 
     _instance = None
 
@@ -22,34 +100,102 @@ class Logger:
             raise RuntimeError(
                 "Use Logger.get_instance() to get the singleton instance"
             )
-        self.debug = debug
+        self.logger = logging.getLogger("edl")
+        self.logger.propagate = False
+        self.logger.setLevel(settings.log_level.upper())
+        self.handler = _DroppingQueueHandler(queue.Queue(settings.log_queue_size))
+        self.logger.addHandler(self.handler)
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(
+            _JSONFormatter() if settings.log_format == "json" else _TextFormatter()
+        )
+        self.listener = QueueListener(self.handler.queue, output)
+        self.listener.start()
+        atexit.register(self.stop)
+
+        self.sample_every = max(settings.log_sample_every, 1)
+        self._samples = {}  # (code, line) -> calls so far
+        self._refresh()
         Logger._instance = self  # Set the singleton instance
 
     @staticmethod
     def get_instance(debug=False):
-        """Returns the singleton instance of Logger. Allows setting debug mode if not already initialized."""
+        """Returns the singleton instance of Logger."""
         if Logger._instance is None:
             Logger._instance = Logger(debug)
-        else:
-            Logger._instance.debug = debug  # Update debug mode if re-requested
         return Logger._instance
 
-    @staticmethod
-    def tprint(*messages):
-        """Prints a test message. Accepts multiple messages."""
-        print(Logger.TEST_PREFIX, " ".join(map(str, messages)))
+    def set_level(self, level):
+        self.logger.setLevel(level)
+        self._refresh()
 
-    @staticmethod
-    def iprint(*messages):
-        """Prints an info message. Accepts multiple messages."""
-        print(Logger.INFO_PREFIX, " ".join(map(str, messages)))
+    def _refresh(self):
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+        self._info = self.logger.isEnabledFor(logging.INFO)
+        self._error = self.logger.isEnabledFor(logging.ERROR)
 
-    @staticmethod
-    def eprint(*messages):
-        """Prints an error message. Accepts multiple messages."""
-        print(Logger.ERROR_PREFIX, " ".join(map(str, messages)))
+    def stop(self):
+        """Write out everything still queued; safe to call more than once."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
 
-    def dprint(self, *messages):
-        """Prints a debug message only if debug mode is enabled. Accepts multiple messages."""
+    def _skip(self) -> bool:
+        """Count a sampled call; True unless it is the first of its group."""
+        frame = sys._getframe(3)  # past _log and the print method
+        key = (frame.f_code, frame.f_lineno)
+        count = self._samples.get(key, 0)
+        self._samples[key] = count + 1
+        return count % self.sample_every != 0
+
+    def _log(self, level, messages, fields, sampled):
+        if sampled and self.sample_every > 1:
+            if self._skip():
+                return
+            fields["sampled"] = f"1/{self.sample_every}"
+        # makeRecord + handle skips the caller lookup of `Logger.log`.
+        record = self.logger.makeRecord(
+            self.logger.name,
+            level,
+            "",
+            0,
+            " ".join(map(str, messages)),
+            None,
+            None,
+            extra={"fields": fields} if fields else None,
+        )
+        self.logger.handle(record)
+
+    def tprint(self, *messages, **fields):
+        """Logs a test message. Accepts multiple messages."""
+        if self._info:
+            self._log(TEST, messages, fields, False)
+
+    def iprint(self, *messages, sampled=False, **fields):
+        """Logs an info message. Accepts multiple messages."""
+        if self._info:
+            self._log(logging.INFO, messages, fields, sampled)
+
+    def eprint(self, *messages, sampled=False, **fields):
+        """Logs an error message. Accepts multiple messages."""
+        if self._error:
+            self._log(logging.ERROR, messages, fields, sampled)
+
+    def dprint(self, *messages, sampled=False, **fields):
+        """Logs a debug message if `LOG_LEVEL` is DEBUG. Accepts multiple messages."""
         if self.debug:
-            print(Logger.DEBUG_PREFIX, " ".join(map(str, messages)))
+            self._log(logging.DEBUG, messages, fields, sampled)
+
+
+registry.add(
+    Gauge(
+        "edl_log_records_dropped_total",
+        "Log records dropped because the writer thread fell behind.",
+        lambda: Logger.get_instance().dropped,
+        kind="counter",
+    )
+)
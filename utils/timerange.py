@@ -0,0 +1,52 @@
+"""IST calendar days and the Flux `range()` clauses built from them."""
+
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+INDIA_TZ = ZoneInfo("Asia/Kolkata")
+
+IST_OFFSET_NS = 19_800 * 10**9  # Asia/Kolkata is UTC+05:30 all year
+DAY_NS = 86_400 * 10**9
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def ist_day(ts_ns: int) -> int:
+    """IST calendar day of an epoch-ns timestamp, as days since 1970-01-01."""
+    return (ts_ns + IST_OFFSET_NS) // DAY_NS
+
+
+def day_number(target_date: date) -> int:
+    return (target_date - EPOCH_DATE).days
+
+
+def day_date(day: int) -> date:
+    return EPOCH_DATE + timedelta(days=day)
+
+
+def today_number() -> int:
+    return day_number(datetime.now(INDIA_TZ).date())
+
+
+def day_bounds(target_date: date):
+    """UTC start and end of an IST calendar day."""
+    start = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=INDIA_TZ)
+    end = start + timedelta(days=1)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def day_range(target_date: date) -> str:
+    """`range(start: ..., stop: ...)` covering one IST calendar day."""
+    start, end = day_bounds(target_date)
+    return f"range(start: {start.isoformat()}, stop: {end.isoformat()})"
+
+
+def history_range(target_date: date = None, range_hours: int = None):
+    """Range clause and its length in seconds for the history routes.
+
+    A `target_date` selects that IST day, otherwise the last `range_hours`
+    (24 when not given).
+    """
+    if target_date is not None:
+        return day_range(target_date), 86400
+    hours = range_hours or 24
+    return f"range(start: -{hours}h)", hours * 3600